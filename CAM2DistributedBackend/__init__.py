@@ -12,9 +12,9 @@ import click
 @click.argument('username')
 @click.argument('submission_id')
 @click.argument('request_file')
-@click.argument('analyzer_file')
+@click.argument('analyzer_files', nargs=-1, required=True)
 @click.version_option(prog_name='CAM2DistributedBackend')
-def cli(master_url, namenode_url, username, submission_id, request_file, analyzer_file):
+def cli(master_url, namenode_url, username, submission_id, request_file, analyzer_files):
 	'''Entry point of the back-end. Initializes '''
 	
 	# Info
@@ -23,78 +23,44 @@ def cli(master_url, namenode_url, username, submission_id, request_file, analyze
 	
 	# Setting up the request
 	from CAM2DistributedBackend.util.request import Request
-	request = Request(request_file)
+	try:
+		request = Request(request_file)
+	except ValueError as e:
+		raise click.ClickException(str(e))
 	
-	analysis_class = request.analysis_class
-	analysis_duration = request.duration
-	frames_limit = request.snapshots_to_keep
-	is_video = request.is_video
-	interval = request.interval
-	
-	def run_analyzer(camera):
-		'''The analysis function'''
+	def run_analyzers(cameras):
+		'''The analysis function of a group of cameras'''
 		
-		from CAM2DistributedBackend.camera.error import UnreachableCameraError, CorruptedFrameError
-		try:
-			# Initialize a storage client
-			from CAM2DistributedBackend.util.storage_client import StorageClient
-			storage_client = StorageClient(namenode_url, username, submission_id, camera.id)
-			
-			# Initialize the analyzer
-			import os, importlib
-			analyzer_class = getattr(importlib.import_module(os.path.splitext(os.path.basename(analyzer_file))[0]), analysis_class)
-			analyzer = analyzer_class()
-			analyzer._save = storage_client.save
-			analyzer.initialize()
-			
-			# Initialize the camera
-			from CAM2DistributedBackend.camera.camera import StreamFormat
-			if is_video:
-				stream_format = StreamFormat.MJPEG
-			else:
-				stream_format = StreamFormat.IMAGE
-			camera.open_stream(stream_format)
-			
-			# Set up initial meta-data
-			from CAM2DistributedBackend.analyzer.camera_metadata import CameraMetadata
-			camera_metadata = CameraMetadata(camera.id, camera.latitude, camera.longitude)
-			frame_sequence_num = 0
-			
-			# Analysis loop
-			import time
-			start_time = time.time()
-			from CAM2DistributedBackend.analyzer.frame_metadata import FrameMetadata
-			while time.time() - start_time < analysis_duration:
-				register_time = time.time()
-				try:
-					frame, frame_size = camera.get_frame()
-				except CorruptedFrameError:
-					# TODO Set a limit to corrupted frames number
-					continue
-				frame_timestamp = time.time()
-				frame_metadata = FrameMetadata(camera_metadata, frame_sequence_num, frame_timestamp)
-				analyzer._add_frame(frame, frame_metadata, frames_limit)
-				analyzer.on_new_frame()
-				frame_sequence_num += 1
-				time.sleep(max(0, register_time + interval - time.time()))
-			
-			# NOTE May move these statements outside the `try` block
-			# Finalize
-			camera.close_stream()
-			analyzer.finalize()
-		except UnreachableCameraError:
-			print 'Unreachable camera(id:{}): stream aborted!'.format(camera.id)
+		from CAM2DistributedBackend.util.camera_task import CameraTask, run_camera, run_camera_pipelined, run_cameras, create_analyzer, run_partition, run_camera_isolated
+		tasks = [CameraTask(camera, request, namenode_url, username, submission_id, analyzer_files) for camera in cameras]
+		if request.partition_batch:
+			analyzers = [create_analyzer(analyzer_files, analysis_class) for analysis_class in request.analysis_classes]
+			return run_partition(tasks, analyzers, request.duration, request.interval, request.fetch_threads)
+		elif len(tasks) == 1 and request.analyzer_process:
+			return [run_camera_isolated(tasks[0], request.duration, request.interval, request.pipeline_depth or 2)]
+		elif len(tasks) == 1 and request.pipeline_depth:
+			return [run_camera_pipelined(tasks[0], request.duration, request.interval, request.pipeline_depth, request.decode_threads)]
+		elif len(tasks) == 1:
+			return [run_camera(tasks[0], request.duration, request.interval)]
+		else:
+			return run_cameras(tasks, request.duration, request.interval, request.fetch_threads, request.analysis_threads)
 	
-	# Prepare the cameras
+	# Prepare the cameras, grouping `cameras_per_task` cameras in every task
 	cameras = request.cameras
+	tasks_num = -(-len(cameras) // request.cameras_per_task)
 	
 	# Initialize Spark
 	from pyspark import SparkContext, SparkConf
-	conf = SparkConf().setAppName('CAM2').setMaster(master_url).set('spark.cores.max', len(cameras))
+	conf = SparkConf().setAppName('CAM2').setMaster(master_url).set('spark.cores.max', tasks_num)
 	ctx = SparkContext(conf=conf)
-	ctx.addPyFile(analyzer_file)
+	for analyzer_file in analyzer_files:
+		ctx.addPyFile(analyzer_file)
 	ctx.setLogLevel('ALL')
 	
 	# Submit the analysis job
-	distributedCameras = ctx.parallelize(cameras, len(cameras))
-	distributedCameras.foreach(run_analyzer)
+	distributedCameras = ctx.parallelize(cameras, tasks_num)
+	summaries = distributedCameras.mapPartitions(run_analyzers).collect()
+	
+	# Report the summary of the job
+	for summary in summaries:
+		print 'Camera(id:{camera_id}): {status}, {frames} frames analyzed, {dropped_frames} frames dropped, {corrupted_frames} corrupted frames, {restarts} stream restarts, {failed_uploads} failed uploads, {dropped_uploads} dropped uploads'.format(**summary)
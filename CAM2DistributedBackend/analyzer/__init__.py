@@ -10,6 +10,8 @@ Module Listings
 ---------------
 analyzer
     Provide a base class for any submitted analysis class.
+frame_history
+    Provide a class holding the most recent frames of a camera.
 frame_metadata
     Provide a class representing the metadata of a single frame.
 camera_metadata
@@ -12,6 +12,11 @@ Analyzer
 
 """
 
+import time
+
+from CAM2DistributedBackend.analyzer.frame_history import FrameHistory
+from CAM2DistributedBackend.analyzer.metadata_history import MetadataHistory
+
 
 class Analyzer(object):
 
@@ -26,9 +31,16 @@ class Analyzer(object):
     -------
     get_frame(self, frame_index=0)
         Get a recent frame.
+    get_frames(self, ordered=True)
+        Get all the recent frames as a single stacked array.
+    get_encoded_frame(self, frame_index=0)
+        Get a recent frame without decoding it.
     get_frame_metadata(self, frame_index=0)
         Get the metadata of a recent frame.
-    save(self, file_name, result)
+    get_metadata_history(self)
+        Get the columnar history of the metadata of the recent frames.
+    save(self, file_name, result, camera_id=None, image_format=None,
+         quality=None, scale=None)
         Save results permanently to disk.
 
     """
@@ -41,42 +53,55 @@ class Analyzer(object):
 
         """
 
-        # Set all the instance attributes to None or empty lists.
+        # Set all the instance attributes to None. The frame history is
+        # created with the first frame, once its size is known. An analyzer
+        # shared by the cameras of a partition saves the results of every
+        # camera through the callback of that camera in `_saves`. The
+        # profiler, if any, measures the time spent getting frames and saving
+        # results.
         self._save = None
-        self._frames = []
-        self._frames_metadata = []
+        self._saves = None
+        self._history = None
+        self._metadata_history = None
+        self._profiler = None
 
-    def _add_frame(self, frame, frame_metadata, frames_limit):
+    def _add_frame(self, frame, frame_metadata, frames_limit,
+                   metadata_limit=None):
 
         """Add a new frame with its metadata.
 
-        This method adds a new frame to the list of most recent frames. It
-        also adds the metadata of the new frame to the list of frames
-        metadata. The method ensures that the length of the frames list does
-        not exceed `frames_limit`.
+        This method adds a new frame, with its metadata, to the history of
+        most recent frames. The history keeps at most `frames_limit` frames,
+        replacing the oldest frame with the new one once it is full. The
+        metadata is also added to the columnar metadata history, which keeps
+        the metadata of at most `metadata_limit` frames.
 
         Parameters
         ----------
-        frame : numpy.ndarray
-            The new frame to be added.
+        frame : numpy.ndarray or `EncodedFrame`
+            The new frame to be added. A compressed frame is decoded only when
+            it is requested by the `get_frame` method.
         frame_metadata : `FrameMetadata`
             The metadata of the new frame.
         frames_limit : int
             The maximum number of old frames to keep.
+        metadata_limit : int, optional
+            The maximum number of old frames whose metadata is kept in the
+            metadata history. It is at least `frames_limit`, which is also
+            its default value.
 
         """
 
-        # Add the new frame at the front of the frames list.
-        self._frames.insert(0, frame)
+        # Create the frame history and the metadata history with the first
+        # frame.
+        if self._history is None:
+            self._history = FrameHistory(frames_limit)
+            self._metadata_history = MetadataHistory(
+                max(metadata_limit or 0, frames_limit))
 
-        # Add the new frame metadata at the front of the frames metadata list.
-        self._frames_metadata.insert(0, frame_metadata)
-
-        # If the length of the frames list exceeds `frames_limit`, remove the
-        #  last element of both the frames list and the frames metadata list.
-        if len(self._frames) > frames_limit:
-            self._frames.pop()
-            self._frames_metadata.pop()
+        # Add the new frame and its metadata as the most recent ones.
+        self._history.append(frame, frame_metadata)
+        self._metadata_history.append(frame_metadata)
 
     def get_frame(self, frame_index=0):
 
@@ -101,9 +126,105 @@ class Analyzer(object):
         numpy.ndarray
             The recent frame specified by the `frame_index`.
 
+        Raises
+        ------
+        IndexError
+            If there is no frame of the given index (e.g. before the first
+            frame).
+        CorruptedFrameError
+            If the frame turns out to be corrupted when it is decoded.
+
+        Notes
+        -----
+        If more than one frame is kept, the returned frame is a view of the
+        array holding all the recent frames, and it is overwritten once the
+        frame is no longer one of the recent frames. Copy the frame to keep
+        it longer than that. Otherwise (e.g. if a single frame is kept), the
+        frame may be the decoded frame cached with the compressed frame
+        returned by `get_encoded_frame`, so modifying it in place also
+        modifies that frame when it is saved encoded again (e.g. as a PNG
+        image). Copy the frame to modify it without that.
+
         """
 
-        return self._frames[frame_index]
+        # The frame is decoded only once, when it is first requested.
+        history = self._get_history()
+        if self._profiler is None:
+            return history.get_frame(frame_index)
+        return self._profiler.call('get_frame', history.get_frame,
+                                   frame_index)
+
+    def get_frames(self, ordered=True):
+
+        """Get all the recent frames as a single stacked array.
+
+        This method gets all the recent frames stacked along a new first
+        axis, i.e. as an array of shape (frames, height, width, channels).
+        This is useful to process the recent frames over time in a single
+        vectorized operation (e.g. the median of the frames as a background
+        model).
+
+        Parameters
+        ----------
+        ordered : bool, optional
+            Whether the frames are ordered from the most recent to the
+            oldest. If it is False, the frames are in no particular order,
+            and the returned array is a view rather than a copy, which is
+            enough for operations that do not depend on the order of the
+            frames.
+
+        Returns
+        -------
+        numpy.ndarray
+            The recent frames.
+
+        Raises
+        ------
+        IndexError
+            If there is no frame yet.
+        CorruptedFrameError
+            If a frame turns out to be corrupted when it is decoded.
+
+        """
+
+        history = self._get_history()
+        if self._profiler is None:
+            return history.get_frames(ordered)
+        return self._profiler.call('get_frames', history.get_frames,
+                                   ordered)
+
+    def get_encoded_frame(self, frame_index=0):
+
+        """Get a recent frame without decoding it.
+
+        This methods gets a recent frame, as compressed by the camera, based
+        on the input `frame_index` optional parameter. This is useful to
+        inspect the size of a frame, or to save it as it is, without the cost
+        of decoding it.
+
+        Parameters
+        ----------
+        frame_index : index, optional
+            The recency index of the returned frame. It specifies how recent
+            the returned frame is. If `frame_index` = 0 (or not specified),
+            the method returns the most recent frame. If `frame_index` = i,
+            the method returns the ith most recent frame.
+
+        Returns
+        -------
+        `EncodedFrame`
+            The recent frame specified by the `frame_index`, or None if the
+            frame is not available compressed.
+
+        Raises
+        ------
+        IndexError
+            If there is no frame of the given index (e.g. before the first
+            frame).
+
+        """
+
+        return self._get_history().get_encoded_frame(frame_index)
 
     def get_frame_metadata(self, frame_index=0):
 
@@ -130,20 +251,76 @@ class Analyzer(object):
         numpy.ndarray
             The recent frame specified by the `frame_index`.
 
+        Raises
+        ------
+        IndexError
+            If there is no frame of the given index (e.g. before the first
+            frame).
+
         """
 
-        return self._frames_metadata[frame_index]
+        return self._get_history().get_frame_metadata(frame_index)
+
+    def _get_history(self):
+
+        """Get the history of the recent frames.
 
-    def save(self, file_name, result):
+        Returns
+        -------
+        `FrameHistory`
+            The history of the recent frames.
+
+        Raises
+        ------
+        IndexError
+            If there is no frame yet, since the history is created with the
+            first frame.
+
+        """
+
+        if self._history is None:
+            raise IndexError('The frame history is empty.')
+        return self._history
+
+    def get_metadata_history(self):
+
+        """Get the columnar history of the metadata of the recent frames.
+
+        This method gets the history of the metadata of the recent frames,
+        which is kept for many more frames than the frames themselves (see
+        the `metadata_to_keep` attribute of the request). The history stores
+        every attribute of the metadata in a NumPy array, so that it can be
+        queried without walking the metadata of every frame, e.g. to get the
+        frames of a time range, or the frame rate of the camera.
+
+        Returns
+        -------
+        `MetadataHistory`
+            The history of the metadata of the recent frames, or None before
+            the first frame.
+
+        """
+
+        return self._metadata_history
+
+    def save(self, file_name, result, camera_id=None, image_format=None,
+             quality=None, scale=None):
 
         """Save results permanently to disk.
 
         This method saves results permanently to disk so that they can be
         retrieved by the user later. This method currently accepts results as
-        PIL.Image.Image, numpy.ndarray. If an instance with any other type is
-        passed, the method will save the string representation of the instance.
-        This enables the method to save strings, integers, and other
-        primitive data types.
+        PIL.Image.Image, numpy.ndarray, `EncodedFrame`. If an instance with any
+        other type is passed, the method will save the string representation
+        of the instance. This enables the method to save strings, integers,
+        and other primitive data types. A JPEG `EncodedFrame` saved with a
+        '.jpg' or '.jpeg' file name is saved as it is, without encoding it
+        again. Unless the request sets `upload_workers` to 0, the results are
+        only queued here, and uploaded in the background. An image is encoded
+        with the codec, the quality, and the scale set by the request, unless
+        this call overrides them. If the image is encoded in another format
+        than the format of the extension of `file_name`, the extension is
+        replaced (e.g. 'frame.png' is saved as 'frame.webp').
 
         Parameters
         ----------
@@ -151,15 +328,51 @@ class Analyzer(object):
             The file name to be used to save the results.
         result : object
             The results to be saved. The `result` can be PIL.Image.Image,
-            numpy.ndarray. If an instance with any other type is passed,
-            the method will save the string representation of the instance.
-            This enables the method to save strings, integers, and other
-            primitive data types.
+            numpy.ndarray, `EncodedFrame`. If an instance with any other type
+            is passed, the method will save the string representation of the
+            instance. This enables the method to save strings, integers, and
+            other primitive data types.
+        camera_id : int, optional
+            The ID of the camera whose results are saved. This is required
+            by an analyzer shared by the cameras of a partition (see
+            `on_new_frames`), and ignored otherwise.
+        image_format : str, optional
+            The format of an image: 'jpeg', 'png', or 'webp'. By default, it
+            is the format set by the request, or the format of the extension
+            of `file_name` if the request does not set one.
+        quality : int, optional
+            The quality of a JPEG or WebP image from 0 to 100, or the
+            compression level of a PNG image from 0 to 9. By default, it is
+            the quality set by the request for the format.
+        scale : float, optional
+            The factor by which the width and the height of an image are
+            reduced before encoding it, in (0, 1]. By default, it is the
+            scale set by the request.
+
+        Raises
+        ------
+        ValueError
+            If the analyzer is shared by the cameras of a partition, and
+            `camera_id` is not one of them, or if an encoding setting is
+            invalid.
 
         """
 
-        # Use the callback method from the `storage_client` to save the results.
-        self._save(file_name, result)
+        # Use the callback method from the `storage_client` of the camera to
+        # save the results.
+        start_time = time.time()
+        options = dict((name, value) for name, value in (
+            ('image_format', image_format), ('quality', quality),
+            ('scale', scale)) if value is not None)
+        if self._saves is None:
+            self._save(file_name, result, **options)
+        elif camera_id in self._saves:
+            self._saves[camera_id](file_name, result, **options)
+        else:
+            raise ValueError(
+                'The camera_id of the results must be one of the cameras.')
+        if self._profiler is not None:
+            self._profiler.record('save', time.time() - start_time)
 
     def initialize(self):
 
@@ -199,6 +412,89 @@ class Analyzer(object):
         # in the subclasses as required.
         raise NotImplementedError('on_new_frame handler must be implemented.')
 
+    def on_new_batch(self, frames, frames_metadata):
+
+        """Handle the event of the arrival of a batch of new frames.
+
+        This method is the event handler of the arrival of a batch of new
+        frames. The method is invoked instead of `on_new_frame` if the
+        request sets `batch_size`, once for every batch of that many frames
+        (or fewer, if the batch waits longer than `batch_max_wait`, or at the
+        end of the analysis). This allows the frames to be analyzed over time
+        in a single vectorized operation. This method must be overridden by
+        any subclass used with batches. The frames of the batch are also
+        available through the `get_frame` method, the most recent frame of
+        the batch being the most recent frame.
+
+        Parameters
+        ----------
+        frames : numpy.ndarray
+            The frames of the batch stacked along a new first axis, i.e. an
+            array of shape (frames, height, width, channels), from the oldest
+            to the most recent.
+        frames_metadata : numpy.ndarray
+            The metadata of the frames, as a structured array of
+            `frame_metadata.METADATA_DTYPE` with the fields `sequence_num`,
+            `timestamp`, `frame_age`, and `is_duplicate`.
+
+        Raises
+        ------
+        NotImplementedError
+            If the method is not overridden in the subclass.
+
+        Notes
+        -----
+        The arrays are reused by the next batch, so they have to be copied to
+        be kept after this method returns.
+
+        """
+
+        # This code is unreachable if the method `on_new_batch` is overridden
+        # in the subclasses used with batches.
+        raise NotImplementedError('on_new_batch handler must be implemented.')
+
+    def on_new_frames(self, frames, frames_metadata):
+
+        """Handle the event of the arrival of new frames from many cameras.
+
+        This method is the event handler of the arrival of new frames from
+        the cameras of a partition. The method is invoked instead of
+        `on_new_frame` if the request sets `partition_batch`, in which case a
+        single analyzer is shared by all the cameras analyzed by the same
+        Spark task. Every interval, a frame is fetched from every camera at
+        the same time, and the frames are passed together in a single call.
+        This allows a model to process the frames of many cameras at once
+        (e.g. using `cv2.dnn.blobFromImages`) rather than once per camera.
+        This method must be overridden by any subclass used with partition
+        batches. The results of a camera are saved by passing its ID to the
+        `save` method.
+
+        Parameters
+        ----------
+        frames : list of numpy.ndarray
+            The new frames, one per camera that has a new frame. The frames
+            of different cameras may have different sizes.
+        frames_metadata : list of `FrameMetadata`
+            The metadata of the frames, in the same order. The camera of
+            every frame is given by the `camera_metadata` attribute of its
+            metadata.
+
+        Raises
+        ------
+        NotImplementedError
+            If the method is not overridden in the subclass.
+
+        Notes
+        -----
+        The frames are not kept by the analyzer, so the `get_frame` method is
+        not available to an analyzer shared by the cameras of a partition.
+
+        """
+
+        # This code is unreachable if the method `on_new_frames` is overridden
+        # in the subclasses used with partition batches.
+        raise NotImplementedError('on_new_frames handler must be implemented.')
+
     def finalize(self):
 
         """Handle the event of analysis finalization.
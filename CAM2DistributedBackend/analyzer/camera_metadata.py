@@ -38,6 +38,10 @@ class CameraMetadata(object):
 
     """
 
+    # The metadata of a camera is referenced by the metadata of every frame,
+    # so the instances have no `__dict__`.
+    __slots__ = ('camera_id', 'latitude', 'longitude')
+
     def __init__(self, camera_id, latitude, longitude):
 
         """Initialize a `CameraMetadata` instance.
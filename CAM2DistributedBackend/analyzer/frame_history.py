@@ -0,0 +1,337 @@
+"""Provide a class holding the most recent frames of a camera.
+
+This module provides the `FrameHistory` class that holds a fixed number of
+the most recent frames of a camera, with their metadata, in a ring buffer.
+Adding a frame takes constant time regardless of the size of the history,
+and the pixels of the frames are stored in a single preallocated array, so
+that keeping a long history does not allocate a new array for every frame,
+and the whole history can be used as one stacked array.
+
+Class Listings
+--------------
+FrameHistory
+    Represent a fixed-size history of the most recent frames of a camera.
+
+"""
+
+import numpy as np
+
+from CAM2DistributedBackend.camera import encoded_frame
+from CAM2DistributedBackend.camera.encoded_frame import EncodedFrame
+
+
+class FrameHistory(object):
+
+    """Represent a fixed-size history of the most recent frames of a camera.
+
+    This class represents a ring buffer of the most recent frames of a
+    camera, and their metadata. The frames are added as they are received,
+    usually compressed, and they are decoded only when they are requested.
+    A decoded frame is copied into a slot of a single array preallocated for
+    the whole history, and the returned frame is a view of that slot.
+
+    Attributes
+    ----------
+    capacity : int
+        The maximum number of frames in the history.
+    preallocate : bool
+        Whether the decoded frames are stored in a preallocated array.
+
+    Methods
+    -------
+    append(self, frame, frame_metadata)
+        Add a new frame with its metadata.
+    get_frame(self, frame_index=0)
+        Get a recent frame.
+    get_encoded_frame(self, frame_index=0)
+        Get a recent frame without decoding it.
+    get_frame_metadata(self, frame_index=0)
+        Get the metadata of a recent frame.
+    get_frames(self, ordered=True)
+        Get all the frames of the history as a single stacked array.
+
+    Notes
+    -----
+    A frame returned by the `get_frame` method is overwritten once it leaves
+    the history, so it has to be copied to be kept longer than that. A
+    history of a single frame does not preallocate an array by default, so
+    that an analyzer can keep a reference to the previous frame as it is.
+    A frame that is not copied into the preallocated array, and that has
+    been added compressed, is the decoded frame cached by the `EncodedFrame`,
+    so modifying it in place also modifies the frame saved from the
+    `EncodedFrame` when it is encoded again.
+
+    A frame of a different shape from the first decoded frame (e.g. after the
+    camera changes its resolution) is kept as it is, outside the preallocated
+    array.
+
+    """
+
+    def __init__(self, capacity, preallocate=None):
+
+        """Initialize an empty `FrameHistory` instance.
+
+        Parameters
+        ----------
+        capacity : int
+            The maximum number of frames in the history.
+        preallocate : bool, optional
+            Whether the decoded frames are stored in a preallocated array. By
+            default, an array is preallocated if the capacity is more than a
+            single frame.
+
+        """
+
+        self.capacity = capacity
+        if preallocate is None:
+            preallocate = capacity > 1
+        self.preallocate = preallocate
+
+        # Every slot holds a frame as it has been added (or None once its
+        # pixels are stored in the array), its metadata, whether its pixels
+        # are stored in the array, and the decoded frame if it does not fit
+        # in the array. The array is allocated when the first frame is
+        # decoded, since its shape is not known before that.
+        self._frames = [None] * capacity
+        self._frames_metadata = [None] * capacity
+        self._stored = [False] * capacity
+        self._images = [None] * capacity
+        self._array = None
+
+        # The slot of the next frame, and the number of frames.
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+
+        return self._count
+
+    def append(self, frame, frame_metadata):
+
+        """Add a new frame with its metadata.
+
+        The new frame replaces the oldest frame if the history is full.
+
+        Parameters
+        ----------
+        frame : numpy.ndarray or `EncodedFrame`
+            The new frame to be added. A compressed frame is decoded only when
+            it is requested.
+        frame_metadata : `FrameMetadata`
+            The metadata of the new frame.
+
+        """
+
+        slot = self._next
+        self._frames[slot] = frame
+        self._frames_metadata[slot] = frame_metadata
+        self._stored[slot] = False
+        self._images[slot] = None
+        self._next = (slot + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def get_frame(self, frame_index=0):
+
+        """Get a recent frame.
+
+        Parameters
+        ----------
+        frame_index : int, optional
+            The recency index of the frame. If `frame_index` = 0 (or not
+            specified), the method returns the most recent frame. If
+            `frame_index` = i, the method returns the ith most recent frame.
+
+        Returns
+        -------
+        numpy.ndarray
+            The recent frame specified by the `frame_index`.
+
+        Raises
+        ------
+        IndexError
+            If there is no frame of the given index.
+        CorruptedFrameError
+            If the frame turns out to be corrupted when it is decoded.
+
+        """
+
+        slot = self._get_slot(frame_index)
+        if self._stored[slot]:
+            return self._array[slot]
+        if self._images[slot] is not None:
+            return self._images[slot]
+
+        frame = self._frames[slot]
+        if not self.preallocate:
+            return _decode(frame)
+
+        # Decode the frame without caching the decoded frame in the
+        # `EncodedFrame`, since it is copied into the array.
+        if isinstance(frame, EncodedFrame) and not frame.is_decoded:
+            image = encoded_frame.decode(frame.data, flags=frame.flags)
+        else:
+            image = _decode(frame)
+
+        if self._array is None:
+            self._array = np.empty((self.capacity,) + image.shape,
+                                   image.dtype)
+        if image.shape != self._array.shape[1:] or \
+                image.dtype != self._array.dtype:
+            # Keep a frame that does not fit in the array as it is.
+            self._images[slot] = image
+            return image
+
+        # Copy the frame into its slot. A decoded frame is not needed any
+        # more, while a compressed frame is kept for `get_encoded_frame`.
+        self._array[slot] = image
+        self._stored[slot] = True
+        if not isinstance(frame, EncodedFrame):
+            self._frames[slot] = None
+        return self._array[slot]
+
+    def get_encoded_frame(self, frame_index=0):
+
+        """Get a recent frame without decoding it.
+
+        Parameters
+        ----------
+        frame_index : int, optional
+            The recency index of the frame.
+
+        Returns
+        -------
+        `EncodedFrame`
+            The recent frame specified by the `frame_index`, or None if the
+            frame is not available compressed.
+
+        Raises
+        ------
+        IndexError
+            If there is no frame of the given index.
+
+        """
+
+        frame = self._frames[self._get_slot(frame_index)]
+        if isinstance(frame, EncodedFrame):
+            return frame
+        return None
+
+    def get_frame_metadata(self, frame_index=0):
+
+        """Get the metadata of a recent frame.
+
+        Parameters
+        ----------
+        frame_index : int, optional
+            The recency index of the frame.
+
+        Returns
+        -------
+        `FrameMetadata`
+            The metadata of the recent frame specified by the `frame_index`.
+
+        Raises
+        ------
+        IndexError
+            If there is no frame of the given index.
+
+        """
+
+        return self._frames_metadata[self._get_slot(frame_index)]
+
+    def get_frames(self, ordered=True):
+
+        """Get all the frames of the history as a single stacked array.
+
+        Parameters
+        ----------
+        ordered : bool, optional
+            Whether the frames are ordered from the most recent to the
+            oldest. If it is False, the frames are in no particular order,
+            which is enough for operations over time that do not depend on
+            the order of the frames (e.g. the mean or the median of the
+            frames), and the returned array is a view of the history rather
+            than a copy.
+
+        Returns
+        -------
+        numpy.ndarray
+            The frames stacked along a new first axis.
+
+        Raises
+        ------
+        IndexError
+            If the history is empty.
+        CorruptedFrameError
+            If a frame turns out to be corrupted when it is decoded.
+        ValueError
+            If the frames do not have the same shape.
+
+        """
+
+        if not self._count:
+            raise IndexError('The frame history is empty.')
+
+        # Decode all the frames.
+        frames = [self.get_frame(i) for i in range(self._count)]
+
+        # Stack the frames that are not all stored in the array.
+        slots = [self._get_slot(i) for i in range(self._count)]
+        if not all(self._stored[slot] for slot in slots):
+            return np.stack(frames)
+
+        # The slots are filled from the start of the array, so the frames
+        # of a history that is not full are at its start.
+        if not ordered:
+            return self._array[:self._count]
+        return self._array.take(slots, axis=0)
+
+    def _get_slot(self, frame_index):
+
+        """Get the slot of a frame.
+
+        Parameters
+        ----------
+        frame_index : int
+            The recency index of the frame. A negative index counts from the
+            oldest frame.
+
+        Returns
+        -------
+        int
+            The slot of the frame.
+
+        Raises
+        ------
+        IndexError
+            If there is no frame of the given index.
+
+        """
+
+        if frame_index < 0:
+            frame_index += self._count
+        if not 0 <= frame_index < self._count:
+            raise IndexError('The frame index is out of range.')
+        return (self._next - 1 - frame_index) % self.capacity
+
+
+def _decode(frame):
+
+    """Decode a frame if it is compressed.
+
+    Parameters
+    ----------
+    frame : numpy.ndarray or `EncodedFrame`
+        The frame.
+
+    Returns
+    -------
+    numpy.ndarray
+        The decoded frame. The decoded frame is cached in the `EncodedFrame`,
+        so every frame is decoded at most once.
+
+    """
+
+    if isinstance(frame, EncodedFrame):
+        return frame.image
+    return frame
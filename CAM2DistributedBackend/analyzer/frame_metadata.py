@@ -10,10 +10,32 @@ Class Listings
 FrameMetadata
     Represent the metadata of a single frame captured by a camera.
 
+Constant Listings
+-----------------
+METADATA_DTYPE
+    The data type of the arrays holding the metadata of many frames.
+
 """
 
 import datetime
 
+import numpy as np
+
+# The data type of the arrays holding the metadata of many frames (e.g. the
+# frames of a batch), with a field for every attribute of `FrameMetadata`
+# except the camera metadata. A missing frame age, fetch latency, scheduled
+# time, or lateness is NaN, and a missing frame size is 0.
+METADATA_DTYPE = np.dtype([
+    ('sequence_num', np.int64),
+    ('timestamp', np.float64),
+    ('frame_age', np.float64),
+    ('is_duplicate', np.bool_),
+    ('frame_size', np.int64),
+    ('fetch_latency', np.float64),
+    ('scheduled_time', np.float64),
+    ('lateness', np.float64),
+])
+
 
 class FrameMetadata(object):
 
@@ -40,17 +62,49 @@ class FrameMetadata(object):
         has been invoked 31 times.
     timestamp : float
         The timestamp of the frame since the epoch in seconds.
+    frame_age : float
+        The time in seconds between receiving the frame from the camera and
+        sending it to the analysis program. This is None if the frame is
+        downloaded only when requested.
+    is_duplicate : bool
+        Whether the frame is identical to the frame before it, e.g. because
+        the camera has not refreshed its image since then.
+    frame_size : int
+        The size of the frame as downloaded from the camera in bytes. This is
+        None if the size is not known.
+    fetch_latency : float
+        The time in seconds taken to fetch the frame from the camera stream.
+        This is None if the latency is not known.
+    scheduled_time : float
+        The time since the epoch at which the frame has been scheduled to be
+        fetched in seconds. This is None if the frame has not been scheduled.
+    lateness : float
+        The time in seconds by which fetching the frame started after its
+        scheduled time, e.g. because the frames before it took longer than
+        the interval. This is None if the frame has not been scheduled.
     datetime : datetime.datetime
         The date/time of the frame.
 
     Methods
     -------
-    __init__(self, camera_metadata, sequence_num, timestamp):
+    __init__(self, camera_metadata, sequence_num, timestamp, frame_age=None,
+             is_duplicate=False, frame_size=None, fetch_latency=None,
+             scheduled_time=None, lateness=None):
         Initialize a `FrameMetadata` instance.
+    to_record(self)
+        Convert the metadata to a record of `METADATA_DTYPE`.
 
     """
 
-    def __init__(self, camera_metadata, sequence_num, timestamp):
+    # A metadata instance is created for every frame, so the instances have
+    # no `__dict__`.
+    __slots__ = ('camera_metadata', 'sequence_num', 'timestamp', 'frame_age',
+                 'is_duplicate', 'frame_size', 'fetch_latency',
+                 'scheduled_time', 'lateness', '_datetime')
+
+    def __init__(self, camera_metadata, sequence_num, timestamp,
+                 frame_age=None, is_duplicate=False, frame_size=None,
+                 fetch_latency=None, scheduled_time=None, lateness=None):
 
         """Initialize a `FrameMetadata` instance.
 
@@ -73,20 +127,45 @@ class FrameMetadata(object):
             has been invoked 31 times.
         timestamp : float
             The timestamp of the frame since the epoch in seconds.
+        frame_age : float, optional
+            The time in seconds between receiving the frame from the camera
+            and sending it to the analysis program.
+        is_duplicate : bool, optional
+            Whether the frame is identical to the frame before it.
+        frame_size : int, optional
+            The size of the frame as downloaded from the camera in bytes.
+        fetch_latency : float, optional
+            The time in seconds taken to fetch the frame from the camera
+            stream.
+        scheduled_time : float, optional
+            The time since the epoch at which the frame has been scheduled to
+            be fetched in seconds.
+        lateness : float, optional
+            The time in seconds by which fetching the frame started after its
+            scheduled time.
 
         """
 
-        # Set the instance attributes.
+        # Set the instance attributes. The date/time is computed only when it
+        # is first requested.
         self.camera_metadata = camera_metadata
         self.sequence_num = sequence_num
         self.timestamp = timestamp
+        self.frame_age = frame_age
+        self.is_duplicate = is_duplicate
+        self.frame_size = frame_size
+        self.fetch_latency = fetch_latency
+        self.scheduled_time = scheduled_time
+        self.lateness = lateness
+        self._datetime = None
 
     @property
     def datetime(self):
 
         """Get the date/time of the frame.
 
-        This property gets the date/time in which the frame is captured.
+        This property gets the date/time in which the frame is captured. The
+        date/time is computed once, when it is first requested.
 
         Returns
         -------
@@ -95,5 +174,27 @@ class FrameMetadata(object):
 
         """
 
-        # Convert the `timestamp` instance attribute to datetime.
-        return datetime.datetime.fromtimestamp(self.timestamp)
\ No newline at end of file
+        # Convert the `timestamp` instance attribute to datetime, and cache
+        # it.
+        if self._datetime is None:
+            self._datetime = datetime.datetime.fromtimestamp(self.timestamp)
+        return self._datetime
+
+    def to_record(self):
+
+        """Convert the metadata to a record of `METADATA_DTYPE`.
+
+        Returns
+        -------
+        tuple
+            The fields of the record, which can be assigned to an element of
+            an array of `METADATA_DTYPE`.
+
+        """
+
+        return (self.sequence_num, self.timestamp,
+                np.nan if self.frame_age is None else self.frame_age,
+                self.is_duplicate, self.frame_size or 0,
+                np.nan if self.fetch_latency is None else self.fetch_latency,
+                np.nan if self.scheduled_time is None else self.scheduled_time,
+                np.nan if self.lateness is None else self.lateness)
@@ -0,0 +1,158 @@
+"""Provide a class holding the metadata of the recent frames of a camera.
+
+This module provides the `MetadataHistory` class that holds the metadata of a
+fixed number of the most recent frames of a camera in a single structured
+array, one column per attribute. The history is usually much longer than the
+history of the frames themselves, since the metadata of a frame takes a few
+bytes, and it can be queried with NumPy operations (e.g. the frames of a time
+range, or the frame rate of the camera) without walking a list of objects.
+
+Class Listings
+--------------
+MetadataHistory
+    Represent a fixed-size columnar history of frame metadata.
+
+"""
+
+import numpy as np
+
+from CAM2DistributedBackend.analyzer.frame_metadata import METADATA_DTYPE
+
+
+class MetadataHistory(object):
+
+    """Represent a fixed-size columnar history of frame metadata.
+
+    This class represents a ring buffer of the metadata of the most recent
+    frames of a camera, stored in a preallocated structured array of
+    `METADATA_DTYPE`, with the fields `sequence_num`, `timestamp`,
+    `frame_age`, `is_duplicate`, `frame_size`, `fetch_latency`,
+    `scheduled_time`, and `lateness`.
+
+    Attributes
+    ----------
+    capacity : int
+        The maximum number of frames in the history.
+
+    Methods
+    -------
+    append(self, frame_metadata)
+        Add the metadata of a new frame.
+    get_array(self)
+        Get the metadata of all the frames of the history.
+    get_range(self, start_time, end_time=None)
+        Get the metadata of the frames of a time range.
+    get_rate(self, period=None)
+        Get the rate of the frames.
+
+    """
+
+    def __init__(self, capacity):
+
+        """Initialize an empty `MetadataHistory` instance.
+
+        Parameters
+        ----------
+        capacity : int
+            The maximum number of frames in the history.
+
+        """
+
+        self.capacity = capacity
+
+        # The slot of the next frame, and the number of frames.
+        self._array = np.zeros(capacity, METADATA_DTYPE)
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+
+        return self._count
+
+    def append(self, frame_metadata):
+
+        """Add the metadata of a new frame.
+
+        The new metadata replaces the oldest metadata if the history is full.
+
+        Parameters
+        ----------
+        frame_metadata : `FrameMetadata`
+            The metadata of the new frame.
+
+        """
+
+        self._array[self._next] = frame_metadata.to_record()
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def get_array(self):
+
+        """Get the metadata of all the frames of the history.
+
+        Returns
+        -------
+        numpy.ndarray
+            The metadata of the frames as a structured array of
+            `METADATA_DTYPE`, from the oldest to the most recent frame. The
+            array is a copy, so it can be kept as it is.
+
+        """
+
+        if self._count < self.capacity:
+            return self._array[:self._count].copy()
+        return np.roll(self._array, -self._next)
+
+    def get_range(self, start_time, end_time=None):
+
+        """Get the metadata of the frames of a time range.
+
+        Parameters
+        ----------
+        start_time : float
+            The start of the time range since the epoch in seconds.
+        end_time : float, optional
+            The end of the time range since the epoch in seconds, excluded
+            from the range. By default, the range extends to the most recent
+            frame.
+
+        Returns
+        -------
+        numpy.ndarray
+            The metadata of the frames whose timestamps are in the time range,
+            from the oldest to the most recent frame.
+
+        """
+
+        array = self.get_array()
+        timestamps = array['timestamp']
+        mask = timestamps >= start_time
+        if end_time is not None:
+            mask &= timestamps < end_time
+        return array[mask]
+
+    def get_rate(self, period=None):
+
+        """Get the rate of the frames.
+
+        Parameters
+        ----------
+        period : float, optional
+            The period, before the most recent frame, over which the rate is
+            computed in seconds. By default, the rate is computed over the
+            whole history.
+
+        Returns
+        -------
+        float
+            The number of frames per second, or 0 if there are fewer than two
+            frames in the period.
+
+        """
+
+        timestamps = self.get_array()['timestamp']
+        if period is not None and len(timestamps):
+            timestamps = timestamps[timestamps >= timestamps[-1] - period]
+        if len(timestamps) < 2 or timestamps[-1] == timestamps[0]:
+            return 0.0
+        return (len(timestamps) - 1) / float(timestamps[-1] - timestamps[0])
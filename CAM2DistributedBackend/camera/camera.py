@@ -3,8 +3,9 @@
 This module is used to deal with different types of cameras. The module
 provides the Camera base class which provides a uniform way of dealing with
 all types of cameras. The module provides different subclasses, each for a
-different type of cameras (e.g. IP cameras, and non-IP cameras). The module
-also provides the StreamFormat Enum for the different camera stream formats.
+different type of cameras (e.g. IP cameras, non-IP cameras, and cameras
+replayed from capture files). The module also provides the StreamFormat
+Enum for the different camera stream formats.
 
 Examples
 --------
@@ -54,8 +55,41 @@ while time.time() - t < 5:
     cv2.waitKey(30)
 camera.close_stream()
 
+Example 4: To get frames from an IP camera MJPEG stream through the stream
+server of the worker, sharing the connection to the camera with the other
+tasks of the worker (see the shared_stream module):
+1. Initialize an IPCamera object as in Example 3.
+2. Call the set_stream_server method with the address of the stream server.
+3. Continue as in Example 3.
+
+camera = IPCamera(1, '128.10.29.33', '/axis-cgi/jpg/image.cgi',
+                  '/axis-cgi/mjpg/video.cgi')
+camera.set_stream_server(shared_stream.get_address())
+camera.open_stream(StreamFormat.MJPEG)
+
+Example 5: To replay the frames of a capture file as fast as possible:
+1. Initialize a ReplayCamera object using the ID and the file name of the
+capture file (see the capture_file module), with realtime set to False.
+2. Open the stream by calling the open_stream method with any stream format.
+3. Use the get_frame method to get the next frame until the
+error.EndOfStreamError exception is raised.
+4. At the end, close the stream by calling the close_stream method.
+
+camera = ReplayCamera(1, 'camera.cap', realtime=False)
+camera.open_stream(StreamFormat.MJPEG)
+try:
+    while True:
+        frame, frame_size = camera.get_frame()
+        cv2.imshow('frame', frame)
+        cv2.waitKey(1)
+except error.EndOfStreamError:
+    pass
+camera.close_stream()
+
 """
+import encoded_frame
 import error
+import shared_stream
 import stream_parser
 
 
@@ -95,6 +129,22 @@ class Camera(object):
         The latitude of the camera.
     longitude : float
         The longitude of the camera.
+    resolution_width : int
+        The width of the frames in pixels. This takes into account the
+        decode mode of the camera.
+    resolution_height : int
+        The height of the frames in pixels. This takes into account the
+        decode mode of the camera.
+    decode_scale : int
+        The factor by which the width and the height of the frames are
+        reduced while decoding them.
+    decode_grayscale : bool
+        Whether the frames are decoded to grayscale.
+    decode_flags : int
+        The cv2.imdecode flags of the decode mode of the camera.
+    stream_server : str
+        The address of the stream server through which the frames are
+        fetched, or None if they are fetched directly from the camera.
     parser : StreamParser
         The parser of the camera stream.
 
@@ -116,6 +166,10 @@ class Camera(object):
         self.longitude = longitude
         self.resolution_width = resolution_width
         self.resolution_height = resolution_height
+        self.decode_scale = 1
+        self.decode_grayscale = False
+        self.decode_flags = encoded_frame.DEFAULT_DECODE_FLAGS
+        self.stream_server = None
 
         self.parser = None
 
@@ -123,7 +177,61 @@ class Camera(object):
     def resolution_mp(self):
         return self.resolution_width * self.resolution_height / 1000000.0
 
-    def open_stream(self, stream_format):
+    def set_decode_mode(self, scale=1, grayscale=False):
+        """Set the way the frames of the camera are decoded.
+
+        Decoding the frames at a reduced scale and/or in grayscale is much
+        faster than decoding them at full resolution in color and converting
+        them afterwards. The resolution of the camera is adjusted to match
+        the decoded frames.
+
+        Parameters
+        ----------
+        scale : int, optional
+            The factor by which the width and the height of the frames are
+            reduced while decoding them. This can be 1, 2, 4, or 8.
+        grayscale : bool, optional
+            Whether to decode the frames to grayscale.
+
+        Raises
+        ------
+        ValueError
+            If the value of scale is invalid.
+
+        """
+        self.decode_flags = encoded_frame.get_decode_flags(scale, grayscale)
+
+        # Adjust the resolution the same way JPEG decoders do, i.e. rounding
+        # up the reduced dimensions.
+        if self.resolution_width is not None:
+            width = self.resolution_width * self.decode_scale
+            self.resolution_width = -(-width // scale)
+        if self.resolution_height is not None:
+            height = self.resolution_height * self.decode_scale
+            self.resolution_height = -(-height // scale)
+        self.decode_scale = scale
+        self.decode_grayscale = grayscale
+
+        if self.parser is not None:
+            self.parser.decode_flags = self.decode_flags
+
+    def set_stream_server(self, address):
+        """Fetch the frames through the stream server of the worker.
+
+        The stream server keeps a single connection to the camera, shared by
+        all the tasks of the worker analyzing it (see the shared_stream
+        module). This applies to the streams opened afterwards.
+
+        Parameters
+        ----------
+        address : str
+            The address of the stream server, or None to fetch the frames
+            directly from the camera.
+
+        """
+        self.stream_server = address
+
+    def open_stream(self, stream_format, latest_frame_only=False):
         """Open the camera stream of the given format.
 
         Parameters
@@ -131,6 +239,10 @@ class Camera(object):
         stream_format : int
             The stream format of the camera. This can be any of the StreamFormat
             class variables (e.g. StreamFormat.IMAGE or StreamFormat.MJPEG)
+        latest_frame_only : bool, optional
+            Whether to drain the stream continuously on a background thread,
+            keeping only the most recent frame. This applies only to MJPEG
+            streams.
 
         Raises
         ------
@@ -156,12 +268,19 @@ class Camera(object):
         """
         self.parser.restart_stream()
 
-    def get_frame(self):
+    def get_frame(self, decode=True):
         """Get the most recent frame from the currently open camera stream.
 
+        Parameters
+        ----------
+        decode : bool, optional
+            Whether to decode the frame. If it is False, the frame is returned
+            compressed as an encoded_frame.EncodedFrame, and it is decoded
+            when its pixels are accessed.
+
         Returns
         -------
-        numpy.ndarray
+        numpy.ndarray or encoded_frame.EncodedFrame
             The downloaded frame.
         int
             The size of the downloaded frame in bytes.
@@ -178,7 +297,7 @@ class Camera(object):
         """
         if self.parser is None:
             raise error.ClosedStreamError
-        return self.parser.get_frame()
+        return self.parser.get_frame(decode)
 
 
 class IPCamera(Camera):
@@ -236,9 +355,25 @@ class IPCamera(Camera):
 
         # Initializes an ImageStreamParser so that frames can be retrieved from
         # the image stream without the need to call the open_stream method.
-        self.parser = stream_parser.ImageStreamParser(self.get_url())
+        self.parser = stream_parser.ImageStreamParser(
+            self.get_url(), self.decode_flags)
+
+    def set_stream_server(self, address):
+        """Fetch the frames through the stream server of the worker.
+
+        Parameters
+        ----------
+        address : str
+            The address of the stream server, or None to fetch the frames
+            directly from the camera.
+
+        """
+        super(IPCamera, self).set_stream_server(address)
+
+        # Reinitialize the image stream parser, closing the open stream.
+        self.close_stream()
 
-    def open_stream(self, stream_format):
+    def open_stream(self, stream_format, latest_frame_only=False):
         """Open the camera stream of the given format.
 
         Parameters
@@ -246,6 +381,10 @@ class IPCamera(Camera):
         stream_format : int
             The stream format of the camera. This can be any of the StreamFormat
             class variables (e.g. StreamFormat.IMAGE or StreamFormat.MJPEG)
+        latest_frame_only : bool, optional
+            Whether to drain the stream continuously on a background thread,
+            keeping only the most recent frame. This applies only to MJPEG
+            streams.
 
         Raises
         ------
@@ -258,9 +397,15 @@ class IPCamera(Camera):
         # Get the URL of the stream of the given format.
         url = self.get_url(stream_format)
 
-        # Initialize and open the parser according to the stream format.
+        # Initialize and open the parser according to the stream format. The
+        # stream server always keeps only the most recent frame.
         if stream_format == StreamFormat.MJPEG:
-            self.parser = stream_parser.MJPEGStreamParser(url)
+            if self.stream_server is not None:
+                self.parser = shared_stream.SharedStreamParser(
+                    self.stream_server, url, True, self.decode_flags)
+            else:
+                self.parser = stream_parser.MJPEGStreamParser(
+                    url, latest_frame_only, self.decode_flags)
             self.parser.open_stream()
         elif stream_format == StreamFormat.IMAGE:
             # The image stream parser is always initialized, and the stream
@@ -281,7 +426,8 @@ class IPCamera(Camera):
         """
         if self.parser is not None:
             self.parser.close_stream()
-            self.parser = stream_parser.ImageStreamParser(self.get_url())
+            self.parser = _get_image_parser(
+                self.get_url(), self.decode_flags, self.stream_server)
 
     def get_url(self, stream_format=StreamFormat.IMAGE):
         """Get the URL to the camera stream of the given format.
@@ -371,4 +517,139 @@ class NonIPCamera(Camera):
                                           resolution_width, resolution_height)
         self.url = url
 
-        self.parser = stream_parser.ImageStreamParser(url)
+        self.parser = stream_parser.ImageStreamParser(url, self.decode_flags)
+
+    def set_stream_server(self, address):
+        """Fetch the frames through the stream server of the worker.
+
+        Parameters
+        ----------
+        address : str
+            The address of the stream server, or None to fetch the frames
+            directly from the camera.
+
+        """
+        super(NonIPCamera, self).set_stream_server(address)
+        self.parser.close_stream()
+        self.parser = _get_image_parser(
+            self.url, self.decode_flags, self.stream_server)
+
+    def close_stream(self):
+        """Close the currently open camera stream.
+
+        This unsubscribes from the stream server if the frames are fetched
+        through it.
+
+        """
+        self.parser.close_stream()
+
+
+class ReplayCamera(Camera):
+    """Represent a camera replayed from a capture file.
+
+    This class represents a camera whose frames have been recorded into a
+    capture file (see the capture_file module). This class subclasses the
+    Camera class and inherits its attributes and extends its constructor.
+
+    Parameters
+    ----------
+    id : int
+        The unique camera ID.
+    file_name : str
+        The file name of the capture file.
+    realtime : bool, optional
+        Whether to replay the frames at the pace they have been recorded,
+        rather than as fast as they are requested.
+    loop : bool, optional
+        Whether to start over once all the frames have been replayed.
+    latitude : float, optional
+        The latitude of the camera.
+    longitude : float, optional
+        The longitude of the camera.
+
+    Attributes
+    ----------
+    file_name : str
+        The file name of the capture file.
+    realtime : bool
+        Whether the frames are replayed at the pace they have been recorded.
+    loop : bool
+        Whether the replay starts over once all the frames have been
+        replayed.
+
+    Notes
+    -----
+    The recorded frames are replayed regardless of the format of the stream
+    they have been recorded from, so the stream has to be opened using the
+    open_stream method with any stream format.
+
+    """
+
+    def __init__(self, id, file_name, realtime=True, loop=False,
+                 latitude=None, longitude=None, resolution_width=None,
+                 resolution_height=None):
+        super(ReplayCamera, self).__init__(id, latitude, longitude,
+                                           resolution_width,
+                                           resolution_height)
+        self.file_name = file_name
+        self.realtime = realtime
+        self.loop = loop
+
+    def open_stream(self, stream_format, latest_frame_only=False):
+        """Open the capture file, and start replaying it from the beginning.
+
+        Parameters
+        ----------
+        stream_format : int
+            The stream format of the camera. This is ignored.
+        latest_frame_only : bool, optional
+            This is ignored.
+
+        Raises
+        ------
+        error.UnreachableCameraError
+            If the capture file cannot be read.
+
+        """
+        self.parser = stream_parser.ReplayStreamParser(
+            self.file_name, self.realtime, self.loop, self.decode_flags)
+        self.parser.open_stream()
+
+    def set_stream_server(self, address):
+        """Do nothing, since a capture file is replayed for every task.
+
+        """
+        pass
+
+    def close_stream(self):
+        """Close the capture file.
+
+        """
+        if self.parser is not None:
+            self.parser.close_stream()
+            self.parser = None
+
+
+def _get_image_parser(url, decode_flags, stream_server):
+    """Initialize a parser of an image stream.
+
+    Parameters
+    ----------
+    url : str
+        The URL of the image stream.
+    decode_flags : int
+        The cv2.imdecode flags used to decode the frames.
+    stream_server : str
+        The address of the stream server through which the frames are
+        fetched, or None if they are fetched directly from the camera.
+
+    Returns
+    -------
+    StreamParser
+        The parser, which does not need to be opened.
+
+    """
+    if stream_server is not None:
+        return shared_stream.SharedStreamParser(
+            stream_server, url, False, decode_flags)
+    return stream_parser.ImageStreamParser(url, decode_flags)
@@ -0,0 +1,340 @@
+"""Record camera frames into capture files, and read them back.
+
+This module provides an indexed container format for the raw frames of a
+camera, as they are received from its stream, together with the time at
+which every frame is received. A capture file is written by the
+CaptureWriter class (see the record function), and read by the CaptureReader
+class, which maps the file into memory so that the frames are decoded
+straight from the mapping without being copied.
+
+A capture file consists of:
+1. A header holding the magic bytes, and the metadata of the recording as a
+JSON object (e.g. the URL of the camera).
+2. A record for every frame, holding the receive time and the size of the
+frame followed by the frame data.
+3. An index of the records followed by a trailer pointing to it. These are
+written when the recording is closed. The index of a recording that has not
+been closed (e.g. after a crash) is rebuilt by scanning the records.
+
+Examples
+--------
+Example 1: To record the MJPEG stream of a camera for a minute:
+
+parser = MJPEGStreamParser('http://128.10.29.33/axis-cgi/mjpg/video.cgi')
+parser.open_stream()
+record(parser, 'camera.cap', 60)
+parser.close_stream()
+
+Example 2: To read the frames of a capture file:
+
+reader = CaptureReader('camera.cap')
+for i in range(len(reader)):
+    frame = encoded_frame.decode(reader.get_frame_data(i))
+reader.close()
+
+"""
+import json
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+import error
+
+# The magic bytes at the start of a capture file, and before its index.
+MAGIC = b'CAM2CAP1'
+INDEX_MAGIC = b'CAM2IDX1'
+
+# The structures of the header, the header of every record, and the trailer.
+_HEADER = struct.Struct('<8sI')
+_RECORD_HEADER = struct.Struct('<dI')
+_TRAILER = struct.Struct('<QQ8s')
+
+# The index of a capture file holds the receive time, the offset of the
+# frame data, and the size of the frame data of every frame.
+INDEX_DTYPE = np.dtype([('timestamp', '<f8'), ('offset', '<u8'),
+                        ('size', '<u4')])
+
+
+class FormatError(error.Error):
+    """Represent an error when a file is not a valid capture file.
+
+    """
+    pass
+
+
+class CaptureWriter(object):
+    """Represent a writer of a capture file.
+
+    Parameters
+    ----------
+    file_name : str
+        The file name of the capture file.
+    metadata : dict, optional
+        The metadata of the recording (e.g. the URL of the camera).
+
+    Attributes
+    ----------
+    file_name : str
+        The file name of the capture file.
+    frames_count : int
+        The number of frames written so far.
+
+    Notes
+    -----
+    The capture file is complete only after the close method is called. The
+    class can be used as a context manager that closes the file at the end.
+
+    """
+
+    def __init__(self, file_name, metadata=None):
+        self.file_name = file_name
+        self.frames_count = 0
+
+        header = json.dumps(metadata or {})
+        self._file = open(file_name, 'wb')
+        self._file.write(_HEADER.pack(MAGIC, len(header)) + header)
+        self._index = []
+
+    def write(self, data, timestamp=None):
+        """Write a frame to the capture file.
+
+        Parameters
+        ----------
+        data : str
+            The raw frame data, as received from the camera.
+        timestamp : float, optional
+            The time at which the frame has been received. By default, it is
+            the current time.
+
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        self._file.write(_RECORD_HEADER.pack(timestamp, len(data)))
+        self._index.append((timestamp, self._file.tell(), len(data)))
+        self._file.write(data)
+        self.frames_count += 1
+
+    def close(self):
+        """Write the index of the capture file, and close it.
+
+        """
+        if self._file is None:
+            return
+        index_offset = self._file.tell()
+        self._file.write(np.array(self._index, INDEX_DTYPE).tostring())
+        self._file.write(
+            _TRAILER.pack(index_offset, len(self._index), INDEX_MAGIC))
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CaptureReader(object):
+    """Represent a memory-mapped reader of a capture file.
+
+    Parameters
+    ----------
+    file_name : str
+        The file name of the capture file.
+
+    Attributes
+    ----------
+    file_name : str
+        The file name of the capture file.
+    metadata : dict
+        The metadata of the recording.
+    buffer : mmap.mmap
+        The memory mapping of the capture file.
+    index : numpy.ndarray
+        The index of the frames, with the 'timestamp', 'offset', and 'size'
+        fields (see INDEX_DTYPE). The index of a complete capture file is a
+        view of the mapping.
+    duration : float
+        The time between the first and the last frame in seconds.
+
+    Raises
+    ------
+    IOError
+        If the file cannot be read.
+    FormatError
+        If the file is not a valid capture file.
+
+    Notes
+    -----
+    The frame data returned by the get_frame_data method refers to the
+    mapping, which stays valid as long as the frame data is referenced, even
+    after the close method is called.
+
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+
+        with open(file_name, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEADER.size:
+                raise FormatError('Truncated capture file.')
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, header_size = _HEADER.unpack_from(self.buffer)
+        if magic != MAGIC:
+            raise FormatError('Not a capture file.')
+        records_offset = _HEADER.size + header_size
+        try:
+            self.metadata = json.loads(
+                self.buffer[_HEADER.size:records_offset])
+        except ValueError:
+            raise FormatError('Invalid metadata.')
+
+        self.index = self._read_index(records_offset)
+        if len(self.index):
+            self.duration = float(self.index['timestamp'][-1] -
+                                  self.index['timestamp'][0])
+        else:
+            self.duration = 0.0
+
+    def __len__(self):
+        return len(self.index)
+
+    def get_frame_data(self, i):
+        """Get the data of a frame without copying it.
+
+        Parameters
+        ----------
+        i : int
+            The index of the frame.
+
+        Returns
+        -------
+        buffer
+            A read-only view of the frame data in the mapping.
+
+        """
+        return buffer(self.buffer, int(self.index['offset'][i]),
+                      int(self.index['size'][i]))
+
+    def find(self, elapsed):
+        """Find the frame received at a time since the first frame.
+
+        Parameters
+        ----------
+        elapsed : float
+            The time since the first frame was received in seconds.
+
+        Returns
+        -------
+        int
+            The index of the most recent frame received at that time.
+
+        """
+        timestamps = self.index['timestamp']
+        i = np.searchsorted(timestamps, timestamps[0] + elapsed, 'right')
+        return max(int(i) - 1, 0)
+
+    def close(self):
+        """Stop using the mapping of the capture file.
+
+        """
+        self.buffer = None
+        self.index = None
+
+    def _read_index(self, records_offset):
+        """Read the index of the capture file, or rebuild it.
+
+        Parameters
+        ----------
+        records_offset : int
+            The offset of the first record in the file.
+
+        Returns
+        -------
+        numpy.ndarray
+            The index of the frames.
+
+        """
+        size = len(self.buffer)
+        if size >= records_offset + _TRAILER.size:
+            index_offset, count, magic = _TRAILER.unpack_from(
+                self.buffer, size - _TRAILER.size)
+            if magic == INDEX_MAGIC and \
+                    index_offset + count * INDEX_DTYPE.itemsize == \
+                    size - _TRAILER.size:
+                return np.frombuffer(self.buffer, INDEX_DTYPE, count,
+                                     index_offset)
+
+        # The recording has not been closed. Rebuild the index from the
+        # records, ignoring a record that has been cut short.
+        index = []
+        position = records_offset
+        while position + _RECORD_HEADER.size <= size:
+            timestamp, frame_size = _RECORD_HEADER.unpack_from(
+                self.buffer, position)
+            position += _RECORD_HEADER.size
+            if position + frame_size > size:
+                break
+            index.append((timestamp, position, frame_size))
+            position += frame_size
+        return np.array(index, INDEX_DTYPE)
+
+
+def record(parser, file_name, duration, interval=0, metadata=None):
+    """Record the frames of a camera stream into a capture file.
+
+    Parameters
+    ----------
+    parser : stream_parser.StreamParser
+        The parser of the camera stream. The stream has to be open.
+    file_name : str
+        The file name of the capture file.
+    duration : float
+        The recording duration in seconds.
+    interval : float, optional
+        The interval between requesting every two successive frames in
+        seconds.
+    metadata : dict, optional
+        The metadata of the recording. By default, it holds the URL of the
+        stream.
+
+    Returns
+    -------
+    frames : int
+        The number of recorded frames.
+    corrupted_frames : int
+        The number of corrupted frames, which are not recorded.
+
+    Raises
+    ------
+    error.UnreachableCameraError
+        If the camera is unreachable.
+
+    Notes
+    -----
+    The frames are recorded as they are received, without decoding them.
+    Frames that are identical to the frame before them are not recorded.
+
+    """
+    if metadata is None:
+        metadata = {'url': parser.url}
+    corrupted_frames = 0
+    with CaptureWriter(file_name, metadata) as writer:
+        start_time = time.time()
+        while time.time() - start_time < duration:
+            register_time = time.time()
+            try:
+                frame, frame_size = parser.get_frame(decode=False)
+            except error.CorruptedFrameError:
+                corrupted_frames += 1
+            else:
+                if not parser.frame_unchanged:
+                    writer.write(bytes(frame.data),
+                                 time.time() - (parser.frame_age or 0))
+            time.sleep(max(register_time + interval - time.time(), 0))
+    return writer.frames_count, corrupted_frames
@@ -0,0 +1,258 @@
+"""Reuse persistent HTTP connections to the cameras.
+
+This module provides a pool of persistent (keep-alive) HTTP/1.1 connections.
+Downloading every frame of an image stream through a new connection costs a
+TCP handshake (and often a DNS lookup) per frame, which dominates the download
+time at high frame rates. The pool keeps the connections open between frames
+and shares them between all the parsers of the process.
+
+Examples
+--------
+Example 1: To download a frame through the connection pool of the process:
+
+status, headers, data = get_pool().request(
+    'http://128.10.29.33/axis-cgi/jpg/image.cgi')
+
+"""
+import httplib
+import os
+import socket
+import threading
+import time
+import urlparse
+
+# The default maximum number of connections to the same host.
+MAX_CONNECTIONS_PER_HOST = 4
+
+# The default timeout of the connections in seconds.
+# NOTE Causes problems in case of slow internet connection
+TIMEOUT = 10
+
+# The maximum number of redirections followed by a single request.
+MAX_REDIRECTIONS = 5
+
+_REDIRECTION_STATUSES = (301, 302, 303, 307, 308)
+
+
+class ConnectionPool(object):
+    """Represent a pool of persistent HTTP connections.
+
+    Parameters
+    ----------
+    max_connections_per_host : int, optional
+        The maximum number of connections to the same host. A request to a
+        host that has that many connections in use waits for one of them.
+    timeout : float, optional
+        The timeout of the connections in seconds.
+
+    Attributes
+    ----------
+    max_connections_per_host : int
+        The maximum number of connections to the same host.
+    timeout : float
+        The timeout of the connections in seconds.
+
+    Notes
+    -----
+    The pool is safe to use from multiple threads.
+
+    """
+
+    def __init__(self, max_connections_per_host=MAX_CONNECTIONS_PER_HOST,
+                 timeout=TIMEOUT):
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = timeout
+
+        # The idle connections, and the number of connections (idle or in
+        # use), of every (scheme, host, port) key.
+        self._condition = threading.Condition()
+        self._idle_connections = {}
+        self._connections_count = {}
+
+    def request(self, url, headers=None):
+        """Send a GET request through a pooled connection.
+
+        Parameters
+        ----------
+        url : str
+            The URL of the request.
+        headers : dict, optional
+            The headers of the request.
+
+        Returns
+        -------
+        status : int
+            The status code of the response.
+        headers : httplib.HTTPMessage
+            The headers of the response.
+        data : str
+            The body of the response.
+
+        Raises
+        ------
+        socket.error
+            If the host is unreachable or the request timed out.
+        httplib.HTTPException
+            If the response is malformed.
+
+        Notes
+        -----
+        Redirections are followed. If a connection that has been idle fails,
+        which is usually because the host closed it, the request is retried
+        once through a new connection.
+
+        """
+        for _ in range(MAX_REDIRECTIONS + 1):
+            status, response_headers, data = self._request_once(url, headers)
+            location = response_headers.getheader('location')
+            if status not in _REDIRECTION_STATUSES or not location:
+                break
+            url = urlparse.urljoin(url, location)
+        return status, response_headers, data
+
+    def close(self):
+        """Close all the idle connections of the pool.
+
+        """
+        with self._condition:
+            for key, connections in self._idle_connections.items():
+                for connection in connections:
+                    connection.close()
+                self._connections_count[key] -= len(connections)
+            self._idle_connections.clear()
+            self._condition.notify_all()
+
+    def _request_once(self, url, headers):
+        """Send a GET request without following redirections.
+
+        Parameters
+        ----------
+        url : str
+            The URL of the request.
+        headers : dict
+            The headers of the request.
+
+        Returns
+        -------
+        tuple
+            The status, headers, and body of the response.
+
+        """
+        parts = urlparse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = urlparse.urlunsplit(
+            ('', '', parts.path or '/', parts.query, ''))
+
+        connection, reused = self._acquire(key)
+        while True:
+            try:
+                connection.request('GET', path, headers=headers or {})
+                response = connection.getresponse()
+                data = response.read()
+            except (socket.error, httplib.HTTPException):
+                connection.close()
+                if not reused:
+                    self._release(key, None)
+                    raise
+                # The host has probably closed the idle connection. Retry
+                # through a new connection.
+                reused = False
+                continue
+            break
+
+        # Keep the connection only if the host agreed to keep it open.
+        if response.will_close:
+            connection.close()
+            connection = None
+        self._release(key, connection)
+        return response.status, response.msg, data
+
+    def _acquire(self, key):
+        """Take an idle connection to a host, or open a new one.
+
+        Parameters
+        ----------
+        key : tuple
+            The (scheme, host, port) of the connection.
+
+        Returns
+        -------
+        connection : httplib.HTTPConnection
+            The connection.
+        reused : bool
+            Whether the connection has been used before.
+
+        Raises
+        ------
+        socket.timeout
+            If all the connections to the host stay in use for too long.
+
+        """
+        with self._condition:
+            deadline = time.time() + self.timeout
+            while True:
+                idle_connections = self._idle_connections.get(key)
+                if idle_connections:
+                    return idle_connections.pop(), True
+                count = self._connections_count.get(key, 0)
+                if count < self.max_connections_per_host:
+                    self._connections_count[key] = count + 1
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise socket.timeout('No free connection to the host.')
+                self._condition.wait(remaining)
+
+        scheme, host, port = key
+        if scheme == 'https':
+            connection = httplib.HTTPSConnection(host, port,
+                                                 timeout=self.timeout)
+        else:
+            connection = httplib.HTTPConnection(host, port,
+                                                timeout=self.timeout)
+        return connection, False
+
+    def _release(self, key, connection):
+        """Return a connection to the pool.
+
+        Parameters
+        ----------
+        key : tuple
+            The (scheme, host, port) of the connection.
+        connection : httplib.HTTPConnection
+            The connection, or None if it has been closed.
+
+        """
+        with self._condition:
+            if connection is None:
+                self._connections_count[key] -= 1
+            else:
+                self._idle_connections.setdefault(key, []).append(connection)
+            self._condition.notify()
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Get the connection pool shared by all the parsers of the process.
+
+    Returns
+    -------
+    ConnectionPool
+        The connection pool of the process.
+
+    Notes
+    -----
+    A forked process gets a new pool rather than sharing the sockets of its
+    parent.
+
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ConnectionPool()
+            _pool_pid = os.getpid()
+        return _pool
@@ -0,0 +1,285 @@
+"""Represent frames that are kept compressed until they are needed.
+
+This module provides the EncodedFrame class, which holds the compressed data
+of a frame as it is downloaded from the camera, and decodes it only when its
+pixels are accessed for the first time. Frames that are never looked at (e.g.
+frames that leave the window of recent frames unused) are never decoded, and
+frames that are saved as they are can be written without encoding them again.
+The module also provides the decode function used by all the stream parsers.
+
+Examples
+--------
+Example 1: To get a frame without decoding it:
+
+frame, frame_size = camera.get_frame(decode=False)
+print frame.width, frame.height
+cv2.imshow('frame', frame.image)
+
+"""
+import struct
+
+import cv2
+import numpy as np
+
+import error
+
+# The JPEG markers used to check the frames without decoding them.
+JPEG_START = b'\xff\xd8'
+JPEG_END = b'\xff\xd9'
+
+# The number of bytes at the end of a JPEG frame searched for the end marker.
+# Some cameras append padding after the marker.
+JPEG_END_SEARCH_SIZE = 512
+
+# The JPEG start of frame markers, which hold the dimensions of the frame.
+_JPEG_START_OF_FRAME = set(range(0xc0, 0xd0)) - set([0xc4, 0xc8, 0xcc])
+
+# The default cv2.imdecode flags, which decode the frames as they are.
+DEFAULT_DECODE_FLAGS = cv2.IMREAD_UNCHANGED
+
+# The cv2.imdecode flags of every (scale, grayscale) decode mode.
+_DECODE_FLAGS = {
+    (1, False): DEFAULT_DECODE_FLAGS,
+    (2, False): cv2.IMREAD_REDUCED_COLOR_2,
+    (4, False): cv2.IMREAD_REDUCED_COLOR_4,
+    (8, False): cv2.IMREAD_REDUCED_COLOR_8,
+    (1, True): cv2.IMREAD_GRAYSCALE,
+    (2, True): cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    (4, True): cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    (8, True): cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def get_decode_flags(scale=1, grayscale=False):
+    """Get the cv2.imdecode flags of a decode mode.
+
+    Parameters
+    ----------
+    scale : int, optional
+        The factor by which the width and the height of the frames are
+        reduced while decoding them. This can be 1, 2, 4, or 8.
+    grayscale : bool, optional
+        Whether to decode the frames to grayscale.
+
+    Returns
+    -------
+    int
+        The cv2.imdecode flags.
+
+    Raises
+    ------
+    ValueError
+        If the value of scale is invalid.
+
+    Notes
+    -----
+    Reducing JPEG frames while decoding them is several times faster than
+    decoding them at full resolution, since most of the decoding work is
+    skipped, rather than done and then thrown away by resizing the frames.
+
+    """
+    try:
+        return _DECODE_FLAGS[(scale, bool(grayscale))]
+    except KeyError:
+        raise ValueError('Invalid Argument: scale')
+
+
+def decode(data, offset=0, size=-1, flags=DEFAULT_DECODE_FLAGS):
+    """Decode the compressed data of a frame.
+
+    Parameters
+    ----------
+    data : str or bytearray
+        The buffer holding the compressed frame data.
+    offset : int, optional
+        The offset of the frame data in the buffer.
+    size : int, optional
+        The size of the frame data in bytes. By default, the frame data
+        extends to the end of the buffer.
+    flags : int, optional
+        The cv2.imdecode flags (see the get_decode_flags function).
+
+    Returns
+    -------
+    numpy.ndarray
+        The decoded frame.
+
+    Raises
+    ------
+    error.CorruptedFrameError
+        If the frame is corrupted.
+
+    """
+    if size == 0 or offset >= len(data):
+        raise error.CorruptedFrameError
+
+    # Decode a view of the buffer rather than a copy of the frame data.
+    frame = cv2.imdecode(
+        np.frombuffer(data, dtype=np.uint8, count=size, offset=offset), flags)
+
+    # Handle the cameras whose URLs return 1x1 images. The method
+    # cv2.imdecode returns None if the input buffer is too short or
+    # contains invalid data.
+    if frame is None:
+        raise error.CorruptedFrameError
+
+    return frame
+
+
+class EncodedFrame(object):
+    """Represent a compressed frame that is decoded on first access.
+
+    Parameters
+    ----------
+    data : str or buffer
+        The compressed frame data. A buffer allows the frame data to stay in
+        a larger block of memory (e.g. a memory-mapped file) without copying
+        it.
+    flags : int, optional
+        The cv2.imdecode flags used to decode the frame (see the
+        get_decode_flags function).
+
+    Attributes
+    ----------
+    data : str or buffer
+        The compressed frame data.
+    flags : int
+        The cv2.imdecode flags used to decode the frame.
+    size : int
+        The size of the compressed frame data in bytes.
+    width : int
+        The width of the compressed frame in pixels, or None if it is not
+        known before decoding the frame.
+    height : int
+        The height of the compressed frame in pixels, or None if it is not
+        known before decoding the frame.
+
+    Notes
+    -----
+    The decoded frame is cached, so the frame is decoded at most once. The
+    cached numpy.ndarray is shared by all the users of the frame.
+
+    """
+
+    def __init__(self, data, flags=DEFAULT_DECODE_FLAGS):
+        self.data = data
+        self.flags = flags
+        self.size = len(data)
+        self.width = None
+        self.height = None
+
+        self._image = None
+
+    @property
+    def is_jpeg(self):
+        """Whether the frame data is a JPEG image.
+
+        """
+        return self.data[:2] == JPEG_START
+
+    @property
+    def is_decoded(self):
+        """Whether the frame has been decoded.
+
+        """
+        return self._image is not None
+
+    @property
+    def image(self):
+        """Get the decoded frame, decoding it on first access.
+
+        Returns
+        -------
+        numpy.ndarray
+            The decoded frame.
+
+        Raises
+        ------
+        error.CorruptedFrameError
+            If the frame is corrupted.
+
+        """
+        return self.decode()
+
+    def decode(self):
+        """Decode the frame unless it has already been decoded.
+
+        Returns
+        -------
+        numpy.ndarray
+            The decoded frame.
+
+        Raises
+        ------
+        error.CorruptedFrameError
+            If the frame is corrupted.
+
+        """
+        if self._image is None:
+            self._image = decode(self.data, flags=self.flags)
+        return self._image
+
+    def copy(self):
+        """Copy the frame, with its own copy of the decoded frame.
+
+        The compressed frame data is shared, since it is never modified.
+
+        Returns
+        -------
+        EncodedFrame
+            The copy of the frame.
+
+        """
+        frame = EncodedFrame(self.data, self.flags)
+        frame.width = self.width
+        frame.height = self.height
+        if self._image is not None:
+            frame._image = self._image.copy()
+        return frame
+
+    def validate(self):
+        """Check that the frame is not corrupted.
+
+        The frame is checked without decoding it if possible. JPEG frames are
+        checked for their start and end markers, and for the
+        dimensions in their headers. Frames of other formats are decoded.
+
+        Raises
+        ------
+        error.CorruptedFrameError
+            If the frame is corrupted.
+
+        """
+        if not self.is_jpeg:
+            self.decode()
+            return
+
+        # Handle the truncated frames.
+        if self.data[max(0, self.size - JPEG_END_SEARCH_SIZE):].rfind(
+                JPEG_END) < 0:
+            raise error.CorruptedFrameError
+
+        # Read the dimensions from the start of frame segment, and handle the
+        # cameras that return 1x1 images.
+        self._read_jpeg_dimensions()
+        if self.width is not None and (self.width <= 1 or self.height <= 1):
+            raise error.CorruptedFrameError
+
+    def _read_jpeg_dimensions(self):
+        """Read the dimensions of a JPEG frame from its headers.
+
+        """
+        position = 2
+        try:
+            while position + 4 <= self.size:
+                prefix, marker, length = struct.unpack_from(
+                    '>BBH', self.data, position)
+                if prefix != 0xff:
+                    return
+                if marker in _JPEG_START_OF_FRAME:
+                    self.height, self.width = struct.unpack_from(
+                        '>HH', self.data, position + 5)
+                    return
+                position += 2 + length
+        except struct.error:
+            return
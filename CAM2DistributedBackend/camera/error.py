@@ -29,3 +29,10 @@ class ClosedStreamError(Error):
 
     """
     pass
+
+
+class EndOfStreamError(Error):
+    """Represent an error when a stream has no more frames to be requested.
+
+    """
+    pass
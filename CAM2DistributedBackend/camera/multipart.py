@@ -0,0 +1,321 @@
+"""Read the parts of a multipart (e.g. MJPEG) HTTP stream.
+
+This module provides a buffered reader for multipart HTTP streams such as the
+MJPEG streams of IP cameras. The reader pulls the stream in large chunks into
+a single reusable buffer, and locates the boundary and the headers of every
+part by scanning that buffer instead of issuing a read call per line. The body
+of every part is returned as a position in the buffer, so that it can be
+decoded without copying it out first.
+
+Examples
+--------
+Example 1: To read the frames of an MJPEG stream:
+1. Open the stream, and get the boundary from its Content-Type header.
+2. Initialize a MultipartReader using the stream and the boundary.
+3. Use the next_part method to get the position of the body of every part.
+
+stream = urllib2.urlopen('http://128.10.29.33/axis-cgi/mjpg/video.cgi')
+reader = MultipartReader(stream, get_boundary(stream.info()))
+offset, size, headers = reader.next_part()
+frame = cv2.imdecode(np.frombuffer(reader.buffer, np.uint8, size, offset), -1)
+
+"""
+import error
+
+# The number of bytes requested from the stream when the size of the data
+# that follows is not known (e.g. while looking for the headers of a part).
+READ_SIZE = 4096
+
+# The initial size of the buffer in bytes. The buffer grows if a single part
+# does not fit in it.
+INITIAL_BUFFER_SIZE = 256 * 1024
+
+
+def get_boundary(headers):
+    """Get the multipart boundary from the headers of an HTTP response.
+
+    Parameters
+    ----------
+    headers : mimetools.Message
+        The headers of the HTTP response (e.g. the result of the info method
+        of the response).
+
+    Returns
+    -------
+    str
+        The boundary without the leading dashes, or None if the Content-Type
+        header does not specify a boundary.
+
+    Notes
+    -----
+    Some cameras include the leading dashes of the delimiter line in the
+    boundary parameter (e.g. boundary=--myboundary). The dashes are stripped
+    so that the boundary matches the delimiter lines in both cases.
+
+    """
+    if hasattr(headers, 'getparam'):
+        boundary = headers.getparam('boundary')
+    else:
+        boundary = headers.get_param('boundary')
+    if not boundary:
+        return None
+    return boundary.strip('"').lstrip('-') or None
+
+
+class MultipartReader(object):
+    """Represent a buffered reader for the parts of a multipart stream.
+
+    Parameters
+    ----------
+    stream : file-like object
+        The multipart stream (e.g. the response of urllib2.urlopen).
+    boundary : str, optional
+        The boundary of the stream without the leading dashes. If it is not
+        given, the boundary is taken from the first delimiter line.
+
+    Attributes
+    ----------
+    stream : file-like object
+        The multipart stream.
+    boundary : str
+        The boundary of the stream without the leading dashes.
+    buffer : bytearray
+        The buffer holding the data read from the stream. The body returned by
+        the next_part method is only valid until the next call to next_part.
+
+    """
+
+    def __init__(self, stream, boundary=None):
+        self.stream = stream
+        self.boundary = boundary
+        self.buffer = bytearray(INITIAL_BUFFER_SIZE)
+
+        # The buffered data that is not consumed yet is buffer[_start:_end].
+        self._start = 0
+        self._end = 0
+        self._readinto = getattr(stream, 'readinto', None)
+
+    def next_part(self):
+        """Read the next part of the stream.
+
+        Returns
+        -------
+        offset : int
+            The offset of the body of the part in the buffer.
+        size : int
+            The size of the body of the part in bytes.
+        headers : dict
+            The headers of the part. The header names are lowercase.
+
+        Raises
+        ------
+        error.CorruptedFrameError
+            If the part is malformed.
+        EOFError
+            If the stream ended before the part is complete.
+
+        """
+        # Skip everything before the delimiter line (e.g. the line break
+        # that ends the previous part).
+        delimiter = self._find_delimiter()
+        position = self._find(b'\n', delimiter) + 1
+
+        # Find the empty line that ends the headers. Cameras use either CRLF
+        # or bare LF line breaks.
+        while True:
+            crlf = self.buffer.find(b'\r\n\r\n', position - 2, self._end)
+            lf = self.buffer.find(b'\n\n', position - 1, self._end)
+            if crlf >= 0 and (lf < 0 or crlf < lf):
+                headers_end, body_start = crlf, crlf + 4
+                break
+            elif lf >= 0:
+                headers_end, body_start = lf, lf + 2
+                break
+            offset = self._fill(READ_SIZE)
+            position -= offset
+        headers = self._parse_headers(position, headers_end)
+
+        # Read the body using its length if the camera sends it, otherwise
+        # the body ends where the next delimiter line starts.
+        length = headers.get('content-length', '').strip()
+        if length:
+            if not length.isdigit():
+                # Skip the part, so that the next call resumes at the next
+                # delimiter line rather than parsing this part again.
+                self._start = body_start
+                raise error.CorruptedFrameError
+            size = int(length)
+            missing = body_start + size - self._end
+            if missing > 0:
+                body_start -= self._fill(missing, exact=True)
+            body_end = body_start + size
+        else:
+            self._start = body_start
+            body_end = self._find_delimiter_line(body_start)
+            body_start = self._start
+            # The line break before the delimiter line is not part of the
+            # body.
+            if body_end > body_start:
+                body_end -= 1
+                if body_end > body_start and \
+                        self.buffer[body_end - 1] == ord(b'\r'):
+                    body_end -= 1
+            size = body_end - body_start
+
+        self._start = body_end
+        return body_start, size, headers
+
+    def _find_delimiter(self):
+        """Find the next delimiter line, and discard the data before it.
+
+        Returns
+        -------
+        int
+            The position of the delimiter line in the buffer.
+
+        """
+        if self.boundary is None:
+            # Take the boundary from the first line that starts with dashes.
+            while True:
+                line_end = self._find(b'\n', self._start)
+                line = bytes(self.buffer[self._start:line_end]).strip()
+                if line.startswith(b'--') and line.lstrip(b'-'):
+                    self.boundary = line.lstrip(b'-')
+                    break
+                self._start = line_end + 1
+        self._start = self._find(b'--' + self.boundary, self._start)
+        return self._start
+
+    def _find_delimiter_line(self, position):
+        """Find the start of the next delimiter line.
+
+        Parameters
+        ----------
+        position : int
+            The position in the buffer from which the search starts.
+
+        Returns
+        -------
+        int
+            The position of the first dash of the delimiter line in the
+            buffer.
+
+        Notes
+        -----
+        The boundary only delimits a part at the start of a line, so that the
+        dashes at the end of a body, or a boundary in the middle of a line of
+        the body, are kept in the body. The delimiter line may start with more
+        than two dashes if the boundary itself starts with dashes.
+
+        """
+        delimiter = b'--' + self.boundary
+        while True:
+            index = self._find(delimiter, position)
+            line_start = index
+            while line_start > self._start and \
+                    self.buffer[line_start - 1] == ord(b'-'):
+                line_start -= 1
+            if line_start == self._start or \
+                    self.buffer[line_start - 1] == ord(b'\n'):
+                return line_start
+            position = index + 1
+
+    def _find(self, sub, position):
+        """Find a byte string in the buffered data, reading more if needed.
+
+        Parameters
+        ----------
+        sub : str
+            The byte string to be found.
+        position : int
+            The position in the buffer from which the search starts.
+
+        Returns
+        -------
+        int
+            The position of the byte string in the buffer.
+
+        """
+        while True:
+            index = self.buffer.find(sub, position, self._end)
+            if index >= 0:
+                return index
+            # Resume the search where it stopped, allowing for a byte string
+            # that is split between the old and the new data.
+            position = max(position, self._end - len(sub) + 1)
+            position -= self._fill(READ_SIZE)
+
+    def _fill(self, size, exact=False):
+        """Read data from the stream to the end of the buffered data.
+
+        Parameters
+        ----------
+        size : int
+            The number of bytes to read.
+        exact : bool, optional
+            Whether to keep reading until exactly `size` bytes are read.
+
+        Returns
+        -------
+        int
+            The number of bytes the buffered data has been moved towards the
+            start of the buffer to make room for the new data. The positions
+            held by the caller have to be decreased by this number.
+
+        Raises
+        ------
+        EOFError
+            If the stream ended.
+
+        """
+        # Move the buffered data to the start of the buffer, and grow the
+        # buffer if the data still does not fit.
+        offset = 0
+        if self._end + size > len(self.buffer):
+            offset = self._start
+            if offset:
+                remaining = self._end - self._start
+                self.buffer[:remaining] = self.buffer[self._start:self._end]
+                self._start, self._end = 0, remaining
+            if self._end + size > len(self.buffer):
+                self.buffer.extend(
+                    bytearray(max(self._end + size, 2 * len(self.buffer)) -
+                              len(self.buffer)))
+
+        while size > 0:
+            if self._readinto is not None:
+                count = self._readinto(
+                    memoryview(self.buffer)[self._end:self._end + size])
+            else:
+                data = self.stream.read(size)
+                count = len(data)
+                self.buffer[self._end:self._end + count] = data
+            if not count:
+                raise EOFError
+            self._end += count
+            size = size - count if exact else 0
+
+        return offset
+
+    def _parse_headers(self, start, end):
+        """Parse the headers of a part.
+
+        Parameters
+        ----------
+        start : int
+            The position of the first header line in the buffer.
+        end : int
+            The position of the end of the last header line in the buffer.
+
+        Returns
+        -------
+        dict
+            The headers of the part. The header names are lowercase.
+
+        """
+        headers = {}
+        for line in bytes(self.buffer[start:end]).split(b'\n'):
+            name, separator, value = line.partition(b':')
+            if separator:
+                headers[name.strip().lower()] = value.strip()
+        return headers
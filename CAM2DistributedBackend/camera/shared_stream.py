@@ -0,0 +1,976 @@
+"""Share the streams of the cameras between the tasks of a worker.
+
+This module provides a stream server that runs once on every worker, and a
+stream parser that fetches the frames of a camera through it. The server
+keeps a single upstream connection to every camera that is analyzed by any
+task of the worker, regardless of the submission the task belongs to, and
+passes its frames to every subscribed task at the pace the task requests
+them. A frame that has not been returned to a task yet is reused rather than
+fetched again if it is recent enough, and it is decoded at most once for
+every decode mode. The server counts the subscribers of every stream, and
+closes the upstream connection as soon as the last subscriber leaves.
+
+The server and the parsers communicate through a local socket using the
+multiprocessing.connection module, one connection per subscription, so the
+subscription of a task that crashes ends with its connection. The
+connections are authenticated with a random key that the server writes to a
+file next to its socket, readable only by the user running the server. A
+parser fetches the frames directly from the camera if the stream server is
+not running or stops.
+
+Examples
+--------
+Example 1: To run the stream server of a worker (this is what the
+CAM2StreamServer command does):
+
+server = StreamServer(get_address())
+server.serve_forever()
+
+Example 2: To get frames from a camera MJPEG stream through the stream
+server:
+
+parser = SharedStreamParser(
+    get_address(), 'http://128.10.29.33/axis-cgi/mjpg/video.cgi', mjpeg=True)
+parser.open_stream()
+t = time.time()
+while time.time() - t < 5:
+    frame, frame_size = parser.get_frame()
+    cv2.imshow('frame', frame)
+    cv2.waitKey(30)
+parser.close_stream()
+
+"""
+import os
+import socket
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+import encoded_frame
+import error
+import stream_parser
+
+# The default address of the stream server of a worker, which can be
+# overridden by the CAM2_STREAM_SERVER environment variable.
+DEFAULT_ADDRESS = '/tmp/cam2-stream-server.sock'
+ADDRESS_VARIABLE = 'CAM2_STREAM_SERVER'
+
+# The suffix of the path of the file holding the key authenticating the
+# connections to the stream server, appended to the path of its socket, and
+# the size of the key in bytes.
+KEY_FILE_SUFFIX = '.key'
+KEY_SIZE = 32
+
+# The default maximum age in seconds of a frame that is reused rather than
+# fetched again.
+MAX_FRAME_AGE = 1.0
+
+
+def get_address():
+    """Get the address of the stream server of the worker.
+
+    Returns
+    -------
+    str
+        The path of the socket of the stream server.
+
+    """
+    return os.environ.get(ADDRESS_VARIABLE, DEFAULT_ADDRESS)
+
+
+def read_key(address):
+    """Read the key authenticating the connections to a stream server.
+
+    Parameters
+    ----------
+    address : str
+        The path of the socket of the stream server.
+
+    Returns
+    -------
+    str
+        The key.
+
+    Raises
+    ------
+    IOError
+        If the key file of the stream server cannot be read.
+
+    """
+    with open(address + KEY_FILE_SUFFIX, 'rb') as key_file:
+        return key_file.read()
+
+
+def _write_key(address):
+    """Write a new random key authenticating the connections to a server.
+
+    The key file is readable and writable only by the user running the
+    server.
+
+    Parameters
+    ----------
+    address : str
+        The path of the socket of the stream server.
+
+    Returns
+    -------
+    str
+        The key.
+
+    """
+    key = os.urandom(KEY_SIZE)
+    key_path = address + KEY_FILE_SUFFIX
+    if os.path.exists(key_path):
+        os.remove(key_path)
+    key_file = os.fdopen(
+        os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'wb')
+    with key_file:
+        key_file.write(key)
+    return key
+
+
+def is_running(address):
+    """Check whether a stream server is listening on an address.
+
+    Parameters
+    ----------
+    address : str
+        The path of the socket of the stream server.
+
+    Returns
+    -------
+    bool
+        Whether the stream server accepts connections.
+
+    Notes
+    -----
+    This does not rely on the multiprocessing.connection module, which keeps
+    retrying to connect to a socket left behind by a stopped server.
+
+    """
+    probe = socket.socket(socket.AF_UNIX)
+    try:
+        probe.connect(address)
+    except socket.error:
+        return False
+    finally:
+        probe.close()
+    return True
+
+
+class _ServerLostError(error.UnreachableCameraError):
+    """Represent an error when the connection to the stream server fails.
+
+    """
+    pass
+
+
+class _Frame(object):
+    """Represent a frame of a shared stream.
+
+    Parameters
+    ----------
+    frame_id : int
+        The sequence number of the frame in the shared stream.
+    content_id : int
+        The sequence number of the content of the frame, which is the same
+        for successive frames that are identical.
+    frame : encoded_frame.EncodedFrame
+        The compressed frame.
+    receive_time : float
+        The time at which the frame has been received from the camera.
+    frame_timestamp : float
+        The time at which the frame has been captured, if it is known.
+
+    """
+
+    def __init__(self, frame_id, content_id, frame, receive_time,
+                 frame_timestamp):
+        self.frame_id = frame_id
+        self.content_id = content_id
+        self.frame = frame
+        self.receive_time = receive_time
+        self.frame_timestamp = frame_timestamp
+
+        # The decoded frame for every decode mode requested by a subscriber.
+        self.images = {}
+
+
+class _SharedStream(object):
+    """Represent the upstream connection to a camera shared by its subscribers.
+
+    Parameters
+    ----------
+    url : str
+        The URL of the stream.
+    mjpeg : bool
+        Whether the stream is an MJPEG stream rather than an image stream.
+    max_frame_age : float
+        The maximum age in seconds of a frame that is reused rather than
+        fetched again.
+
+    Attributes
+    ----------
+    subscribers : int
+        The number of subscribers of the stream.
+
+    """
+
+    def __init__(self, url, mjpeg, max_frame_age):
+        self.subscribers = 0
+
+        self._max_frame_age = max_frame_age
+        if mjpeg:
+            # Drain the MJPEG stream continuously, so that every subscriber
+            # gets the most recent frame at its own pace.
+            self._parser = stream_parser.MJPEGStreamParser(url, True)
+        else:
+            self._parser = stream_parser.ImageStreamParser(url)
+
+        # Whether the upstream connection is open. The open lock is held
+        # while opening the connection, so that the subscribers of a camera
+        # wait for the same connection, without blocking the subscribers of
+        # the other cameras.
+        self._open_lock = threading.Lock()
+        self._opened = False
+
+        # The most recent frame, and whether fetching it failed. The lock is
+        # held while fetching a frame, so that the subscribers requesting a
+        # frame at the same time share the same fetch.
+        self._lock = threading.Lock()
+        self._decode_lock = threading.Lock()
+        self._frame = None
+        self._frames_fetched = 0
+        self._contents_fetched = 0
+        self._failed = False
+
+    def open_stream(self):
+        """Open the upstream connection unless it is already open.
+
+        Raises
+        ------
+        error.UnreachableCameraError
+            If the camera is unreachable.
+
+        """
+        with self._open_lock:
+            if not self._opened:
+                self._parser.open_stream()
+                self._opened = True
+
+    def close_stream(self):
+        """Close the upstream connection if it is open.
+
+        """
+        with self._open_lock:
+            if self._opened:
+                self._parser.close_stream()
+                self._opened = False
+
+    def restart_stream(self):
+        """Restart the upstream connection if fetching the last frame failed.
+
+        The subscribers react to the same failure independently, so the
+        connection is restarted only once after every failure.
+
+        Raises
+        ------
+        error.UnreachableCameraError
+            If the camera is unreachable.
+
+        """
+        with self._lock:
+            if self._failed:
+                self._failed = False
+                self._parser.restart_stream()
+
+    def get_frame(self, last_frame_id):
+        """Get a frame that has not been returned to a subscriber.
+
+        Parameters
+        ----------
+        last_frame_id : int
+            The ID of the frame returned to the subscriber before, or None.
+
+        Returns
+        -------
+        _Frame
+            The most recent frame if it is recent enough and has not been
+            returned to the subscriber, or a new frame otherwise.
+
+        Raises
+        ------
+        error.CorruptedFrameError
+            If the frame is corrupted.
+        error.UnreachableCameraError
+            If the camera is unreachable.
+
+        """
+        with self._lock:
+            frame = self._frame
+            if frame is None or frame.frame_id == last_frame_id or \
+                    time.time() - frame.receive_time > self._max_frame_age:
+                frame = self._fetch_frame()
+            return frame
+
+    def decode(self, frame, flags):
+        """Decode a frame, unless it has already been decoded in this mode.
+
+        Parameters
+        ----------
+        frame : _Frame
+            The frame.
+        flags : int
+            The cv2.imdecode flags used to decode the frame.
+
+        Returns
+        -------
+        numpy.ndarray
+            The decoded frame.
+
+        Raises
+        ------
+        error.CorruptedFrameError
+            If the frame is corrupted.
+
+        """
+        with self._decode_lock:
+            image = frame.images.get(flags)
+            if image is None:
+                image = encoded_frame.decode(frame.frame.data, flags=flags)
+                frame.images[flags] = image
+            return image
+
+    def _fetch_frame(self):
+        """Fetch a new frame from the camera.
+
+        Returns
+        -------
+        _Frame
+            The new frame.
+
+        """
+        try:
+            frame, _ = self._parser.get_frame(decode=False)
+        except (error.CorruptedFrameError, error.UnreachableCameraError):
+            self._failed = True
+            raise
+        self._failed = False
+
+        if not self._parser.frame_unchanged:
+            self._contents_fetched += 1
+        self._frames_fetched += 1
+        self._frame = _Frame(
+            self._frames_fetched, self._contents_fetched, frame,
+            time.time() - (self._parser.frame_age or 0),
+            self._parser.frame_timestamp)
+        return self._frame
+
+
+class StreamServer(object):
+    """Represent the stream server of a worker.
+
+    Parameters
+    ----------
+    address : str, optional
+        The path of the socket of the server.
+    max_frame_age : float, optional
+        The maximum age in seconds of a frame that is reused rather than
+        fetched again.
+
+    Attributes
+    ----------
+    address : str
+        The path of the socket of the server.
+    max_frame_age : float
+        The maximum age in seconds of a frame that is reused rather than
+        fetched again.
+
+    Raises
+    ------
+    socket.error
+        If another server is already listening on the address.
+
+    Notes
+    -----
+    Every subscription is served on a thread of its own, and the streams are
+    shared by the URL of the stream, so the tasks of different submissions
+    analyzing the same camera share a single upstream connection.
+
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, max_frame_age=MAX_FRAME_AGE):
+        # The multiprocessing.connection module recognizes only str paths.
+        address = str(address)
+        self.address = address
+        self.max_frame_age = max_frame_age
+
+        # Remove the socket left behind by a server that has been killed, but
+        # never take over the socket of a running server.
+        if is_running(address):
+            raise socket.error('A stream server is already running.')
+        if os.path.exists(address):
+            os.remove(address)
+        self._listener = Listener(address, authkey=_write_key(address))
+
+        # The shared streams by their URL and format.
+        self._lock = threading.Lock()
+        self._streams = {}
+
+    @property
+    def streams_count(self):
+        """The number of open upstream connections.
+
+        """
+        with self._lock:
+            return len(self._streams)
+
+    def serve_forever(self):
+        """Accept and serve subscriptions until the server is closed.
+
+        """
+        while True:
+            try:
+                connection = self._listener.accept()
+            except (socket.error, AttributeError):
+                # The listener has been closed, or cannot accept connections
+                # any more (e.g. out of file descriptors). socket.error is a
+                # subclass of IOError, so it is caught first.
+                return
+            except (AuthenticationError, IOError, EOFError):
+                # A client that fails authentication, or that drops the
+                # connection during the handshake, is ignored.
+                continue
+            thread = threading.Thread(target=self._serve_subscription,
+                                      args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    def close(self):
+        """Stop accepting subscriptions, and remove the socket and the key.
+
+        """
+        self._listener.close()
+        key_path = self.address + KEY_FILE_SUFFIX
+        if os.path.exists(key_path):
+            os.remove(key_path)
+
+    def _subscribe(self, url, mjpeg):
+        """Add a subscriber to a stream, opening the stream if needed.
+
+        Parameters
+        ----------
+        url : str
+            The URL of the stream.
+        mjpeg : bool
+            Whether the stream is an MJPEG stream.
+
+        Returns
+        -------
+        _SharedStream
+            The stream.
+
+        Raises
+        ------
+        error.UnreachableCameraError
+            If the camera is unreachable.
+
+        Notes
+        -----
+        The stream is opened without holding the lock of the server, so that
+        a camera that is slow to connect does not delay the subscribers of
+        the other cameras.
+
+        """
+        key = (url, mjpeg)
+        with self._lock:
+            stream = self._streams.get(key)
+            if stream is None:
+                stream = _SharedStream(url, mjpeg, self.max_frame_age)
+                self._streams[key] = stream
+            stream.subscribers += 1
+        try:
+            stream.open_stream()
+        except error.UnreachableCameraError:
+            self._unsubscribe(url, mjpeg, stream)
+            raise
+        return stream
+
+    def _unsubscribe(self, url, mjpeg, stream):
+        """Remove a subscriber from a stream, closing it if it was the last.
+
+        Parameters
+        ----------
+        url : str
+            The URL of the stream.
+        mjpeg : bool
+            Whether the stream is an MJPEG stream.
+        stream : _SharedStream
+            The stream.
+
+        """
+        with self._lock:
+            stream.subscribers -= 1
+            if stream.subscribers > 0:
+                return
+            del self._streams[(url, mjpeg)]
+        stream.close_stream()
+
+    def _serve_subscription(self, connection):
+        """Serve the requests of a subscriber until it leaves.
+
+        Parameters
+        ----------
+        connection : multiprocessing.connection.Connection
+            The connection of the subscriber, whose first message is the
+            ('subscribe', url, mjpeg) request.
+
+        """
+        stream = None
+        try:
+            _, url, mjpeg = connection.recv()
+            try:
+                stream = self._subscribe(url, mjpeg)
+            except error.UnreachableCameraError:
+                connection.send(('error', 'UnreachableCameraError'))
+                return
+            connection.send(('subscribed',))
+
+            # The frame returned to the subscriber most recently.
+            frame = None
+            while True:
+                request = connection.recv()
+                if request[0] == 'get_frame':
+                    try:
+                        frame = stream.get_frame(
+                            frame and frame.frame_id)
+                    except error.Error as e:
+                        connection.send(('error', type(e).__name__))
+                        continue
+                    connection.send((
+                        'frame', frame.frame_id, frame.content_id,
+                        time.time() - frame.receive_time,
+                        frame.frame_timestamp))
+                    connection.send_bytes(frame.frame.data)
+                elif request[0] == 'decode':
+                    _, frame_id, flags = request
+                    if frame is None or frame.frame_id != frame_id:
+                        connection.send(('missing',))
+                        continue
+                    try:
+                        image = stream.decode(frame, flags)
+                    except error.CorruptedFrameError:
+                        connection.send(('error', 'CorruptedFrameError'))
+                        continue
+                    connection.send(('image', image.shape, image.dtype.str))
+                    connection.send_bytes(np.ascontiguousarray(image))
+                elif request[0] == 'restart':
+                    try:
+                        stream.restart_stream()
+                    except error.UnreachableCameraError:
+                        connection.send(('error', 'UnreachableCameraError'))
+                        continue
+                    connection.send(('restarted',))
+                else:
+                    break
+        except (EOFError, IOError):
+            # The subscriber left without unsubscribing (e.g. it crashed).
+            pass
+        finally:
+            if stream is not None:
+                self._unsubscribe(url, mjpeg, stream)
+            connection.close()
+
+
+class SharedEncodedFrame(encoded_frame.EncodedFrame):
+    """Represent a compressed frame of a shared stream.
+
+    This class subclasses the encoded_frame.EncodedFrame class and extends
+    its constructor. The frame is decoded by the stream server, which decodes
+    a frame at most once for all its subscribers.
+
+    Parameters
+    ----------
+    data : str
+        The compressed frame data.
+    flags : int
+        The cv2.imdecode flags used to decode the frame.
+    parser : SharedStreamParser
+        The parser that got the frame.
+    frame_id : int
+        The sequence number of the frame in the shared stream.
+
+    """
+
+    def __init__(self, data, flags, parser, frame_id):
+        super(SharedEncodedFrame, self).__init__(data, flags)
+        self._parser = parser
+        self._frame_id = frame_id
+
+    def decode(self):
+        """Decode the frame unless it has already been decoded.
+
+        The frame is decoded locally if the stream server no longer has it
+        (e.g. after the subscriber has requested a newer frame).
+
+        Returns
+        -------
+        numpy.ndarray
+            The decoded frame.
+
+        Raises
+        ------
+        error.CorruptedFrameError
+            If the frame is corrupted.
+
+        """
+        if self._image is None:
+            image = self._parser._decode(self._frame_id, self.flags)
+            if image is None:
+                image = encoded_frame.decode(self.data, flags=self.flags)
+            self._image = image
+        return self._image
+
+
+class SharedStreamParser(stream_parser.StreamParser):
+    """Represent a parser getting the frames of a camera from a stream server.
+
+    This class subclasses the StreamParser class and inherits its attributes
+    and extends its constructor.
+
+    Parameters
+    ----------
+    address : str
+        The path of the socket of the stream server.
+    url : str
+        The URL of the stream.
+    mjpeg : bool, optional
+        Whether the stream is an MJPEG stream rather than an image stream.
+    decode_flags : int, optional
+        The cv2.imdecode flags used to decode the frames (see the
+        encoded_frame.get_decode_flags function).
+
+    Attributes
+    ----------
+    address : str
+        The path of the socket of the stream server.
+    mjpeg : bool
+        Whether the stream is an MJPEG stream.
+
+    Notes
+    -----
+    The parser subscribes to the stream when it is opened, or when the first
+    frame is requested, so an image stream does not need to be opened, like
+    with the ImageStreamParser class. The frame_unchanged attribute is set if
+    the frame is identical to the frame returned by this parser before,
+    regardless of the frames returned to the other subscribers. The parser is
+    safe to use from multiple threads (e.g. decoding a frame while the next
+    one is fetched). If the stream server is not running, or stops, the
+    parser fetches the frames directly from the camera from then on.
+
+    """
+
+    def __init__(self, address, url, mjpeg=False,
+                 decode_flags=encoded_frame.DEFAULT_DECODE_FLAGS):
+        super(SharedStreamParser, self).__init__(url, decode_flags)
+        self.address = address
+        self.mjpeg = mjpeg
+
+        # The connection to the stream server, and the content of the frame
+        # returned most recently.
+        self._lock = threading.Lock()
+        self._connection = None
+        self._content_id = None
+
+        # The parser fetching the frames directly from the camera once the
+        # stream server is unreachable.
+        self._direct_parser = None
+
+    def open_stream(self):
+        """Subscribe to the stream.
+
+        The stream is opened directly from the camera if the stream server is
+        unreachable.
+
+        Raises
+        ------
+        error.UnreachableCameraError
+            If the camera is unreachable.
+
+        """
+        with self._lock:
+            if self._connection is not None or \
+                    self._direct_parser is not None:
+                return
+            if not is_running(self.address):
+                self._open_direct_stream()
+                return
+            try:
+                connection = Client(self.address,
+                                    authkey=read_key(self.address))
+                connection.send(('subscribe', self.url, self.mjpeg))
+                reply = connection.recv()
+            except (AuthenticationError, socket.error, IOError, EOFError):
+                self._open_direct_stream()
+                return
+            if reply[0] == 'error':
+                connection.close()
+                raise getattr(error, reply[1])
+            self._connection = connection
+            self._content_id = None
+
+    def close_stream(self):
+        """Unsubscribe from the stream.
+
+        """
+        with self._lock:
+            if self._connection is not None:
+                try:
+                    self._connection.send(('unsubscribe',))
+                except IOError:
+                    pass
+                self._connection.close()
+                self._connection = None
+            if self._direct_parser is not None:
+                self._direct_parser.close_stream()
+                self._direct_parser = None
+
+    def restart_stream(self):
+        """Ask the stream server to restart the stream.
+
+        The stream server restarts the stream only if it failed, since the
+        stream is shared by other subscribers.
+
+        Raises
+        ------
+        error.UnreachableCameraError
+            If the camera is unreachable.
+
+        """
+        if self._direct_parser is not None:
+            self._direct_parser.restart_stream()
+            return
+        if self._connection is None:
+            self.open_stream()
+            return
+        try:
+            self._request(('restart',))
+        except _ServerLostError:
+            self._fall_back()
+
+    def get_frame(self, decode=True):
+        """Get the most recent frame of the stream from the stream server.
+
+        Parameters
+        ----------
+        decode : bool, optional
+            Whether to decode the frame. If it is False, the frame is returned
+            compressed, and it is decoded when its pixels are accessed.
+
+        Returns
+        -------
+        frame : numpy.ndarray or encoded_frame.EncodedFrame
+            The downloaded frame.
+        frame_size : int
+            The size of the downloaded frame in bytes.
+
+        Raises
+        ------
+        error.CorruptedFrameError
+            If the frame is corrupted.
+        error.UnreachableCameraError
+            If the camera is unreachable.
+
+        """
+        self.open_stream()
+        try:
+            with self._lock:
+                if self._direct_parser is not None:
+                    return self._get_direct_frame(decode)
+                _, frame_id, content_id, frame_age, frame_timestamp = \
+                    self._request(('get_frame',), False)
+                data = self._receive(lambda: self._connection.recv_bytes())
+        except _ServerLostError:
+            self._fall_back()
+            return self.get_frame(decode)
+
+        self.frame_unchanged = content_id == self._content_id
+        self.frame_age = frame_age
+        self.frame_timestamp = frame_timestamp
+        self._content_id = content_id
+
+        frame = SharedEncodedFrame(data, self.decode_flags, self, frame_id)
+        if decode:
+            return frame.image, frame.size
+        frame.validate()
+
+        return frame, frame.size
+
+    def _fall_back(self):
+        """Open the stream directly from the camera after the server stops.
+
+        Raises
+        ------
+        error.UnreachableCameraError
+            If the camera is unreachable.
+
+        """
+        with self._lock:
+            if self._direct_parser is None:
+                self._open_direct_stream()
+
+    def _open_direct_stream(self):
+        """Open the stream directly from the camera.
+
+        This is called with the lock of the connection held.
+
+        Raises
+        ------
+        error.UnreachableCameraError
+            If the camera is unreachable.
+
+        """
+        if self.mjpeg:
+            parser = stream_parser.MJPEGStreamParser(
+                self.url, True, self.decode_flags)
+        else:
+            parser = stream_parser.ImageStreamParser(
+                self.url, self.decode_flags)
+        parser.open_stream()
+        self._direct_parser = parser
+
+    def _get_direct_frame(self, decode):
+        """Get the most recent frame directly from the camera.
+
+        This is called with the lock of the connection held.
+
+        Parameters
+        ----------
+        decode : bool
+            Whether to decode the frame.
+
+        Returns
+        -------
+        frame : numpy.ndarray or encoded_frame.EncodedFrame
+            The downloaded frame.
+        frame_size : int
+            The size of the downloaded frame in bytes.
+
+        Raises
+        ------
+        error.CorruptedFrameError
+            If the frame is corrupted.
+        error.UnreachableCameraError
+            If the camera is unreachable.
+
+        """
+        parser = self._direct_parser
+        frame, frame_size = parser.get_frame(decode)
+        self.frame_unchanged = parser.frame_unchanged
+        self.frame_age = parser.frame_age
+        self.frame_timestamp = parser.frame_timestamp
+        return frame, frame_size
+
+    def _decode(self, frame_id, flags):
+        """Get a frame decoded by the stream server.
+
+        Parameters
+        ----------
+        frame_id : int
+            The sequence number of the frame in the shared stream.
+        flags : int
+            The cv2.imdecode flags used to decode the frame.
+
+        Returns
+        -------
+        numpy.ndarray
+            The decoded frame, or None if the stream server no longer has
+            the frame, or the parser is closed or no longer connected to the
+            stream server.
+
+        Raises
+        ------
+        error.CorruptedFrameError
+            If the frame is corrupted.
+
+        """
+        with self._lock:
+            if self._connection is None:
+                return None
+            try:
+                reply = self._request(('decode', frame_id, flags), False)
+                if reply[0] == 'missing':
+                    return None
+
+                # Receive the pixels straight into a new, writable array.
+                image = np.empty(reply[1], np.dtype(reply[2]))
+                self._receive(
+                    lambda: self._connection.recv_bytes_into(image))
+            except _ServerLostError:
+                return None
+            return image
+
+    def _request(self, request, lock=True):
+        """Send a request to the stream server, and receive its reply.
+
+        Parameters
+        ----------
+        request : tuple
+            The request.
+        lock : bool, optional
+            Whether to take the lock of the connection, unless the caller
+            already holds it.
+
+        Returns
+        -------
+        tuple
+            The reply of the stream server.
+
+        Raises
+        ------
+        error.Error
+            If the stream server replies with an error.
+        error.UnreachableCameraError
+            If the stream server is unreachable.
+
+        """
+        if lock:
+            with self._lock:
+                return self._request(request, False)
+        if self._connection is None:
+            raise error.ClosedStreamError
+        self._receive(lambda: self._connection.send(request))
+        reply = self._receive(self._connection.recv)
+        if reply[0] == 'error':
+            raise getattr(error, reply[1])
+        return reply
+
+    def _receive(self, function):
+        """Communicate with the stream server, handling its failure.
+
+        Parameters
+        ----------
+        function : callable
+            The function sending to or receiving from the connection.
+
+        Returns
+        -------
+        object
+            The return value of the function.
+
+        Raises
+        ------
+        _ServerLostError
+            If the connection to the stream server fails. The subscription
+            is dropped, so the next request subscribes again.
+
+        """
+        try:
+            return function()
+        except (IOError, EOFError):
+            self._connection.close()
+            self._connection = None
+            raise _ServerLostError
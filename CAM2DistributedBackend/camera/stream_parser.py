@@ -3,7 +3,8 @@
 This module is used to parse different types of camera streams. The module
 provides the StreamParser base class which provides a uniform way of parsing
 all camera streams. The module provides different subclasses, each for a
-different type of camera streams (e.g. image streams, and MJPEG streams).
+different type of camera streams (e.g. image streams, MJPEG streams, and
+recorded streams).
 
 Examples
 --------
@@ -40,12 +41,18 @@ while time.time() - t < 5:
 parser.close_stream()
 
 """
+import hashlib
+import httplib
+import socket
+import threading
+import time
 import urllib2
 
-import cv2
-import numpy as np
-
+import capture_file
+import connection_pool
+import encoded_frame
 import error
+import multipart
 
 # NOTE Causes problems in case of slow internet connection
 DOWNLOAD_TIMEOUT = 10
@@ -58,16 +65,36 @@ class StreamParser(object):
     ----------
     url : str
         The URL of the stream.
+    decode_flags : int, optional
+        The cv2.imdecode flags used to decode the frames (see the
+        encoded_frame.get_decode_flags function).
 
     Attributes
     ----------
     url : str
         The URL of the stream.
+    decode_flags : int
+        The cv2.imdecode flags used to decode the frames.
+    frame_age : float
+        The time in seconds between receiving the most recent frame from the
+        camera and returning it by the get_frame method. This is None if the
+        parser does not receive frames ahead of the get_frame method.
+    frame_unchanged : bool
+        Whether the most recent frame returned by the get_frame method is
+        identical to the frame returned before it.
+    frame_timestamp : float
+        The time at which the most recent frame returned by the get_frame
+        method has been captured, if it is known (e.g. for recorded frames),
+        or None.
 
     """
 
-    def __init__(self, url):
+    def __init__(self, url, decode_flags=encoded_frame.DEFAULT_DECODE_FLAGS):
         self.url = url
+        self.decode_flags = decode_flags
+        self.frame_age = None
+        self.frame_unchanged = False
+        self.frame_timestamp = None
 
     def open_stream(self):
         """Open the stream.
@@ -97,14 +124,20 @@ class StreamParser(object):
         self.close_stream()
         self.open_stream()
 
-    def get_frame(self):
+    def get_frame(self, decode=True):
         """Get the most recent frame from the camera stream.
 
         This method is an abstract method that must be overridden by subclasses.
 
+        Parameters
+        ----------
+        decode : bool, optional
+            Whether to decode the frame. If it is False, the frame is returned
+            compressed, and it is decoded when its pixels are accessed.
+
         Returns
         -------
-        numpy.ndarray
+        numpy.ndarray or encoded_frame.EncodedFrame
             The downloaded frame.
         int
             The size of the downloaded frame in bytes.
@@ -138,14 +171,42 @@ class ImageStreamParser(StreamParser):
     given URL whenever requested. There is no need to call open_stream or
     close_stream since they do nothing.
 
+    The frames are downloaded through the persistent connections of the
+    connection pool shared by all the parsers of the process, so that
+    successive frames do not pay for a new connection every time.
+
+    Many cameras refresh their image less often than it is requested. The
+    parser sends conditional requests (If-None-Match and If-Modified-Since)
+    so that such cameras can reply without sending the image again, and
+    compares a hash of the downloaded data for the cameras that do not
+    support conditional requests. In both cases, the previous frame is
+    returned without decoding it again, and the frame_unchanged attribute is
+    set.
+
     """
 
-    def get_frame(self):
+    def __init__(self, url, decode_flags=encoded_frame.DEFAULT_DECODE_FLAGS):
+        super(ImageStreamParser, self).__init__(url, decode_flags)
+
+        # The validators sent by the camera with the most recent frame, the
+        # hash of its data, and the frame itself.
+        self._etag = None
+        self._last_modified = None
+        self._digest = None
+        self._frame = None
+
+    def get_frame(self, decode=True):
         """Get the most recent frame from the camera image stream.
 
+        Parameters
+        ----------
+        decode : bool, optional
+            Whether to decode the frame. If it is False, the frame is returned
+            compressed, and it is decoded when its pixels are accessed.
+
         Returns
         -------
-        frame : numpy.ndarray
+        frame : numpy.ndarray or encoded_frame.EncodedFrame
             The downloaded frame.
         frame_size : int
             The size of the downloaded frame in bytes.
@@ -158,30 +219,89 @@ class ImageStreamParser(StreamParser):
             If the camera is unreachable.
 
         """
+        # Ask the camera to send the frame only if it has changed.
+        headers = {}
+        if self._frame is not None:
+            if self._etag is not None:
+                headers['If-None-Match'] = self._etag
+            if self._last_modified is not None:
+                headers['If-Modified-Since'] = self._last_modified
+
         try:
-            # Download the frame data.
-            frame = urllib2.urlopen(
-                self.url, timeout=DOWNLOAD_TIMEOUT).read()
-        except urllib2.URLError:
+            # Download the frame data through a pooled connection.
+            status, response_headers, frame = \
+                connection_pool.get_pool().request(self.url, headers)
+        except (socket.error, httplib.HTTPException):
+            raise error.UnreachableCameraError
+
+        # Handle the cameras that reply that the frame has not changed.
+        if status == 304 and self._frame is not None:
+            return self._get_unchanged_frame(decode)
+
+        # Handle the cameras that return an error status.
+        if status >= 400 or status == 304:
             raise error.UnreachableCameraError
 
         # Handle the cameras that return empty content.
         if frame == '':
             raise error.CorruptedFrameError
 
-        # Get the size of the downloaded frame in bytes.
-        frame_size = len(frame)
+        # Handle the cameras that return the same frame data again.
+        digest = hashlib.md5(frame).digest()
+        if digest == self._digest:
+            return self._get_unchanged_frame(decode)
 
-        # Decode the frame data to a numpy.ndarray image.
-        frame = cv2.imdecode(np.fromstring(frame, dtype=np.uint8), -1)
+        # Check the frame data without decoding it if possible.
+        frame = encoded_frame.EncodedFrame(frame, self.decode_flags)
+        frame.validate()
 
-        # Handle the cameras whose URLs return 1x1 images. The method
-        # cv2.imdecode returns None if the input buffer is too short
-        # or contains invalid data.
-        if frame is None:
-            raise error.CorruptedFrameError
+        # Keep the frame to be returned if it does not change.
+        self._etag = response_headers.getheader('etag')
+        self._last_modified = response_headers.getheader('last-modified')
+        self._digest = digest
+        self._frame = frame
+        self.frame_unchanged = False
 
-        return frame, frame_size
+        return self._get_frame(decode)
+
+    def _get_unchanged_frame(self, decode):
+        """Get the frame that has been returned before.
+
+        Parameters
+        ----------
+        decode : bool
+            Whether to decode the frame.
+
+        Returns
+        -------
+        frame : numpy.ndarray or encoded_frame.EncodedFrame
+            The frame. The frame is decoded at most once.
+        frame_size : int
+            The size of the frame in bytes.
+
+        """
+        self.frame_unchanged = True
+        return self._get_frame(decode)
+
+    def _get_frame(self, decode):
+        """Get the most recent frame, decoding it if requested.
+
+        Parameters
+        ----------
+        decode : bool
+            Whether to decode the frame.
+
+        Returns
+        -------
+        frame : numpy.ndarray or encoded_frame.EncodedFrame
+            The frame.
+        frame_size : int
+            The size of the frame in bytes.
+
+        """
+        if decode:
+            return self._frame.image, self._frame.size
+        return self._frame, self._frame.size
 
 
 class MJPEGStreamParser(StreamParser):
@@ -194,17 +314,56 @@ class MJPEGStreamParser(StreamParser):
     ----------
     url : str
         The URL of the MJPEG stream.
+    latest_frame_only : bool, optional
+        Whether to drain the MJPEG stream continuously on a background
+        thread, keeping only the most recent frame.
+    decode_flags : int, optional
+        The cv2.imdecode flags used to decode the frames (see the
+        encoded_frame.get_decode_flags function).
 
     Attributes
     ----------
     mjpeg_stream : file-like object
         The handle to the camera MJPEG stream.
+    reader : multipart.MultipartReader
+        The reader of the parts of the camera MJPEG stream.
+    latest_frame_only : bool
+        Whether the MJPEG stream is drained on a background thread.
+    frames_received : int
+        The number of frames received from the camera by the background
+        thread.
+    frames_dropped : int
+        The number of frames received by the background thread that have
+        been replaced by a more recent frame before being returned.
+
+    Notes
+    -----
+    A camera keeps pushing frames into an MJPEG stream regardless of how often
+    they are requested. If the frames are requested less often than the camera
+    sends them, the unread frames pile up and every frame returned by the
+    get_frame method is older than the one before. In the latest_frame_only
+    mode, a background thread reads the frames as soon as they arrive and
+    keeps only the most recent one, still compressed, so that the get_frame
+    method always returns a fresh frame.
 
     """
 
-    def __init__(self, url):
-        super(MJPEGStreamParser, self).__init__(url)
+    def __init__(self, url, latest_frame_only=False,
+                 decode_flags=encoded_frame.DEFAULT_DECODE_FLAGS):
+        super(MJPEGStreamParser, self).__init__(url, decode_flags)
         self.mjpeg_stream = None
+        self.reader = None
+        self.latest_frame_only = latest_frame_only
+        self.frames_received = 0
+        self.frames_dropped = 0
+
+        # The most recent frame received by the background thread as a
+        # (frame data, receive time) tuple, whether it has been returned, and
+        # the error that stopped the background thread.
+        self._condition = threading.Condition()
+        self._latest_frame = None
+        self._latest_frame_returned = False
+        self._error = None
 
     def open_stream(self):
         """Open the MJPEG stream.
@@ -221,6 +380,20 @@ class MJPEGStreamParser(StreamParser):
         except urllib2.URLError:
             raise error.UnreachableCameraError
 
+        # Take the boundary from the Content-Type header of the response. If
+        # the camera does not send it, the reader takes it from the stream.
+        boundary = multipart.get_boundary(self.mjpeg_stream.info())
+        self.reader = multipart.MultipartReader(self.mjpeg_stream, boundary)
+
+        if self.latest_frame_only:
+            with self._condition:
+                self._latest_frame = None
+                self._error = None
+            thread = threading.Thread(target=self._drain_stream,
+                                      args=(self.reader,))
+            thread.daemon = True
+            thread.start()
+
     def close_stream(self):
         """Close the MJPEG stream.
 
@@ -228,13 +401,20 @@ class MJPEGStreamParser(StreamParser):
         if self.mjpeg_stream is not None:
             self.mjpeg_stream.close()
             self.mjpeg_stream = None
+            self.reader = None
 
-    def get_frame(self):
+    def get_frame(self, decode=True):
         """Get the most recent frame from the camera MJPEG stream.
 
+        Parameters
+        ----------
+        decode : bool, optional
+            Whether to decode the frame. If it is False, the frame is returned
+            compressed, and it is decoded when its pixels are accessed.
+
         Returns
         -------
-        frame : numpy.ndarray
+        frame : numpy.ndarray or encoded_frame.EncodedFrame
             The downloaded frame.
         frame_size : int
             The size of the downloaded frame in bytes.
@@ -249,63 +429,146 @@ class MJPEGStreamParser(StreamParser):
         Notes
         -----
         MJPEG Stream Format:
-        --myboundary
+        --[boundary]
         Content-Type: image/jpeg
         Content-Length: [size of image in bytes]
         [empty line]
         ..... binary data .....
         [empty line]
-        --myboundary
+        --[boundary]
         Content-Type: image/jpeg
         Content-Length: [size of image in bytes]
         [empty line]
         ..... binary data .....
         [empty line]
 
+        The boundary is taken from the Content-Type header of the stream, and
+        the headers of a frame may come in any order. If a camera does not
+        send the Content-Length header, the frame data extends to the next
+        boundary.
+
         """
         if self.mjpeg_stream is None:
             raise error.ClosedStreamError
 
-        # Skip the boundary line.
-        if self.mjpeg_stream.readline().rstrip() != '--myboundary':
-            raise error.CorruptedFrameError
+        if self.latest_frame_only:
+            return self._get_latest_frame(decode)
 
-        # Skip the second line that has "Content-Type: image/jpeg".
-        if self.mjpeg_stream.readline().rstrip() != 'Content-Type: image/jpeg':
+        # Read the next frame into the buffer of the reader.
+        try:
+            offset, frame_size, _ = self.reader.next_part()
+        except (EOFError, IOError):
+            self.restart_stream()
             raise error.CorruptedFrameError
 
-        # Verify the format of the third line, and get the frame size.
-        line = [s.strip() for s in self.mjpeg_stream.readline().split(':')]
-        if len(line) == 2 and line[0] == 'Content-Length' and line[1].isdigit():
-            frame_size = int(line[1])
+        if decode:
+            # Decode the frame data in place to a numpy.ndarray image.
+            frame = encoded_frame.decode(
+                self.reader.buffer, offset, frame_size, self.decode_flags)
         else:
-            raise error.CorruptedFrameError
+            # Copy the frame data out of the buffer of the reader since the
+            # buffer is reused for the next frame.
+            frame = encoded_frame.EncodedFrame(
+                bytes(self.reader.buffer[offset:offset + frame_size]),
+                self.decode_flags)
+            frame.validate()
 
-        # Skip the empty line before the binary frame data.
-        if self.mjpeg_stream.readline().strip() != '':
-            raise error.CorruptedFrameError
+        return frame, frame_size
 
-        # Read the binary frame data.
-        try:
-            frame = self.mjpeg_stream.read(frame_size)
-        except:
-            self.restart_stream()
-            raise error.CorruptedFrameError
+    def _drain_stream(self, reader):
+        """Read the frames of the MJPEG stream as soon as they arrive.
 
-        # Skip the empty line after the binary frame data.
-        if self.mjpeg_stream.readline().strip() != '':
-            raise error.CorruptedFrameError
+        This method runs on a background thread until the stream is closed or
+        fails. It keeps only the most recent frame.
 
-        # Decode the frame data to a numpy.ndarray image.
-        frame = cv2.imdecode(np.fromstring(frame, dtype=np.uint8), -1)
+        Parameters
+        ----------
+        reader : multipart.MultipartReader
+            The reader of the stream. The method stops as soon as the reader
+            is replaced (e.g. when the stream is closed or restarted).
+
+        """
+        while self.reader is reader:
+            try:
+                offset, frame_size, _ = reader.next_part()
+            except Exception as e:
+                with self._condition:
+                    # A stream closed by another thread in the middle of a
+                    # read can fail with any error.
+                    if self.reader is not reader:
+                        return
+                    if not isinstance(e, (EOFError, IOError,
+                                          error.CorruptedFrameError)):
+                        raise
+                    self._error = error.CorruptedFrameError
+                    self._condition.notify_all()
+                return
+
+            # Copy the frame data out of the buffer of the reader since the
+            # buffer is reused for the next frame.
+            frame = bytes(reader.buffer[offset:offset + frame_size])
+            with self._condition:
+                if self._latest_frame is not None and \
+                        not self._latest_frame_returned:
+                    self.frames_dropped += 1
+                self._latest_frame = (frame, time.time())
+                self._latest_frame_returned = False
+                self.frames_received += 1
+                self._condition.notify_all()
+
+    def _get_latest_frame(self, decode):
+        """Get the most recent frame received by the background thread.
+
+        This method waits for a new frame if the most recent frame has already
+        been returned.
+
+        Parameters
+        ----------
+        decode : bool
+            Whether to decode the frame.
 
-        # Handle the cameras whose URLs return 1x1 images. The method
-        # cv2.imdecode returns None if the input buffer is too short or
-        # contains invalid data.
-        if frame is None:
+        Returns
+        -------
+        frame : numpy.ndarray or encoded_frame.EncodedFrame
+            The downloaded frame.
+        frame_size : int
+            The size of the downloaded frame in bytes.
+
+        Raises
+        ------
+        error.CorruptedFrameError
+            If the frame is corrupted, or no new frame arrives in time.
+
+        """
+        with self._condition:
+            deadline = time.time() + DOWNLOAD_TIMEOUT
+            while self._error is None and (self._latest_frame is None or
+                                           self._latest_frame_returned):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            failed = self._error is not None or self._latest_frame is None \
+                or self._latest_frame_returned
+            if not failed:
+                frame, receive_time = self._latest_frame
+                self._latest_frame_returned = True
+
+        # Restart the stream if the background thread stopped or the camera
+        # stopped sending frames.
+        if failed:
+            self.restart_stream()
             raise error.CorruptedFrameError
 
-        return frame, frame_size
+        self.frame_age = time.time() - receive_time
+
+        # Check the frame data, and decode it if requested.
+        frame = encoded_frame.EncodedFrame(frame, self.decode_flags)
+        if decode:
+            return frame.image, frame.size
+        frame.validate()
+
+        return frame, frame.size
 
     def __del__(self):
         """Close the MJPEG stream when the object is about to be destroyed.
@@ -318,3 +581,156 @@ class MJPEGStreamParser(StreamParser):
 
         """
         self.close_stream()
+
+
+class ReplayStreamParser(StreamParser):
+    """Represent a parser replaying the frames of a capture file.
+
+    This class subclasses the StreamParser class and inherits its attributes
+    and extends its constructor.
+
+    Parameters
+    ----------
+    file_name : str
+        The file name of the capture file (see the capture_file module).
+    realtime : bool, optional
+        Whether to replay the frames at the pace they have been recorded. If
+        it is False, every call to the get_frame method returns the next
+        frame, so that the frames are replayed as fast as they are requested.
+    loop : bool, optional
+        Whether to start over once all the frames have been replayed.
+    decode_flags : int, optional
+        The cv2.imdecode flags used to decode the frames (see the
+        encoded_frame.get_decode_flags function).
+
+    Attributes
+    ----------
+    reader : capture_file.CaptureReader
+        The reader of the capture file.
+    realtime : bool
+        Whether the frames are replayed at the pace they have been recorded.
+    loop : bool
+        Whether the replay starts over once all the frames have been
+        replayed.
+
+    Notes
+    -----
+    The capture file is mapped into memory, and the frames are decoded
+    straight from the mapping without being copied. In the realtime mode, the
+    parser behaves like a camera: the get_frame method returns the frame that
+    has been recorded at the time elapsed since the stream has been opened,
+    and frames are skipped if they are requested less often than they have
+    been recorded. The frame_timestamp attribute holds the time at which the
+    frame has been recorded. Frames that have all been recorded at the same
+    time cannot be replayed at their pace, so they are replayed one frame
+    per call even in the realtime mode.
+
+    """
+
+    def __init__(self, file_name, realtime=True, loop=False,
+                 decode_flags=encoded_frame.DEFAULT_DECODE_FLAGS):
+        super(ReplayStreamParser, self).__init__(file_name, decode_flags)
+        self.reader = None
+        self.realtime = realtime
+        self.loop = loop
+
+        # The time at which the stream has been opened, and the index of the
+        # frame returned most recently.
+        self._start_time = None
+        self._index = None
+
+    def open_stream(self):
+        """Open the capture file, and start replaying it from the beginning.
+
+        Raises
+        ------
+        error.UnreachableCameraError
+            If the capture file cannot be read.
+
+        """
+        try:
+            self.reader = capture_file.CaptureReader(self.url)
+        except (IOError, capture_file.FormatError):
+            raise error.UnreachableCameraError
+        self._start_time = time.time()
+        self._index = None
+
+    def close_stream(self):
+        """Close the capture file.
+
+        """
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+    def restart_stream(self):
+        """Do nothing, since a capture file does not need to be restarted.
+
+        The corrupted frames of a capture file are recorded as they are, so
+        starting over would only replay them again.
+
+        """
+        pass
+
+    def get_frame(self, decode=True):
+        """Get the next frame from the capture file.
+
+        Parameters
+        ----------
+        decode : bool, optional
+            Whether to decode the frame. If it is False, the frame is returned
+            compressed, and it is decoded when its pixels are accessed.
+
+        Returns
+        -------
+        frame : numpy.ndarray or encoded_frame.EncodedFrame
+            The replayed frame.
+        frame_size : int
+            The size of the replayed frame in bytes.
+
+        Raises
+        ------
+        error.CorruptedFrameError
+            If the frame is corrupted.
+        error.EndOfStreamError
+            If all the frames have been replayed.
+        error.ClosedStreamError
+            If the stream needs to be opened first.
+
+        """
+        if self.reader is None:
+            raise error.ClosedStreamError
+        frames_count = len(self.reader)
+        if not frames_count:
+            raise error.EndOfStreamError
+
+        if self.realtime and (self.reader.duration > 0 or frames_count == 1):
+            elapsed = time.time() - self._start_time
+            if self.loop and frames_count > 1:
+                # Leave the average time between the frames after the last
+                # frame before starting over.
+                elapsed %= self.reader.duration * frames_count / \
+                    (frames_count - 1)
+            index = self.reader.find(elapsed)
+            if index == self._index == frames_count - 1 and not self.loop:
+                raise error.EndOfStreamError
+            self.frame_unchanged = index == self._index
+            self.frame_age = elapsed - (self.reader.index['timestamp'][index]
+                                        - self.reader.index['timestamp'][0])
+        else:
+            index = 0 if self._index is None else self._index + 1
+            if index == frames_count:
+                if not self.loop:
+                    raise error.EndOfStreamError
+                index = 0
+        self._index = index
+        self.frame_timestamp = float(self.reader.index['timestamp'][index])
+
+        # Check the frame data, and decode it if requested.
+        frame = encoded_frame.EncodedFrame(
+            self.reader.get_frame_data(index), self.decode_flags)
+        if decode:
+            return frame.image, frame.size
+        frame.validate()
+
+        return frame, frame.size
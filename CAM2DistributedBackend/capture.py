@@ -0,0 +1,37 @@
+"""The capture tool
+
+This tool records the frames of a camera into a capture file, which can be
+replayed later by a camera of the `replay` type.
+
+"""
+
+import click
+
+@click.command(help='Record the frames of a camera into a capture file')
+@click.argument('url')
+@click.argument('capture_file')
+@click.option('--mjpeg', is_flag=True, help='Record an MJPEG stream rather than an image stream.')
+@click.option('--duration', type=float, default=60, show_default=True, help='The recording duration in seconds.')
+@click.option('--interval', type=float, default=0, show_default=True, help='The interval between requesting every two successive frames in seconds.')
+@click.version_option(prog_name='CAM2Capture')
+def cli(url, capture_file, mjpeg, duration, interval):
+	'''Entry point of the capture tool.'''
+	
+	from CAM2DistributedBackend.camera.capture_file import record
+	from CAM2DistributedBackend.camera.error import UnreachableCameraError
+	from CAM2DistributedBackend.camera.stream_parser import ImageStreamParser, MJPEGStreamParser
+	
+	# Open the stream of the camera
+	if mjpeg:
+		parser = MJPEGStreamParser(url)
+	else:
+		parser = ImageStreamParser(url)
+	try:
+		parser.open_stream()
+		frames, corrupted_frames = record(parser, capture_file, duration, interval, {'url': url, 'mjpeg': mjpeg})
+	except UnreachableCameraError:
+		raise click.ClickException('Unreachable camera: ' + url)
+	finally:
+		parser.close_stream()
+	
+	print '{} frames recorded, {} corrupted frames skipped'.format(frames, corrupted_frames)
@@ -0,0 +1,69 @@
+"""The results tool
+
+This tool lists and extracts the results packed into the result containers of
+a camera, when the request sets `pack_results`.
+
+"""
+
+import click
+
+@click.group(help='List and extract the results packed into the result containers of a camera')
+@click.argument('namenode_url')
+@click.argument('directory')
+@click.version_option(prog_name='CAM2Results')
+@click.pass_context
+def cli(ctx, namenode_url, directory):
+	'''Entry point of the results tool.
+
+	NAMENODE_URL is the URL of the HDFS namenode, or any other storage URL (e.g. file:///data/cam2).
+	DIRECTORY is the directory of the results of the camera (e.g. /users/<username>/<submission_id>/<camera_id>).
+	'''
+
+	from CAM2DistributedBackend.util.storage_backend import create_backend
+
+	try:
+		ctx.obj = create_backend(namenode_url, directory)
+	except ValueError as e:
+		raise click.ClickException(str(e))
+
+@cli.command('list', help='List the results, with their sizes and the times they have been saved')
+@click.pass_obj
+def list_results(client):
+	'''List the results of every result container.'''
+
+	import datetime
+	from CAM2DistributedBackend.util.result_pack import ResultPackReader, list_packs
+
+	for file_name in list_packs(client):
+		reader = ResultPackReader(client, file_name)
+		print '{} ({} results{})'.format(file_name, len(reader), '' if reader.is_closed else ', not closed')
+		for name, timestamp, _, size in reader.index:
+			print '\t{}\t{}\t{}'.format(datetime.datetime.fromtimestamp(timestamp), size, name)
+
+@cli.command('extract', help='Extract results into files (all of them by default)')
+@click.argument('names', nargs=-1)
+@click.option('--output', '-o', type=click.Path(file_okay=False), default='.', show_default=True, help='The directory of the extracted files.')
+@click.pass_obj
+def extract_results(client, names, output):
+	'''Extract the most recent result with every file name.'''
+
+	import os
+	from CAM2DistributedBackend.util.result_pack import ResultPackReader, list_packs
+
+	# Find the most recent result with every file name
+	results = {}
+	for file_name in list_packs(client):
+		reader = ResultPackReader(client, file_name)
+		for i, entry in enumerate(reader.index):
+			results[entry[0]] = (reader, i)
+	missing = [name for name in names if name not in results]
+	if missing:
+		raise click.ClickException('No such results: ' + ', '.join(missing))
+
+	if not os.path.isdir(output):
+		os.makedirs(output)
+	for name in names or sorted(results):
+		reader, i = results[name]
+		with open(os.path.join(output, name), 'wb') as f:
+			f.write(reader.read_entry(i))
+	print '{} results extracted'.format(len(names or results))
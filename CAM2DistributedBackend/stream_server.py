@@ -0,0 +1,35 @@
+"""The stream server
+
+This tool runs the stream server of a worker, which shares a single
+connection to every camera between all the tasks of the worker analyzing it.
+
+"""
+
+import click
+
+@click.command(help='Run the stream server of a worker')
+@click.option('--address', default=None, help='The path of the socket of the server. [default: $CAM2_STREAM_SERVER or /tmp/cam2-stream-server.sock]')
+@click.option('--max-frame-age', type=float, default=1.0, show_default=True, help='The maximum age in seconds of a frame that is reused for another task rather than fetched again.')
+@click.version_option(prog_name='CAM2StreamServer')
+def cli(address, max_frame_age):
+	'''Entry point of the stream server.'''
+	
+	import signal
+	import socket
+	import sys
+	from CAM2DistributedBackend.camera.shared_stream import StreamServer, get_address
+	
+	# Start listening
+	try:
+		server = StreamServer(address or get_address(), max_frame_age)
+	except socket.error as e:
+		raise click.ClickException(str(e))
+	
+	# Remove the socket when the server is stopped
+	signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+	try:
+		print 'Serving camera streams on {}'.format(server.address)
+		sys.stdout.flush()
+		server.serve_forever()
+	finally:
+		server.close()
@@ -0,0 +1,1457 @@
+"""Provide the analysis of cameras on the Spark executors.
+
+This module provides the `CameraTask` class that represents the analysis of a
+single camera: it initializes the submitted analyzer, opens the camera stream,
+fetches the frames, and passes them to the analyzer. The module also provides
+three ways to run the tasks: one camera at a time in the calling thread, one
+camera at a time with fetching, decoding, and analyzing the frames overlapped
+in a pipeline, a group of cameras at the same time, sharing a pool of
+threads that fetch the frames and a smaller pool of threads that analyze them,
+a group of cameras sharing a single analyzer that receives a frame from every
+camera at once, or one camera at a time with its analyzer isolated in a
+separate process.
+
+Class Listings
+--------------
+CameraTask
+    Represent the analysis of a single camera.
+
+Function Listings
+-----------------
+run_camera
+    Run the analysis of a single camera in the calling thread.
+run_camera_pipelined
+    Run the analysis of a single camera as a pipeline of stages.
+run_cameras
+    Run the analysis of a group of cameras at the same time.
+create_analyzer
+    Create an instance of the submitted analysis class.
+run_partition
+    Run the analysis of a group of cameras sharing a single analyzer.
+run_camera_isolated
+    Run the analysis of a camera with its analyzer in another process.
+
+"""
+
+import collections
+import heapq
+import importlib
+import os
+import Queue
+import sys
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+from CAM2DistributedBackend.analyzer.camera_metadata import CameraMetadata
+from CAM2DistributedBackend.analyzer.frame_metadata import FrameMetadata
+from CAM2DistributedBackend.camera import shared_stream
+from CAM2DistributedBackend.camera.camera import StreamFormat
+from CAM2DistributedBackend.camera.encoded_frame import EncodedFrame
+from CAM2DistributedBackend.camera.error import UnreachableCameraError, \
+    CorruptedFrameError, EndOfStreamError
+from CAM2DistributedBackend.util.error_policy import ErrorPolicy
+from CAM2DistributedBackend.util.frame_batch import FrameBatch
+from CAM2DistributedBackend.util.frame_handoff import AnalyzerProcess
+from CAM2DistributedBackend.util.image_encoder import ImageEncoder
+from CAM2DistributedBackend.util.profiler import Profiler
+from CAM2DistributedBackend.util.scheduler import FrameScheduler, monotonic
+from CAM2DistributedBackend.util.storage_client import StorageClient
+from CAM2DistributedBackend.util.upload_queue import Uploader, \
+    get_upload_queue
+import constants
+
+# The statuses of a task.
+STATUS_RUNNING = 'running'
+STATUS_COMPLETED = 'completed'
+STATUS_UNREACHABLE = 'unreachable'
+STATUS_GAVE_UP = 'gave_up'
+STATUS_ANALYZER_FAILED = 'analyzer_failed'
+
+# The pool of threads decoding frames, shared by all the pipelined tasks of
+# the executor process.
+_decode_pool = None
+_decode_pool_pid = None
+_decode_pool_lock = threading.Lock()
+
+
+class CameraTask(object):
+
+    """Represent the analysis of a single camera.
+
+    This class represents the analysis of a single camera. It initializes the
+    submitted analyzers and the camera stream, fetches the frames of the
+    camera, and passes them to the analyzers. Fetching and analyzing a frame
+    are separate steps so that they can run on different threads. If the
+    request has more than one analysis class, every frame is fetched and
+    decoded once, and passed to an analyzer of every class, every analyzer
+    after the first getting its own copy of the frame.
+
+    Attributes
+    ----------
+    camera : `Camera`
+        The camera to be analyzed.
+    request : `Request`
+        The request to which the analysis belongs.
+    analyzers : list of `Analyzer`
+        The instances of the submitted analysis classes.
+    analyzer : `Analyzer`
+        The instance of the first submitted analysis class.
+    camera_metadata : `CameraMetadata`
+        The metadata of the camera.
+    sequence_num : int
+        The sequence number of the next frame.
+    status : str
+        The status of the task. This is one of the `STATUS_*` constants of
+        this module.
+    frames_analyzed : int
+        The number of frames passed to the analyzer.
+    frames_dropped : int
+        The number of frames dropped because the analyzer was behind.
+    error_policy : `ErrorPolicy`
+        The reaction policy to the corrupted frames of the camera.
+    batch : `FrameBatch`
+        The frames waiting to be analyzed as a batch, or None if the frames
+        are analyzed one at a time.
+    profiler : `Profiler`
+        The measurements of the time spent in the stages of the analysis.
+    scheduler : `FrameScheduler`
+        The schedule of the frames of the camera, or None before the
+        analysis loop starts.
+    uploader : `Uploader`
+        The results of the camera waiting to be uploaded, or None if the
+        results are uploaded as they are saved.
+    uploads_failed : int
+        The number of results whose upload has failed.
+    uploads_dropped : int
+        The number of results dropped because too many results were waiting
+        to be uploaded.
+
+    Methods
+    -------
+    start(self, analyzers=None)
+        Initialize the analyzers and open the camera stream.
+    start_analyzer(self, analyzers=None)
+        Initialize the analyzers.
+    open_camera(self)
+        Open the camera stream.
+    schedule(self, duration, interval)
+        Start the schedule of the frames of the camera.
+    fetch(self)
+        Fetch the next frame to be analyzed.
+    handle_corrupted_frame(self)
+        React to a corrupted frame according to the error policy.
+    record_decode(self, decoded)
+        Record whether a fetched frame has been decoded.
+    analyze(self, frame, frame_metadata)
+        Pass a frame to the analyzers.
+    poll_batch(self)
+        Pass the waiting batch of frames to the analyzers if it is due.
+    finish(self)
+        Close the camera stream and finalize the analyzers.
+    close_camera(self)
+        Close the camera stream.
+    finish_analyzer(self)
+        Finalize the analyzers.
+    flush_uploads(self)
+        Wait until the results waiting to be uploaded are uploaded.
+    close_storage(self)
+        Upload the waiting results, and close the storage clients.
+    summary(self)
+        Summarize the analysis of the camera.
+
+    """
+
+    def __init__(self, camera, request, namenode_url, username,
+                 submission_id, analyzer_file):
+
+        """Initialize a `CameraTask` instance.
+
+        Parameters
+        ----------
+        camera : `Camera`
+            The camera to be analyzed.
+        request : `Request`
+            The request to which the analysis belongs.
+        namenode_url : str
+            The URL of the HDFS namenode used to save the results.
+        username : str
+            The name of the user who made the submission.
+        submission_id : str
+            The ID of the submission.
+        analyzer_file : str or list of str
+            The file name of the submitted analysis program, or the file
+            names of the submitted analysis programs.
+
+        """
+
+        self.camera = camera
+        self.request = request
+        self.analyzers = []
+        self.camera_metadata = None
+        self.sequence_num = 0
+        self.status = STATUS_RUNNING
+        self.frames_analyzed = 0
+        self.frames_dropped = 0
+        self.error_policy = ErrorPolicy(
+            request.max_corrupted_frames, request.backoff_initial,
+            request.backoff_max, request.restart_after_failures,
+            request.give_up_after_failures)
+
+        # Whether every fetched frame has been decoded, recorded after it is
+        # fetched, and not passed to the error policy yet.
+        self._decode_results = collections.deque()
+        if request.batch_size > 1:
+            self.batch = FrameBatch(request.batch_size,
+                                    request.batch_max_wait)
+        else:
+            self.batch = None
+        self.profiler = Profiler(request.profile_callbacks, request.profile)
+        self.scheduler = None
+        self.uploader = None
+        self.uploads_failed = 0
+        self.uploads_dropped = 0
+
+        self._storage_client = None
+        self._storage_clients = []
+        self._namenode_url = namenode_url
+        self._username = username
+        self._submission_id = submission_id
+        self._analyzer_file = analyzer_file
+        self._shared_analyzer = False
+
+    @property
+    def analyzer(self):
+
+        """Get the instance of the first submitted analysis class.
+
+        Returns
+        -------
+        `Analyzer`
+            The first analyzer, or None if the analyzers are not initialized.
+
+        """
+
+        return self.analyzers[0] if self.analyzers else None
+
+    def start(self, analyzers=None):
+
+        """Initialize the analyzers and open the camera stream.
+
+        Parameters
+        ----------
+        analyzers : list of `Analyzer`, optional
+            The analyzers shared by the cameras of a partition (see
+            `start_analyzer`).
+
+        Raises
+        ------
+        UnreachableCameraError
+            If the camera is unreachable.
+
+        """
+
+        self.start_analyzer(analyzers)
+        self.open_camera()
+
+    def start_analyzer(self, analyzers=None):
+
+        """Initialize the analyzers.
+
+        Parameters
+        ----------
+        analyzers : list of `Analyzer`, optional
+            The analyzers shared by the cameras of a partition (see
+            `run_partition`). The results of the camera are routed to its own
+            storage, and the shared analyzers are neither initialized nor
+            finalized by the task. By default, the task creates and
+            initializes an analyzer of every analysis class of the request.
+
+        """
+
+        # Initialize a storage client for the camera, and one for every
+        # analysis class if there are many of them. The results are queued
+        # to be uploaded in the background if the request sets
+        # `upload_workers`.
+        self._storage_client = self._create_storage_client()
+        if len(self.request.analysis_classes) == 1:
+            self._storage_clients = [self._storage_client]
+        else:
+            self._storage_clients = [
+                self._create_storage_client(analysis_class)
+                for analysis_class in self.request.analysis_classes]
+        saves = [storage_client.save
+                 for storage_client in self._storage_clients]
+        if self.request.upload_workers:
+            self.uploader = Uploader(
+                get_upload_queue(self.request.upload_workers,
+                                 self.request.upload_queue_size),
+                self.request.upload_overflow, self.profiler)
+            saves = [self.uploader.wrap(save) for save in saves]
+
+        # Initialize the analyzers.
+        if analyzers is None:
+            for analysis_class, save in zip(self.request.analysis_classes,
+                                            saves):
+                analyzer = create_analyzer(self._analyzer_file,
+                                           analysis_class)
+                analyzer._save = save
+                analyzer._profiler = self.profiler
+                self.analyzers.append(analyzer)
+            self._call_handlers('initialize')
+        else:
+            self.analyzers = analyzers
+            for analyzer, save in zip(analyzers, saves):
+                analyzer._saves[self.camera.id] = save
+            self._shared_analyzer = True
+
+    def open_camera(self):
+
+        """Open the camera stream.
+
+        Raises
+        ------
+        UnreachableCameraError
+            If the camera is unreachable.
+
+        """
+
+        # Fetch the frames through the stream server of the worker if it is
+        # running.
+        if self.request.shared_streams:
+            address = shared_stream.get_address()
+            if shared_stream.is_running(address):
+                self.camera.set_stream_server(address)
+
+        # Initialize the camera.
+        if self.request.is_video:
+            stream_format = StreamFormat.MJPEG
+        else:
+            stream_format = StreamFormat.IMAGE
+        self.camera.open_stream(stream_format, self.request.latest_frame_only)
+
+        # Set up initial metadata.
+        self.camera_metadata = CameraMetadata(
+            self.camera.id, self.camera.latitude, self.camera.longitude)
+
+    def schedule(self, duration, interval):
+
+        """Start the schedule of the frames of the camera.
+
+        The frames are scheduled according to the overrun policy of the
+        request, and the lateness of every frame and the missed intervals are
+        measured by the profiler of the task.
+
+        Parameters
+        ----------
+        duration : float
+            The total analysis duration in seconds.
+        interval : float
+            The interval between analyzing every two successive frames in
+            seconds.
+
+        Returns
+        -------
+        `FrameScheduler`
+            The schedule, which is also set as the `scheduler` attribute.
+
+        """
+
+        self.scheduler = FrameScheduler(interval, duration,
+                                        self.request.overrun_policy,
+                                        self.profiler)
+        return self.scheduler
+
+    def fetch(self):
+
+        """Fetch the next frame to be analyzed.
+
+        The frames whose decoding has been recorded since the last call (see
+        `record_decode`) are passed to the error policy first. If one of them
+        has turned out corrupted, it is reported as a corrupted frame instead
+        of fetching the next frame.
+
+        Returns
+        -------
+        tuple
+            The frame, kept compressed until the analyzer accesses it, and its
+            `FrameMetadata`, or None if the frame is a duplicate that should
+            not be analyzed, or if the camera has no more frames. In the
+            latter case, the status of the task is set to `STATUS_COMPLETED`.
+
+        Raises
+        ------
+        CorruptedFrameError
+            If the frame is corrupted, or if a frame fetched earlier has
+            turned out corrupted when it has been decoded.
+        UnreachableCameraError
+            If the camera is unreachable.
+
+        """
+
+        while self._decode_results:
+            if not self._decode_results.popleft():
+                raise CorruptedFrameError
+            self.error_policy.record_success()
+
+        fetch_time = monotonic()
+        try:
+            frame, frame_size = self.camera.get_frame(decode=False)
+        except EndOfStreamError:
+            # The camera has no more frames (e.g. a recorded camera whose
+            # frames have all been replayed).
+            self.status = STATUS_COMPLETED
+            return None
+        fetch_latency = monotonic() - fetch_time
+        self.profiler.record('fetch', fetch_latency)
+
+        is_duplicate = self.camera.parser.frame_unchanged
+        if is_duplicate and self.request.duplicate_frames == \
+                constants.DUPLICATE_FRAMES_SKIP:
+            return None
+
+        # Use the time at which the frame has been captured if it is known.
+        timestamp = self.camera.parser.frame_timestamp
+        if timestamp is None:
+            timestamp = time.time()
+
+        # Record when the frame has been scheduled, if it has been.
+        scheduled_time = lateness = None
+        if self.scheduler is not None:
+            scheduled_time = self.scheduler.scheduled_time
+            lateness = self.scheduler.lateness
+
+        frame_metadata = FrameMetadata(
+            self.camera_metadata, self.sequence_num, timestamp,
+            self.camera.parser.frame_age, is_duplicate, frame_size,
+            fetch_latency, scheduled_time, lateness)
+        self.sequence_num += 1
+        return frame, frame_metadata
+
+    def handle_corrupted_frame(self):
+
+        """React to a corrupted frame according to the error policy.
+
+        This method restarts the camera stream, or gives up on the camera by
+        setting the status of the task to `STATUS_GAVE_UP`, as decided by the
+        error policy.
+
+        Returns
+        -------
+        float
+            The time to wait before fetching the next frame in seconds.
+
+        Raises
+        ------
+        UnreachableCameraError
+            If the camera is unreachable when its stream is restarted.
+
+        """
+
+        delay, restart = self.error_policy.record_failure()
+        if self.error_policy.gave_up:
+            self.status = STATUS_GAVE_UP
+        elif restart:
+            self.camera.restart_stream()
+        return delay
+
+    def record_decode(self, decoded):
+
+        """Record whether a fetched frame has been decoded.
+
+        The frames are decoded after they are fetched, when the analyzer
+        accesses them, possibly on another thread. Their decoding is passed
+        to the error policy by the next call of `fetch`, so that the error
+        policy reacts to the frames that turn out corrupted where the frames
+        are fetched.
+
+        Parameters
+        ----------
+        decoded : bool
+            Whether the frame has been decoded (or analyzed without decoding
+            it), rather than turned out corrupted.
+
+        """
+
+        self._decode_results.append(decoded)
+
+    def analyze(self, frame, frame_metadata):
+
+        """Pass a frame to the analyzers.
+
+        If the frames are analyzed in batches, the frame is added to the
+        waiting batch, which is passed to the analyzers once it is due. A
+        frame of another shape than the frames of the waiting batch starts a
+        new batch, once the waiting batch is passed to the analyzers. If
+        there are many analyzers, the frame is decoded once, and every
+        analyzer after the first gets its own copy of the frame, so that an
+        analyzer modifying its frame in place (e.g. drawing on it) does not
+        change the frame of the others.
+
+        Parameters
+        ----------
+        frame : numpy.ndarray or `EncodedFrame`
+            The frame to be analyzed.
+        frame_metadata : `FrameMetadata`
+            The metadata of the frame.
+
+        """
+
+        analyzer_frames = [frame]
+        if len(self.analyzers) > 1:
+            if isinstance(frame, EncodedFrame) and not _decode_frame(frame):
+                # Skip the frames that turn out corrupted when decoded.
+                self.record_decode(False)
+                return
+            analyzer_frames.extend(_copy_frame(frame)
+                                   for _ in self.analyzers[1:])
+
+        if self.batch is not None and not self.batch.fits(frame):
+            # Pass the waiting batch before the frame is added to the frame
+            # histories, so that its last frame is still the most recent.
+            self._analyze_batch()
+
+        for analyzer, analyzer_frame in zip(self.analyzers, analyzer_frames):
+            analyzer._add_frame(analyzer_frame, frame_metadata,
+                                self.request.snapshots_to_keep,
+                                self.request.metadata_to_keep)
+        if self.batch is not None:
+            self.batch.add(frame, frame_metadata)
+            self.poll_batch()
+            return
+
+        self.frames_analyzed += 1
+        try:
+            self._call_handlers('on_new_frame')
+        except CorruptedFrameError:
+            # The frame turned out corrupted when the analyzer decoded it.
+            self.record_decode(False)
+        else:
+            self.record_decode(True)
+
+    def poll_batch(self):
+
+        """Pass the waiting batch of frames to the analyzers if it is due.
+
+        The batch is due once it is full, or once its first frame has waited
+        for `batch_max_wait` seconds.
+
+        """
+
+        if self.batch is not None and self.batch.is_due():
+            self._analyze_batch()
+
+    def _create_storage_client(self, namespace=None):
+
+        """Create a storage client for the results of the camera.
+
+        Parameters
+        ----------
+        namespace : str, optional
+            The subdirectory of the results of the camera in which the
+            results are saved (see `StorageClient`).
+
+        Returns
+        -------
+        `StorageClient`
+            The storage client.
+
+        """
+
+        encoder = ImageEncoder(self.request.image_format,
+                               self.request.jpeg_quality,
+                               self.request.png_compression,
+                               self.request.webp_quality,
+                               self.request.image_scale)
+        return StorageClient(self._namenode_url, self._username,
+                             self._submission_id, self.camera.id, namespace,
+                             self.request.pack_results,
+                             self.request.pack_max_size,
+                             self.request.pack_max_age, encoder)
+
+    def _analyze_batch(self):
+
+        """Pass the waiting batch of frames to the analyzers.
+
+        """
+
+        frames, frames_metadata = self.batch.take()
+        for decoded in self.batch.decode_results:
+            self.record_decode(decoded)
+        if frames is None:
+            # All the frames turned out corrupted when they were decoded.
+            return
+        self.frames_analyzed += len(frames)
+        self._call_handlers('on_new_batch', frames, frames_metadata)
+
+    def _call_handlers(self, handler, *args):
+
+        """Call an event handler of every analyzer.
+
+        Parameters
+        ----------
+        handler : str
+            The name of the event handler.
+        *args
+            The arguments of the event handler.
+
+        """
+
+        _call_handlers(self.profiler, self.analyzers, handler, *args)
+
+    def finish(self):
+
+        """Close the camera stream and finalize the analyzers.
+
+        """
+
+        self.close_camera()
+        self.finish_analyzer()
+        if self.status == STATUS_RUNNING:
+            self.status = STATUS_COMPLETED
+
+    def close_camera(self):
+
+        """Close the camera stream.
+
+        """
+
+        self.camera.close_stream()
+
+    def finish_analyzer(self):
+
+        """Finalize the analyzers.
+
+        A batch of frames that is still waiting is passed to the analyzers
+        before finalizing them. The analyzers shared by the cameras of a
+        partition are not finalized. The results waiting to be uploaded are
+        uploaded, and the measurements of the profiler are saved with the
+        results of the camera if the request sets `profile`.
+
+        """
+
+        if self.batch is not None and len(self.batch):
+            self._analyze_batch()
+        if not self._shared_analyzer:
+            self._call_handlers('finalize')
+        self.flush_uploads()
+        if self.request.profile:
+            for storage_client in set(self._storage_clients +
+                                      [self._storage_client]):
+                self.profiler.count_images(storage_client.encoder.counts)
+            self.profiler.save(self._storage_client.save)
+        self.close_storage()
+
+    def flush_uploads(self):
+
+        """Wait until the results waiting to be uploaded are uploaded.
+
+        This is called however the analysis of the camera ends, so that the
+        results saved before an error are not lost, and the numbers of failed
+        and dropped uploads are updated.
+
+        """
+
+        if self.uploader is None:
+            return
+        self.uploader.flush()
+        if self.uploader.failed > self.uploads_failed:
+            print 'Failed uploads of camera(id:{}): {}, the last ' \
+                'with {}'.format(self.camera.id, self.uploader.failed,
+                                 self.uploader.last_error)
+        self.uploads_failed = self.uploader.failed
+        self.uploads_dropped = self.uploader.dropped
+
+    def close_storage(self):
+
+        """Upload the waiting results, and close the storage clients.
+
+        This is called however the analysis of the camera ends, so that the
+        packed results are indexed and the saved results are stored. The
+        storage clients are closed only once.
+
+        """
+
+        self.flush_uploads()
+        storage_clients = set(self._storage_clients + [self._storage_client])
+        storage_clients.discard(None)
+        self._storage_client = None
+        self._storage_clients = []
+        for storage_client in storage_clients:
+            storage_client.close()
+
+    def summary(self):
+
+        """Summarize the analysis of the camera.
+
+        Returns
+        -------
+        dict
+            The camera ID, the status of the task, and the numbers of analyzed
+            frames, dropped frames, corrupted frames, stream restarts, failed
+            uploads, and dropped uploads.
+
+        """
+
+        # Count the frames that have turned out corrupted after the last
+        # fetch.
+        while self._decode_results:
+            if self._decode_results.popleft():
+                self.error_policy.record_success()
+            else:
+                self.error_policy.record_failure()
+
+        return {
+            'camera_id': self.camera.id,
+            'status': self.status,
+            'frames': self.frames_analyzed,
+            'dropped_frames': self.frames_dropped,
+            'corrupted_frames': self.error_policy.failures,
+            'restarts': self.error_policy.restarts,
+            'failed_uploads': self.uploads_failed,
+            'dropped_uploads': self.uploads_dropped,
+        }
+
+
+def _call_handlers(profiler, analyzers, handler, *args):
+
+    """Call an event handler of every analyzer.
+
+    The time spent in the event handler is measured by the profiler for every
+    analysis class separately if there are many of them. Every analyzer after
+    the first gets its own copy of the frames passed to the event handler,
+    made before any event handler is called.
+
+    Parameters
+    ----------
+    profiler : `Profiler`
+        The profiler measuring the event handler.
+    analyzers : list of `Analyzer`
+        The analyzers.
+    handler : str
+        The name of the event handler.
+    *args
+        The arguments of the event handler.
+
+    """
+
+    analyzer_args = [args]
+    analyzer_args.extend(tuple(_copy_frame(arg) for arg in args)
+                         for _ in analyzers[1:])
+    for analyzer, args in zip(analyzers, analyzer_args):
+        if len(analyzers) == 1:
+            stage = handler
+        else:
+            stage = '{}.{}'.format(type(analyzer).__name__, handler)
+        profiler.call_handler(stage, getattr(analyzer, handler), *args)
+
+
+def _copy_frame(frame):
+
+    """Copy a frame, so that an analyzer can modify it in place.
+
+    Parameters
+    ----------
+    frame : numpy.ndarray, `EncodedFrame`, or list
+        The frame, the frames (e.g. of a batch), or a list of frames. Any
+        other value (e.g. the metadata of a frame) is not copied.
+
+    Returns
+    -------
+    numpy.ndarray, `EncodedFrame`, or list
+        The copy of the frame.
+
+    """
+
+    if isinstance(frame, list):
+        return [_copy_frame(item) for item in frame]
+    if isinstance(frame, (np.ndarray, EncodedFrame)):
+        return frame.copy()
+    return frame
+
+
+def _abort_unreachable(task):
+
+    """Abort the analysis of an unreachable camera.
+
+    Parameters
+    ----------
+    task : `CameraTask`
+        The analysis of the unreachable camera.
+
+    """
+
+    task.status = STATUS_UNREACHABLE
+    print 'Unreachable camera(id:{}): stream aborted!'.format(task.camera.id)
+
+
+def run_camera(task, duration, interval):
+
+    """Run the analysis of a single camera in the calling thread.
+
+    Parameters
+    ----------
+    task : `CameraTask`
+        The analysis of the camera.
+    duration : float
+        The total analysis duration in seconds.
+    interval : float
+        The interval between analyzing every two successive frames in seconds.
+
+    Returns
+    -------
+    dict
+        The summary of the analysis of the camera.
+
+    """
+
+    try:
+        task.start()
+
+        # Analysis loop
+        scheduler = task.schedule(duration, interval)
+        while scheduler.wait():
+            scheduler.start_frame()
+            delay = 0
+            try:
+                fetched = task.fetch()
+            except CorruptedFrameError:
+                fetched = None
+                delay = task.handle_corrupted_frame()
+            if task.status != STATUS_RUNNING:
+                break
+            if fetched is not None:
+                task.analyze(*fetched)
+            else:
+                task.poll_batch()
+            scheduler.end_frame(delay)
+
+        # NOTE May move these statements outside the `try` block
+        # Finalize
+        task.finish()
+    except UnreachableCameraError:
+        _abort_unreachable(task)
+    finally:
+        task.close_storage()
+
+    return task.summary()
+
+
+def _get_decode_pool(threads):
+
+    """Get the pool of threads decoding frames in the executor process.
+
+    Parameters
+    ----------
+    threads : int
+        The number of threads of the pool, if it has to be created.
+
+    Returns
+    -------
+    multiprocessing.pool.ThreadPool
+        The pool of threads decoding frames.
+
+    """
+
+    global _decode_pool, _decode_pool_pid
+    with _decode_pool_lock:
+        if _decode_pool is None or _decode_pool_pid != os.getpid():
+            _decode_pool = ThreadPool(threads)
+            _decode_pool_pid = os.getpid()
+        return _decode_pool
+
+
+def _decode_frame(frame):
+
+    """Decode a frame, ignoring the frames that turn out corrupted.
+
+    Parameters
+    ----------
+    frame : `EncodedFrame`
+        The frame to be decoded.
+
+    Returns
+    -------
+    bool
+        Whether the frame has been decoded.
+
+    """
+
+    try:
+        frame.decode()
+    except CorruptedFrameError:
+        return False
+    return True
+
+
+def run_camera_pipelined(task, duration, interval, depth=2,
+                         decode_threads=2):
+
+    """Run the analysis of a single camera as a pipeline of stages.
+
+    This function runs the analysis of a single camera as three overlapping
+    stages: fetching the frames on a separate thread, decoding them on a pool
+    of threads shared by all the pipelined tasks of the executor process,
+    and analyzing them on the calling thread. While the analyzer works on a
+    frame, the next frames are already being downloaded and decoded. Decoding
+    and most OpenCV functions release the GIL, so the stages run in parallel.
+
+    Parameters
+    ----------
+    task : `CameraTask`
+        The analysis of the camera.
+    duration : float
+        The total analysis duration in seconds.
+    interval : float
+        The interval between analyzing every two successive frames in seconds.
+    depth : int, optional
+        The maximum number of frames fetched ahead of the analyzer. The
+        fetching stage waits for the analyzer once that many frames are
+        waiting to be analyzed.
+    decode_threads : int, optional
+        The number of threads decoding frames, if the pool of the executor
+        process has to be created.
+
+    Returns
+    -------
+    dict
+        The summary of the analysis of the camera.
+
+    """
+
+    try:
+        task.start()
+    except UnreachableCameraError:
+        _abort_unreachable(task)
+        task.close_storage()
+        return task.summary()
+
+    decode_pool = _get_decode_pool(decode_threads)
+
+    # The frames are passed from the fetching stage to the analyzing stage as
+    # (frame, frame metadata, decode result) tuples, in order. The end of the
+    # frames is marked by a (None, None, exc_info) tuple.
+    frames_queue = Queue.Queue(depth)
+    stopped = threading.Event()
+
+    def fetch_frames():
+        exc_info = None
+        try:
+            scheduler = task.schedule(duration, interval)
+            while not stopped.is_set() and scheduler.wait():
+                scheduler.start_frame()
+                delay = 0
+                try:
+                    fetched = task.fetch()
+                except CorruptedFrameError:
+                    fetched = None
+                    delay = task.handle_corrupted_frame()
+                if task.status != STATUS_RUNNING:
+                    break
+                if fetched is not None:
+                    frame, frame_metadata = fetched
+                    result = decode_pool.apply_async(_decode_frame, (frame,))
+                    frames_queue.put((frame, frame_metadata, result))
+                scheduler.end_frame(delay)
+        except UnreachableCameraError:
+            _abort_unreachable(task)
+        except Exception:
+            exc_info = sys.exc_info()
+        frames_queue.put((None, None, exc_info))
+
+    fetch_thread = threading.Thread(target=fetch_frames)
+    fetch_thread.daemon = True
+    fetch_thread.start()
+
+    # Wake up to check whether a batch of frames has waited long enough, if
+    # the frames are analyzed in batches.
+    timeout = task.batch.max_wait if task.batch is not None else None
+
+    try:
+        try:
+            while True:
+                try:
+                    frame, frame_metadata, result = frames_queue.get(
+                        True, timeout)
+                except Queue.Empty:
+                    task.poll_batch()
+                    continue
+                if frame is None:
+                    if result is not None:
+                        raise result[0], result[1], result[2]
+                    break
+                # Skip the frames that turned out corrupted when decoded.
+                if result.get():
+                    task.analyze(frame, frame_metadata)
+                else:
+                    task.record_decode(False)
+        finally:
+            # Unblock the fetching stage if the analyzer failed.
+            stopped.set()
+            while fetch_thread.is_alive():
+                try:
+                    frames_queue.get(True, 0.1)
+                except Queue.Empty:
+                    pass
+
+        # Finalize
+        if task.status != STATUS_UNREACHABLE:
+            task.finish()
+    finally:
+        task.close_storage()
+
+    return task.summary()
+
+
+def run_cameras(tasks, duration, interval, fetch_threads=None,
+                analysis_threads=1):
+
+    """Run the analysis of a group of cameras at the same time.
+
+    This function runs the analysis of a group of cameras in a single Spark
+    task. Frames are fetched by a pool of threads, which spend most of their
+    time waiting for the network, and analyzed by a smaller pool of threads.
+    Every camera is fetched at its own pace, and at most one of its frames is
+    being fetched or analyzed at any time, so that its frames are analyzed in
+    order and its analyzer is never called from two threads at once.
+
+    Parameters
+    ----------
+    tasks : list of `CameraTask`
+        The analyses of the cameras.
+    duration : float
+        The total analysis duration in seconds.
+    interval : float
+        The interval between analyzing every two successive frames of a
+        camera in seconds.
+    fetch_threads : int, optional
+        The number of threads fetching frames. By default, there is one
+        thread per camera.
+    analysis_threads : int, optional
+        The number of threads analyzing frames.
+
+    Returns
+    -------
+    list of dict
+        The summaries of the analyses of the cameras.
+
+    """
+
+    # Start the tasks of the reachable cameras.
+    started_tasks = []
+    for task in tasks:
+        try:
+            task.start()
+            started_tasks.append(task)
+        except UnreachableCameraError:
+            _abort_unreachable(task)
+    if not started_tasks:
+        for task in tasks:
+            task.close_storage()
+        return [task.summary() for task in tasks]
+
+    # Every finished step is reported through `done_queue` as a (task,
+    # keep_task, delay, exc_info) tuple.
+    fetch_queue = Queue.Queue()
+    analysis_queue = Queue.Queue()
+    done_queue = Queue.Queue()
+
+    def fetch_frames():
+        while True:
+            task = fetch_queue.get()
+            if task is None:
+                return
+            delay = 0
+            try:
+                try:
+                    fetched = task.fetch()
+                except CorruptedFrameError:
+                    fetched = None
+                    delay = task.handle_corrupted_frame()
+            except UnreachableCameraError:
+                _abort_unreachable(task)
+                done_queue.put((task, False, 0, None))
+                continue
+            except Exception:
+                done_queue.put((task, False, 0, sys.exc_info()))
+                continue
+            if fetched is None and (task.batch is None or
+                                    not len(task.batch)):
+                done_queue.put(
+                    (task, task.status == STATUS_RUNNING, delay, None))
+            else:
+                # A waiting batch of frames may be due even without a new
+                # frame.
+                analysis_queue.put((task, fetched, delay))
+
+    def analyze_frames():
+        while True:
+            item = analysis_queue.get()
+            if item is None:
+                return
+            task, fetched, delay = item
+            try:
+                if fetched is not None:
+                    task.analyze(*fetched)
+                else:
+                    task.poll_batch()
+            except Exception:
+                done_queue.put((task, False, 0, sys.exc_info()))
+                continue
+            done_queue.put((task, task.status == STATUS_RUNNING, delay, None))
+
+    threads = []
+    for _ in range(fetch_threads or len(started_tasks)):
+        threads.append(threading.Thread(target=fetch_frames))
+    for _ in range(analysis_threads):
+        threads.append(threading.Thread(target=analyze_frames))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        try:
+            # The schedule holds a (deadline, index, task) tuple for every
+            # task that is waiting for its next frame before the end of the
+            # analysis duration.
+            schedule = []
+            indexes = {}
+            for index, task in enumerate(started_tasks):
+                scheduler = task.schedule(duration, interval)
+                if scheduler.deadline < scheduler.end_time:
+                    schedule.append((scheduler.deadline, index, task))
+                indexes[task] = index
+            in_progress = 0
+
+            while True:
+                # Fetch the frames of the tasks that are due.
+                now = monotonic()
+                while schedule and schedule[0][0] <= now:
+                    _, _, task = heapq.heappop(schedule)
+                    task.scheduler.start_frame()
+                    fetch_queue.put(task)
+                    in_progress += 1
+
+                if not schedule:
+                    if not in_progress:
+                        break
+                    timeout = None
+                else:
+                    timeout = schedule[0][0] - now
+
+                # Wait for a step to finish or for the next task to be due.
+                try:
+                    task, keep_task, delay, exc_info = done_queue.get(
+                        True, timeout)
+                except Queue.Empty:
+                    continue
+                in_progress -= 1
+
+                if exc_info is not None:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                if not keep_task:
+                    continue
+
+                # Back off after a corrupted frame as decided by the error
+                # policy.
+                scheduler = task.scheduler
+                scheduler.end_frame(delay)
+                if scheduler.deadline < scheduler.end_time:
+                    heapq.heappush(
+                        schedule, (scheduler.deadline, indexes[task], task))
+        finally:
+            for _ in threads:
+                fetch_queue.put(None)
+                analysis_queue.put(None)
+
+        # Finalize
+        for task in started_tasks:
+            if task.status != STATUS_UNREACHABLE:
+                task.finish()
+    finally:
+        for task in tasks:
+            task.close_storage()
+
+    return [task.summary() for task in tasks]
+
+
+def create_analyzer(analyzer_file, analysis_class):
+
+    """Create an instance of the submitted analysis class.
+
+    Parameters
+    ----------
+    analyzer_file : str or list of str
+        The file name of the submitted analysis program, or the file names of
+        the submitted analysis programs, which are searched in order for the
+        analysis class.
+    analysis_class : str
+        The name of the analysis class in the program.
+
+    Returns
+    -------
+    `Analyzer`
+        The new, uninitialized, analyzer.
+
+    Raises
+    ------
+    ValueError
+        If none of the programs has the analysis class.
+
+    """
+
+    if isinstance(analyzer_file, basestring):
+        analyzer_file = [analyzer_file]
+    for file_name in analyzer_file:
+        module = importlib.import_module(
+            os.path.splitext(os.path.basename(file_name))[0])
+        if hasattr(module, analysis_class):
+            return getattr(module, analysis_class)()
+    raise ValueError('The analysis class {} is not in the submitted '
+                     'analysis programs.'.format(analysis_class))
+
+
+def _fetch_decoded(task):
+
+    """Fetch and decode the next frame of a camera of a partition.
+
+    Parameters
+    ----------
+    task : `CameraTask`
+        The analysis of the camera.
+
+    Returns
+    -------
+    fetched : tuple
+        The decoded frame and its `FrameMetadata`, or None if there is no
+        frame to be analyzed.
+    delay : float
+        The time to wait before fetching the next frame of the camera in
+        seconds.
+
+    """
+
+    try:
+        try:
+            fetched = task.fetch()
+        except CorruptedFrameError:
+            return None, task.handle_corrupted_frame()
+    except UnreachableCameraError:
+        _abort_unreachable(task)
+        return None, 0
+    if fetched is None:
+        return None, 0
+
+    # Decode the frame on the fetching thread, so that the frames of the
+    # cameras are decoded in parallel.
+    frame, frame_metadata = fetched
+    if not _decode_frame(frame):
+        return None, task.handle_corrupted_frame()
+    task.error_policy.record_success()
+    return (frame.image, frame_metadata), 0
+
+
+def run_partition(tasks, analyzers, duration, interval, fetch_threads=None):
+
+    """Run the analysis of a group of cameras sharing a single analyzer.
+
+    This function runs the analysis of a group of cameras in a single Spark
+    task with a single analyzer of every analysis class. Every interval, the
+    next frame of every camera is fetched and decoded by a pool of threads,
+    and the frames of all the cameras are passed together to the
+    `on_new_frames` method of the analyzers, so that their analysis costs a
+    single call. A camera backing off after a corrupted frame misses the
+    intervals until it is due again.
+
+    Parameters
+    ----------
+    tasks : list of `CameraTask`
+        The analyses of the cameras.
+    analyzers : list of `Analyzer`
+        The analyzers shared by the cameras, one of every analysis class of
+        the request (see `create_analyzer`).
+    duration : float
+        The total analysis duration in seconds.
+    interval : float
+        The interval between analyzing every two successive groups of frames
+        in seconds.
+    fetch_threads : int, optional
+        The number of threads fetching frames. By default, there is one
+        thread per camera.
+
+    Returns
+    -------
+    list of dict
+        The summaries of the analyses of the cameras.
+
+    """
+
+    # Start the tasks of the reachable cameras, registering the storage of
+    # every camera with the analyzers.
+    for analyzer in analyzers:
+        analyzer._saves = {}
+    started_tasks = []
+    for task in tasks:
+        try:
+            task.start(analyzers)
+            started_tasks.append(task)
+        except UnreachableCameraError:
+            _abort_unreachable(task)
+    if not started_tasks:
+        for task in tasks:
+            task.close_storage()
+        return [task.summary() for task in tasks]
+
+    # The stages of the shared analyzers are measured by a profiler of the
+    # partition, which is reported once, with the first camera.
+    request = started_tasks[0].request
+    profiler = Profiler(request.profile_callbacks, request.profile)
+    for analyzer in analyzers:
+        analyzer._profiler = profiler
+    fetch_pool = ThreadPool(fetch_threads or len(started_tasks))
+    try:
+        _call_handlers(profiler, analyzers, 'initialize')
+
+        # The cameras share the schedule of the partition, and every camera
+        # is due for its next frame once it is no longer backing off.
+        scheduler = FrameScheduler(interval, duration,
+                                   request.overrun_policy, profiler)
+        for task in started_tasks:
+            task.scheduler = scheduler
+        due_times = dict((task, 0) for task in started_tasks)
+
+        # Analysis loop
+        while scheduler.wait():
+            scheduler.start_frame()
+            register_time = monotonic()
+            running_tasks = [task for task in started_tasks
+                             if task.status == STATUS_RUNNING]
+            if not running_tasks:
+                break
+
+            # Wait for the cameras that are all backing off.
+            due_tasks = [task for task in running_tasks
+                         if due_times[task] <= register_time]
+            if not due_tasks:
+                scheduler.end_frame(
+                    min(due_times[task] for task in running_tasks) -
+                    register_time)
+                continue
+
+            frames = []
+            frames_metadata = []
+            results = fetch_pool.map(_fetch_decoded, due_tasks)
+            for task, (fetched, delay) in zip(due_tasks, results):
+                due_times[task] = monotonic() + delay
+                if fetched is not None:
+                    frames.append(fetched[0])
+                    frames_metadata.append(fetched[1])
+                    task.frames_analyzed += 1
+            if frames:
+                _call_handlers(profiler, analyzers, 'on_new_frames', frames,
+                               frames_metadata)
+
+            scheduler.end_frame()
+    finally:
+        fetch_pool.terminate()
+
+        # Finalize the analyzers and the cameras even if an analyzer has
+        # failed, so that the camera streams are closed and the results are
+        # saved.
+        try:
+            _call_handlers(profiler, analyzers, 'finalize')
+        finally:
+            finishing_tasks = [task for task in started_tasks
+                               if task.status != STATUS_UNREACHABLE]
+            if finishing_tasks:
+                finishing_tasks[0].profiler.merge(profiler)
+            try:
+                for task in finishing_tasks:
+                    task.finish()
+            finally:
+                for task in tasks:
+                    task.close_storage()
+
+    return [task.summary() for task in tasks]
+
+
+def run_camera_isolated(task, duration, interval, depth=2):
+
+    """Run the analysis of a camera with its analyzer in another process.
+
+    This function fetches and decodes the frames of a single camera in the
+    calling thread, and analyzes them in a child process (see
+    `AnalyzerProcess`). The decoded frames are passed through shared memory,
+    so they are not pickled. A slow analyzer does not delay the fetching of
+    the frames, which are dropped if the analyzer falls `depth` frames
+    behind, and an analyzer that raises an error or crashes ends the analysis
+    of the camera with `STATUS_ANALYZER_FAILED` rather than the Spark task.
+
+    Parameters
+    ----------
+    task : `CameraTask`
+        The analysis of the camera.
+    duration : float
+        The total analysis duration in seconds.
+    interval : float
+        The interval between fetching every two successive frames in seconds.
+    depth : int, optional
+        The maximum number of frames waiting to be analyzed.
+
+    Returns
+    -------
+    dict
+        The summary of the analysis of the camera.
+
+    """
+
+    # Start the analyzer process first, so that the analyzer is initialized
+    # while the camera stream is opened.
+    analyzer_process = AnalyzerProcess(task, depth)
+    analyzer_process.start()
+    try:
+        task.open_camera()
+
+        # Analysis loop
+        scheduler = task.schedule(duration, interval)
+        while analyzer_process.is_alive() and scheduler.wait():
+            scheduler.start_frame()
+            delay = 0
+            try:
+                fetched = task.fetch()
+            except CorruptedFrameError:
+                fetched = None
+                delay = task.handle_corrupted_frame()
+            if task.status != STATUS_RUNNING:
+                break
+            if fetched is not None:
+                frame, frame_metadata = fetched
+                # Skip the frames that turn out corrupted when decoded.
+                if not _decode_frame(frame):
+                    delay = task.handle_corrupted_frame()
+                    if task.status != STATUS_RUNNING:
+                        break
+                else:
+                    task.error_policy.record_success()
+                    if not analyzer_process.send(frame.image,
+                                                 frame_metadata):
+                        task.frames_dropped += 1
+            scheduler.end_frame(delay)
+
+        task.close_camera()
+    except UnreachableCameraError:
+        _abort_unreachable(task)
+    finally:
+        # Finalize
+        analyzer_process.stop()
+
+    if analyzer_process.error is not None:
+        task.status = STATUS_ANALYZER_FAILED
+        print 'Failed analyzer of camera(id:{}):\n{}'.format(
+            task.camera.id, analyzer_process.error)
+    elif task.status == STATUS_RUNNING:
+        task.status = STATUS_COMPLETED
+
+    return task.summary()
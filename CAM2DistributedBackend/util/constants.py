@@ -4,16 +4,62 @@ TIMESTAMP_ATTRIBUTE = 'timestamp'
 INTERVAL_ATTRIBUTE = 'interval'
 DURATION_ATTRIBUTE = 'duration'
 SNAPSHOTS_TO_KEEP_ATTRIBUTE = 'snapshots_to_keep'
+METADATA_TO_KEEP_ATTRIBUTE = 'metadata_to_keep'
 IS_VIDEO_ATTRIBUTE = 'is_video'
+LATEST_FRAME_ONLY_ATTRIBUTE = 'latest_frame_only'
+SHARED_STREAMS_ATTRIBUTE = 'shared_streams'
+DUPLICATE_FRAMES_ATTRIBUTE = 'duplicate_frames'
+DUPLICATE_FRAMES_FLAG = 'flag'
+DUPLICATE_FRAMES_SKIP = 'skip'
+OVERRUN_POLICY_ATTRIBUTE = 'overrun_policy'
+OVERRUN_POLICY_SKIP = 'skip'
+OVERRUN_POLICY_CATCH_UP = 'catch_up'
+OVERRUN_POLICY_ADAPT = 'adapt'
+DECODE_SCALE_ATTRIBUTE = 'decode_scale'
+DECODE_GRAYSCALE_ATTRIBUTE = 'decode_grayscale'
+CAMERAS_PER_TASK_ATTRIBUTE = 'cameras_per_task'
+FETCH_THREADS_ATTRIBUTE = 'fetch_threads'
+ANALYSIS_THREADS_ATTRIBUTE = 'analysis_threads'
+MAX_CORRUPTED_FRAMES_ATTRIBUTE = 'max_corrupted_frames'
+BACKOFF_INITIAL_ATTRIBUTE = 'backoff_initial'
+BACKOFF_MAX_ATTRIBUTE = 'backoff_max'
+RESTART_AFTER_FAILURES_ATTRIBUTE = 'restart_after_failures'
+GIVE_UP_AFTER_FAILURES_ATTRIBUTE = 'give_up_after_failures'
+PIPELINE_DEPTH_ATTRIBUTE = 'pipeline_depth'
+DECODE_THREADS_ATTRIBUTE = 'decode_threads'
+ANALYZER_PROCESS_ATTRIBUTE = 'analyzer_process'
+UPLOAD_WORKERS_ATTRIBUTE = 'upload_workers'
+UPLOAD_QUEUE_SIZE_ATTRIBUTE = 'upload_queue_size'
+UPLOAD_OVERFLOW_ATTRIBUTE = 'upload_overflow'
+UPLOAD_OVERFLOW_BLOCK = 'block'
+UPLOAD_OVERFLOW_DROP = 'drop'
+UPLOAD_OVERFLOW_INLINE = 'inline'
+PACK_RESULTS_ATTRIBUTE = 'pack_results'
+PACK_MAX_SIZE_ATTRIBUTE = 'pack_max_size'
+PACK_MAX_AGE_ATTRIBUTE = 'pack_max_age'
+IMAGE_FORMAT_ATTRIBUTE = 'image_format'
+JPEG_QUALITY_ATTRIBUTE = 'jpeg_quality'
+PNG_COMPRESSION_ATTRIBUTE = 'png_compression'
+WEBP_QUALITY_ATTRIBUTE = 'webp_quality'
+IMAGE_SCALE_ATTRIBUTE = 'image_scale'
+BATCH_SIZE_ATTRIBUTE = 'batch_size'
+BATCH_MAX_WAIT_ATTRIBUTE = 'batch_max_wait'
+PARTITION_BATCH_ATTRIBUTE = 'partition_batch'
+PROFILE_ATTRIBUTE = 'profile'
+PROFILE_CALLBACKS_ATTRIBUTE = 'profile_callbacks'
 CAMERAS_ATTRIBUTE = 'cameras'
 CAMERA_TYPE_ATTRIBUTE = 'type'
 CAMERA_TYPE_IP = 'ip'
 CAMERA_TYPE_NON_IP = 'non_ip'
+CAMERA_TYPE_REPLAY = 'replay'
 CAMERA_KEY_ATTRIBUTE = 'key'
 CAMERA_IP_ATTRIBUTE = 'ip'
 CAMERA_PORT_ATTRIBUTE = 'port'
 CAMERA_SNAPSHOT_PATH_ATTRIBUTE = 'snapshot_path'
 CAMERA_MJPG_PATH_ATTRIBUTE = 'mjpg_path'
 CAMERA_SNAPSHOT_URL_ATTRIBUTE = 'snapshot_url'
+CAMERA_FILE_ATTRIBUTE = 'file'
+CAMERA_REALTIME_ATTRIBUTE = 'realtime'
+CAMERA_LOOP_ATTRIBUTE = 'loop'
 CAMERA_LATITUDE_ATTRIBUTE = 'latitude'
 CAMERA_LONGITUDE_ATTRIBUTE = 'longitude'
@@ -0,0 +1,144 @@
+"""Provide a class deciding how to react to the failures of a camera.
+
+This module provides the `ErrorPolicy` class that keeps track of the
+corrupted frames of a single camera, and decides how long to wait before
+fetching the next frame, when to restart the camera stream, and when to give
+up on the camera altogether. This keeps a camera that returns garbage from
+keeping a core busy and hammering the remote host for the whole analysis.
+
+Class Listings
+--------------
+ErrorPolicy
+    Represent the reaction policy to the failures of a single camera.
+
+"""
+
+
+class ErrorPolicy(object):
+
+    """Represent the reaction policy to the failures of a single camera.
+
+    This class represents the reaction policy to the failures of a single
+    camera. After every failure, the camera waits for a delay that doubles
+    with every consecutive failure (exponential backoff). After a number of
+    consecutive failures, the camera stream is restarted. The policy gives up
+    on the camera (i.e. the circuit breaker opens) after too many
+    consecutive failures, or after too many failures overall (i.e. the error
+    budget is exhausted).
+
+    Attributes
+    ----------
+    max_failures : int
+        The maximum number of failures overall (the error budget), or None
+        for no limit.
+    backoff_initial : float
+        The delay after the first of consecutive failures in seconds.
+    backoff_max : float
+        The maximum delay after a failure in seconds.
+    restart_after : int
+        The number of consecutive failures after which the camera stream is
+        restarted, or None to never restart it.
+    give_up_after : int
+        The number of consecutive failures after which the policy gives up on
+        the camera, or None for no limit.
+    failures : int
+        The number of failures overall.
+    consecutive_failures : int
+        The number of failures since the last success.
+    restarts : int
+        The number of times the policy has asked to restart the stream.
+    gave_up : bool
+        Whether the policy has given up on the camera.
+
+    Methods
+    -------
+    record_success(self)
+        Record a successful frame.
+    record_failure(self)
+        Record a failure, and decide how to react to it.
+
+    """
+
+    def __init__(self, max_failures=None, backoff_initial=0.5, backoff_max=30,
+                 restart_after=5, give_up_after=None):
+
+        """Initialize an `ErrorPolicy` instance.
+
+        Parameters
+        ----------
+        max_failures : int, optional
+            The maximum number of failures overall (the error budget), or None
+            for no limit.
+        backoff_initial : float, optional
+            The delay after the first of consecutive failures in seconds.
+        backoff_max : float, optional
+            The maximum delay after a failure in seconds.
+        restart_after : int, optional
+            The number of consecutive failures after which the camera stream
+            is restarted, or None to never restart it.
+        give_up_after : int, optional
+            The number of consecutive failures after which the policy gives
+            up on the camera, or None for no limit.
+
+        """
+
+        self.max_failures = max_failures
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.restart_after = restart_after
+        self.give_up_after = give_up_after
+
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.restarts = 0
+        self.gave_up = False
+
+    def record_success(self):
+
+        """Record a successful frame.
+
+        """
+
+        self.consecutive_failures = 0
+
+    def record_failure(self):
+
+        """Record a failure, and decide how to react to it.
+
+        Returns
+        -------
+        delay : float
+            The time to wait before fetching the next frame in seconds.
+        restart : bool
+            Whether to restart the camera stream.
+
+        Notes
+        -----
+        The `gave_up` attribute is set if the policy gives up on the camera
+        because of this failure.
+
+        """
+
+        self.failures += 1
+        self.consecutive_failures += 1
+
+        # Open the circuit breaker if the error budget is exhausted, or the
+        # camera keeps failing.
+        if self.max_failures is not None and \
+                self.failures > self.max_failures:
+            self.gave_up = True
+        if self.give_up_after is not None and \
+                self.consecutive_failures >= self.give_up_after:
+            self.gave_up = True
+
+        # Restart the stream every `restart_after` consecutive failures.
+        restart = self.restart_after is not None and \
+            self.consecutive_failures % self.restart_after == 0
+        if restart:
+            self.restarts += 1
+
+        delay = min(self.backoff_initial *
+                    2 ** min(self.consecutive_failures - 1, 32),
+                    self.backoff_max)
+
+        return delay, restart
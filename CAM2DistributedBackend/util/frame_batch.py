@@ -0,0 +1,267 @@
+"""Provide a class gathering frames to be analyzed as a single batch.
+
+This module provides the `FrameBatch` class that gathers the frames of a
+camera until there are enough of them, or the first of them has waited long
+enough, and then stacks them into a single array, with their metadata in a
+single structured array, so that they can be analyzed in a single call. The
+frames of a batch have the same shape, so a frame of another shape (e.g.
+after the camera changes its resolution) starts a new batch.
+
+Class Listings
+--------------
+FrameBatch
+    Represent a batch of frames waiting to be analyzed together.
+
+"""
+
+import numpy as np
+
+from CAM2DistributedBackend.analyzer.frame_metadata import METADATA_DTYPE
+from CAM2DistributedBackend.camera.encoded_frame import EncodedFrame
+from CAM2DistributedBackend.camera.error import CorruptedFrameError
+from CAM2DistributedBackend.util.scheduler import monotonic
+
+
+class FrameBatch(object):
+
+    """Represent a batch of frames waiting to be analyzed together.
+
+    This class represents a batch of frames waiting to be analyzed together.
+    The frames are added as they are fetched, and taken out as a single
+    array once the batch is full or due.
+
+    Attributes
+    ----------
+    batch_size : int
+        The number of frames of a full batch.
+    max_wait : float
+        The maximum time in seconds the first frame of a batch waits for the
+        batch to be full, or None to wait until it is full.
+    decode_results : list of bool
+        Whether every frame of the last batch taken out has been decoded,
+        rather than left out as corrupted, in the order of the frames.
+
+    Methods
+    -------
+    fits(self, frame)
+        Check whether a frame has the shape of the frames of the batch.
+    add(self, frame, frame_metadata)
+        Add a frame to the batch.
+    is_full(self)
+        Check whether the batch is full.
+    is_due(self)
+        Check whether the batch has waited long enough to be analyzed.
+    take(self)
+        Take the frames of the batch as a single array.
+
+    """
+
+    def __init__(self, batch_size, max_wait=None):
+
+        """Initialize an empty `FrameBatch` instance.
+
+        Parameters
+        ----------
+        batch_size : int
+            The number of frames of a full batch.
+        max_wait : float, optional
+            The maximum time in seconds the first frame of a batch waits for
+            the batch to be full. By default, a batch waits until it is full.
+
+        """
+
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.decode_results = []
+
+        # The frames and their metadata waiting in the batch, and the time at
+        # which the first of them has been added.
+        self._frames = []
+        self._frames_metadata = []
+        self._start_time = None
+
+        # The shape and the data type of the decoded frames of the batch, or
+        # None if no frame of the batch has been decoded yet.
+        self._shape = None
+
+        # The arrays reused by every batch, allocated with the first batch.
+        self._array = None
+        self._metadata_array = np.empty(batch_size, METADATA_DTYPE)
+
+    def __len__(self):
+
+        return len(self._frames)
+
+    def fits(self, frame):
+
+        """Check whether a frame has the shape of the frames of the batch.
+
+        The frame is decoded to get its shape. A frame that does not fit has
+        to start a new batch, once the waiting batch is taken out.
+
+        Parameters
+        ----------
+        frame : numpy.ndarray or `EncodedFrame`
+            The frame to be checked.
+
+        Returns
+        -------
+        bool
+            Whether the frame can be added to the batch. A corrupted frame
+            fits any batch, since it is left out when the batch is taken out.
+
+        """
+
+        if self._shape is None:
+            return True
+        try:
+            image = _decode(frame)
+        except CorruptedFrameError:
+            return True
+        return (image.shape, image.dtype) == self._shape
+
+    def add(self, frame, frame_metadata):
+
+        """Add a frame to the batch.
+
+        Parameters
+        ----------
+        frame : numpy.ndarray or `EncodedFrame`
+            The frame to be added. It has to fit the batch (see `fits`).
+        frame_metadata : `FrameMetadata`
+            The metadata of the frame.
+
+        """
+
+        if not self._frames:
+            self._start_time = monotonic()
+        if self._shape is None:
+            try:
+                image = _decode(frame)
+            except CorruptedFrameError:
+                pass
+            else:
+                self._shape = image.shape, image.dtype
+        self._frames.append(frame)
+        self._frames_metadata.append(frame_metadata)
+
+    def is_full(self):
+
+        """Check whether the batch is full.
+
+        Returns
+        -------
+        bool
+            Whether the batch is full.
+
+        """
+
+        return len(self._frames) >= self.batch_size
+
+    def is_due(self):
+
+        """Check whether the batch has waited long enough to be analyzed.
+
+        Returns
+        -------
+        bool
+            Whether the batch is full, or its first frame has waited for the
+            maximum time.
+
+        """
+
+        if not self._frames:
+            return False
+        return self.is_full() or self.max_wait is not None and \
+            monotonic() - self._start_time >= self.max_wait
+
+    def take(self):
+
+        """Take the frames of the batch as a single array.
+
+        This method decodes the frames of the batch into a single array, and
+        empties the batch. The frames that turn out to be corrupted are left
+        out.
+
+        Returns
+        -------
+        frames : numpy.ndarray
+            The frames stacked along a new first axis, from the oldest to the
+            most recent, or None if all the frames are corrupted.
+        frames_metadata : numpy.ndarray
+            The metadata of the frames as a structured array of
+            `METADATA_DTYPE`.
+
+        Notes
+        -----
+        The returned arrays are reused by the next batch, so they have to be
+        copied to be kept after the next call of this method.
+
+        """
+
+        frames = self._frames
+        frames_metadata = self._frames_metadata
+        self._frames = []
+        self._frames_metadata = []
+        self._shape = None
+
+        # Decode the frames, and copy them into the array of the batch. The
+        # array is reused as long as the frames keep the same shape.
+        images = []
+        metadata = []
+        self.decode_results = []
+        for frame, frame_metadata in zip(frames, frames_metadata):
+            try:
+                images.append(_decode(frame))
+            except CorruptedFrameError:
+                self.decode_results.append(False)
+                continue
+            self.decode_results.append(True)
+            metadata.append(frame_metadata)
+        if not images:
+            return None, self._metadata_array[:0]
+
+        shape = images[0].shape
+        if self._array is None or self._array.shape[1:] != shape or \
+                self._array.dtype != images[0].dtype:
+            self._array = np.empty((self.batch_size,) + shape,
+                                   images[0].dtype)
+        for i, image in enumerate(images):
+            self._array[i] = image
+        frames = self._array[:len(images)]
+
+        metadata_array = self._metadata_array[:len(metadata)]
+        for i, frame_metadata in enumerate(metadata):
+            metadata_array[i] = frame_metadata.to_record()
+
+        return frames, metadata_array
+
+
+def _decode(frame):
+
+    """Decode a frame, caching the decoded frame.
+
+    The decoded frame is cached in the `EncodedFrame`, since the same frame
+    is also held by the frame history of the analyzer, which reuses it
+    rather than decoding the frame again.
+
+    Parameters
+    ----------
+    frame : numpy.ndarray or `EncodedFrame`
+        The frame.
+
+    Returns
+    -------
+    numpy.ndarray
+        The decoded frame.
+
+    Raises
+    ------
+    CorruptedFrameError
+        If the frame is corrupted.
+
+    """
+
+    if not isinstance(frame, EncodedFrame):
+        return frame
+    return frame.image
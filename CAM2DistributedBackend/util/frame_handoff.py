@@ -0,0 +1,413 @@
+"""Provide the handoff of decoded frames to an analyzer in another process.
+
+This module provides the `AnalyzerProcess` class that runs the analyzer of a
+camera in a separate process, so that a slow or crashing analyzer neither
+delays fetching the frames of the camera nor takes the Spark task down. The
+decoded frames are copied into slots of shared memory (see `FrameSlots`),
+and only the index of the slot and the metadata of every frame are passed to
+the analyzer process through a queue, so the pixels are never pickled.
+
+Class Listings
+--------------
+FrameSlots
+    Represent a set of shared-memory slots holding decoded frames.
+AnalyzerProcess
+    Represent the analyzer of a camera running in a separate process.
+
+"""
+
+import collections
+import mmap
+import multiprocessing
+import os
+import Queue
+import tempfile
+import time
+import traceback
+
+import numpy as np
+
+# The directory of the files backing the shared memory, which is kept in
+# memory on Linux.
+_SHARED_MEMORY_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+class FrameSlots(object):
+
+    """Represent a set of shared-memory slots holding decoded frames.
+
+    This class represents a number of slots, each holding a decoded frame of
+    a fixed shape, in memory shared between processes. The memory is backed
+    by a file, so that a process can map the slots created by another
+    process by the name of the file.
+
+    Attributes
+    ----------
+    file_name : str
+        The name of the file backing the shared memory.
+    count : int
+        The number of slots.
+    shape : tuple
+        The shape of the frames held by the slots.
+    dtype : numpy.dtype
+        The data type of the frames held by the slots.
+    array : numpy.ndarray
+        The array of the slots, of shape (count,) + shape.
+
+    Methods
+    -------
+    fits(self, image)
+        Check whether a frame fits in the slots.
+    get_spec(self)
+        Get the arguments that map the slots in another process.
+    close(self, unlink=False)
+        Unmap the slots.
+
+    """
+
+    def __init__(self, count, shape, dtype, file_name=None):
+
+        """Create new slots, or map existing ones.
+
+        Parameters
+        ----------
+        count : int
+            The number of slots.
+        shape : tuple
+            The shape of the frames held by the slots.
+        dtype : numpy.dtype or str
+            The data type of the frames held by the slots.
+        file_name : str, optional
+            The name of the file backing existing slots. By default, new
+            slots are created.
+
+        """
+
+        self.count = count
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        size = count * int(np.prod(self.shape)) * self.dtype.itemsize
+
+        # Create the file backing new slots, or open the file of existing
+        # ones. The mapping stays valid after the file is closed.
+        if file_name is None:
+            fd, file_name = tempfile.mkstemp(prefix='cam2-frames-',
+                                             dir=_SHARED_MEMORY_DIR)
+            os.ftruncate(fd, size)
+        else:
+            fd = os.open(file_name, os.O_RDWR)
+        try:
+            self._buffer = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.file_name = file_name
+        self.array = np.frombuffer(self._buffer, self.dtype).reshape(
+            (count,) + self.shape)
+
+    def fits(self, image):
+
+        """Check whether a frame fits in the slots.
+
+        Parameters
+        ----------
+        image : numpy.ndarray
+            The decoded frame.
+
+        Returns
+        -------
+        bool
+            Whether the frame has the shape and the data type of the slots.
+
+        """
+
+        return image.shape == self.shape and image.dtype == self.dtype
+
+    def get_spec(self):
+
+        """Get the arguments that map the slots in another process.
+
+        Returns
+        -------
+        tuple
+            The arguments of the constructor that map the slots.
+
+        """
+
+        return self.count, self.shape, self.dtype.str, self.file_name
+
+    def close(self, unlink=False):
+
+        """Unmap the slots.
+
+        Parameters
+        ----------
+        unlink : bool, optional
+            Whether the file backing the slots is removed. This is done by the
+            process that created the slots, once it does not need them.
+
+        """
+
+        self.array = None
+        self._buffer = None
+        if unlink:
+            try:
+                os.remove(self.file_name)
+            except OSError:
+                pass
+
+
+class AnalyzerProcess(object):
+
+    """Represent the analyzer of a camera running in a separate process.
+
+    This class represents a child process running the analyzer of a camera
+    task, while the calling process fetches and decodes the frames of the
+    camera. The slots of the frames are created with the first frame, once
+    its shape is known. A slot is reused once the analyzer process no longer
+    keeps its frame in the history of recent frames, or in a waiting batch.
+    If the analyzer falls behind and there is no free slot, the new frame is
+    dropped rather than delaying the fetching of the next frames.
+
+    Attributes
+    ----------
+    task : `CameraTask`
+        The analysis of the camera.
+    depth : int
+        The maximum number of frames waiting to be analyzed.
+    error : str
+        The traceback of the error raised by the analyzer, if any.
+
+    Methods
+    -------
+    start(self)
+        Start the analyzer process.
+    is_alive(self)
+        Check whether the analyzer process is running.
+    send(self, image, frame_metadata)
+        Pass a decoded frame to the analyzer process.
+    stop(self, timeout=600)
+        Finalize the analyzer and wait for the analyzer process to exit.
+
+    Notes
+    -----
+    The frames passed to the analyzer are views of the shared memory, so they
+    have to be copied to be kept after they leave the history of recent
+    frames. A frame of a different shape from the first frame (e.g. after the
+    camera changes its resolution) is pickled through the queue instead.
+
+    """
+
+    def __init__(self, task, depth=2):
+
+        """Initialize an `AnalyzerProcess` instance.
+
+        Parameters
+        ----------
+        task : `CameraTask`
+            The analysis of the camera. The analyzer of the task is created
+            and initialized in the analyzer process.
+        depth : int, optional
+            The maximum number of frames waiting to be analyzed.
+
+        """
+
+        self.task = task
+        self.depth = depth
+        self.error = None
+
+        # The analyzer process keeps the frames of the history, the frames of
+        # a waiting batch, and the previous frame, which an analyzer may keep
+        # as it is.
+        keep = task.request.snapshots_to_keep
+        if task.batch is not None:
+            keep = max(keep, task.batch.batch_size)
+        self._keep = keep + 1
+
+        self._slots = None
+        self._free_slots = []
+        self._frames_queue = multiprocessing.Queue()
+        self._free_queue = multiprocessing.Queue()
+        self._result_queue = multiprocessing.Queue()
+        self._process = None
+
+    def start(self):
+
+        """Start the analyzer process.
+
+        """
+
+        self._process = multiprocessing.Process(
+            target=_run_analyzer,
+            args=(self.task, self._keep, self._frames_queue,
+                  self._free_queue, self._result_queue))
+        self._process.daemon = True
+        self._process.start()
+
+    def is_alive(self):
+
+        """Check whether the analyzer process is running.
+
+        Returns
+        -------
+        bool
+            Whether the analyzer process is running.
+
+        """
+
+        return self._process.is_alive()
+
+    def send(self, image, frame_metadata):
+
+        """Pass a decoded frame to the analyzer process.
+
+        Parameters
+        ----------
+        image : numpy.ndarray
+            The decoded frame.
+        frame_metadata : `FrameMetadata`
+            The metadata of the frame.
+
+        Returns
+        -------
+        bool
+            Whether the frame has been passed, or dropped because the
+            analyzer process is behind.
+
+        """
+
+        # Create the slots with the first frame.
+        if self._slots is None:
+            self._slots = FrameSlots(self._keep + self.depth, image.shape,
+                                     image.dtype)
+            self._free_slots = range(self._slots.count)
+            self._frames_queue.put(('slots', self._slots.get_spec()))
+
+        # Collect the slots freed by the analyzer process.
+        while True:
+            try:
+                self._free_slots.append(self._free_queue.get_nowait())
+            except Queue.Empty:
+                break
+
+        if not self._slots.fits(image):
+            self._frames_queue.put(('image', image, frame_metadata))
+            return True
+        if not self._free_slots:
+            # Every slot is kept by the analyzer, or holds a frame waiting to
+            # be analyzed.
+            return False
+        slot = self._free_slots.pop()
+        self._slots.array[slot] = image
+        self._frames_queue.put(('frame', slot, frame_metadata))
+        return True
+
+    def stop(self, timeout=600):
+
+        """Finalize the analyzer and wait for the analyzer process to exit.
+
+        The frames waiting to be analyzed are analyzed before the analyzer is
+        finalized. The measurements of the profiler of the task are passed to
+        the analyzer process, to be reported with the measurements of the
+        analyzer. The numbers of frames analyzed and of results failed or
+        dropped to be uploaded in the analyzer process are set in the task,
+        and the traceback of the error raised by the analyzer, if any, is
+        kept in the `error` attribute.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The maximum number of seconds to wait for the analyzer process to
+            exit, after which the process is terminated and an error is kept
+            in the `error` attribute.
+
+        """
+
+        self._frames_queue.put(('profiler', self.task.profiler))
+        self._frames_queue.put(None)
+        deadline = time.time() + timeout
+
+        # Collect the result before joining the process, so that the process
+        # is not blocked on writing it.
+        result = None
+        while result is None:
+            try:
+                result = self._result_queue.get(True, 0.1)
+            except Queue.Empty:
+                if (not self._process.is_alive() or
+                        time.time() > deadline):
+                    break
+        if result is not None:
+            (self.task.frames_analyzed, self.task.uploads_failed,
+             self.task.uploads_dropped, self.error) = result
+
+        # Give the process a moment to exit after writing the result.
+        self._process.join(max(deadline - time.time(), 1))
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+            if self.error is None:
+                self.error = ('The analyzer process did not exit within {} '
+                              'seconds, and was terminated.'.format(timeout))
+        elif result is None:
+            self.error = 'The analyzer process exited with code {}.'.format(
+                self._process.exitcode)
+        if self._slots is not None:
+            self._slots.close(unlink=True)
+
+
+def _run_analyzer(task, keep, frames_queue, free_queue, result_queue):
+
+    """Run the analyzer of a task in the analyzer process.
+
+    Parameters
+    ----------
+    task : `CameraTask`
+        The analysis of the camera.
+    keep : int
+        The number of most recent slots kept by the analyzer.
+    frames_queue : multiprocessing.Queue
+        The queue of the messages from the fetching process.
+    free_queue : multiprocessing.Queue
+        The queue of the slots freed by the analyzer.
+    result_queue : multiprocessing.Queue
+        The queue of the result of the analyzer process, which is the numbers
+        of analyzed frames, failed uploads, and dropped uploads, and the
+        traceback of the error, if any.
+
+    """
+
+    # Do not wait for the fetching process to collect the freed slots when
+    # exiting.
+    free_queue.cancel_join_thread()
+
+    slots = None
+    kept_slots = collections.deque()
+    error = None
+    try:
+        task.start_analyzer()
+        while True:
+            message = frames_queue.get()
+            if message is None:
+                break
+            if message[0] == 'slots':
+                slots = FrameSlots(*message[1])
+            elif message[0] == 'profiler':
+                task.profiler.merge(message[1])
+            elif message[0] == 'frame':
+                _, slot, frame_metadata = message
+                task.analyze(slots.array[slot], frame_metadata)
+                kept_slots.append(slot)
+            else:
+                _, image, frame_metadata = message
+                task.analyze(image, frame_metadata)
+
+            # Free the slots of the frames the analyzer no longer keeps.
+            while len(kept_slots) > keep:
+                free_queue.put(kept_slots.popleft())
+        task.finish_analyzer()
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        task.close_storage()
+    result_queue.put((task.frames_analyzed, task.uploads_failed,
+                      task.uploads_dropped, error))
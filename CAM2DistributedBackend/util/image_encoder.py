@@ -0,0 +1,334 @@
+"""Provide the encoding of the images saved as results.
+
+This module provides the `ImageEncoder` class that encodes the images saved
+by the analyzers, with the codec, the quality, and the scale set by the
+request or by the call saving the image, and counts the images, the bytes,
+and the encoding time of every codec.
+
+Class Listings
+--------------
+ImageEncoder
+    Represent the encoding settings of the saved images.
+
+Function Listings
+-----------------
+check_settings
+    Check the encoding settings.
+
+"""
+
+import os
+import threading
+
+import cv2
+
+from CAM2DistributedBackend.util.scheduler import monotonic
+
+# The extension of the file names of every image format, and the image
+# format of every extension.
+_EXTENSIONS = {
+    'jpeg': '.jpg',
+    'png': '.png',
+    'webp': '.webp',
+}
+_FORMATS = {
+    '.jpg': 'jpeg',
+    '.jpeg': 'jpeg',
+    '.png': 'png',
+    '.webp': 'webp',
+}
+
+# The cv2.imencode parameter of the quality of every image format.
+_QUALITY_PARAMETERS = {
+    'jpeg': cv2.IMWRITE_JPEG_QUALITY,
+    'png': cv2.IMWRITE_PNG_COMPRESSION,
+    'webp': cv2.IMWRITE_WEBP_QUALITY,
+}
+
+# The lowest and the highest quality of every image format, or None if there
+# is no highest quality (WebP images above 100 are lossless).
+_QUALITY_RANGES = {
+    'jpeg': (0, 100),
+    'png': (0, 9),
+    'webp': (1, None),
+}
+
+
+class ImageEncoder(object):
+
+    """Represent the encoding settings of the saved images.
+
+    This class represents the default codec, quality, and scale of the images
+    saved by the analyzers, and the counts of the images encoded with every
+    codec. The counts are updated safely from many threads.
+
+    Attributes
+    ----------
+    image_format : str
+        The format of the saved images: 'jpeg', 'png', or 'webp', or None to
+        use the format of the extension of the file name of every image.
+    qualities : dict
+        The quality of every image format that is not encoded with the
+        default quality of OpenCV: the quality of JPEG and WebP images from
+        0 to 100, or the compression level of PNG images from 0 to 9.
+    scale : float
+        The factor by which the width and the height of the saved images are
+        reduced before encoding them.
+    counts : dict
+        The numbers of images, bytes, and seconds spent on encoding of every
+        codec, by the name of the codec. A JPEG frame saved as it is, without
+        encoding it again, is counted under 'jpeg_as_is'.
+
+    Methods
+    -------
+    encode(self, file_name, image, image_format=None, quality=None,
+           scale=None)
+        Encode an image.
+    encode_frame(self, file_name, frame, image_format=None, quality=None,
+                 scale=None)
+        Encode a compressed frame.
+
+    """
+
+    def __init__(self, image_format=None, jpeg_quality=None,
+                 png_compression=None, webp_quality=None, scale=1):
+
+        """Initialize an `ImageEncoder` instance.
+
+        Parameters
+        ----------
+        image_format : str, optional
+            The format of the saved images. By default, the format of every
+            image is the format of the extension of its file name.
+        jpeg_quality : int, optional
+            The quality of JPEG images from 0 to 100.
+        png_compression : int, optional
+            The compression level of PNG images from 0 to 9.
+        webp_quality : int, optional
+            The quality of WebP images from 1 to 100, or above 100 for
+            lossless images.
+        scale : float, optional
+            The factor by which the width and the height of the saved images
+            are reduced before encoding them, in (0, 1].
+
+        Raises
+        ------
+        ValueError
+            If the value of `image_format`, `scale`, or a quality is invalid.
+
+        """
+
+        check_settings(image_format, scale, {
+            'jpeg': jpeg_quality, 'png': png_compression,
+            'webp': webp_quality})
+        self.image_format = image_format
+        self.qualities = dict(
+            (name, quality) for name, quality in (
+                ('jpeg', jpeg_quality), ('png', png_compression),
+                ('webp', webp_quality))
+            if quality is not None)
+        self.scale = scale
+        self.counts = {}
+
+        self._lock = threading.Lock()
+
+    def encode(self, file_name, image, image_format=None, quality=None,
+               scale=None):
+
+        """Encode an image.
+
+        The settings of the call override the default settings of the
+        encoder. If the image is encoded in another format than the format
+        of the extension of its file name, the extension is replaced.
+
+        Parameters
+        ----------
+        file_name : str
+            The file name of the image.
+        image : numpy.ndarray
+            The image.
+        image_format : str, optional
+            The format of the image: 'jpeg', 'png', or 'webp'.
+        quality : int, optional
+            The quality of a JPEG or WebP image, or the compression level of
+            a PNG image.
+        scale : float, optional
+            The factor by which the width and the height of the image are
+            reduced before encoding it.
+
+        Returns
+        -------
+        tuple
+            The file name of the image and the encoded image.
+
+        Raises
+        ------
+        ValueError
+            If the value of `image_format`, `quality`, or `scale` is invalid,
+            or if the image cannot be encoded.
+
+        """
+
+        check_settings(image_format, scale)
+        file_name, extension, image_format = self._get_format(file_name,
+                                                              image_format)
+        check_settings(qualities={image_format: quality})
+        if quality is None:
+            quality = self.qualities.get(image_format)
+        if scale is None:
+            scale = self.scale
+
+        start_time = monotonic()
+        if scale != 1:
+            image = cv2.resize(image, None, fx=scale, fy=scale,
+                               interpolation=cv2.INTER_AREA)
+        if quality is not None and image_format in _QUALITY_PARAMETERS:
+            parameters = [_QUALITY_PARAMETERS[image_format], quality]
+        else:
+            parameters = []
+        success, data = cv2.imencode(extension, image, parameters)
+        if not success:
+            raise ValueError('The image cannot be encoded as ' + file_name)
+        data = data.tostring()
+        self._count(image_format or extension.lstrip('.').lower(), len(data),
+                    monotonic() - start_time)
+        return file_name, data
+
+    def encode_frame(self, file_name, frame, image_format=None, quality=None,
+                     scale=None):
+
+        """Encode a compressed frame.
+
+        A JPEG frame saved as a JPEG image is saved as it is, without
+        encoding it again, unless a quality or a scale is set by the call or
+        the encoder. Such a frame is counted under 'jpeg_as_is'.
+        Any other frame is decoded, and encoded as an image (see `encode`).
+
+        Parameters
+        ----------
+        file_name : str
+            The file name of the frame.
+        frame : `EncodedFrame`
+            The frame.
+        image_format : str, optional
+            The format of the frame: 'jpeg', 'png', or 'webp'.
+        quality : int, optional
+            The quality of a JPEG or WebP image, or the compression level of
+            a PNG image.
+        scale : float, optional
+            The factor by which the width and the height of the frame are
+            reduced before encoding it.
+
+        Returns
+        -------
+        tuple
+            The file name of the frame and the encoded frame.
+
+        Raises
+        ------
+        ValueError
+            If the value of `image_format`, `quality`, or `scale` is invalid,
+            or if the frame cannot be encoded.
+
+        """
+
+        check_settings(image_format, scale)
+        as_is_file_name, _, as_is_format = self._get_format(file_name,
+                                                            image_format)
+        if quality is None:
+            quality = self.qualities.get(as_is_format)
+        if frame.is_jpeg and as_is_format == 'jpeg' and quality is None and \
+                (self.scale if scale is None else scale) == 1:
+            data = bytes(frame.data)
+            self._count('jpeg_as_is', len(data), 0.0)
+            return as_is_file_name, data
+        return self.encode(file_name, frame.image, image_format, quality,
+                           scale)
+
+    def _get_format(self, file_name, image_format=None):
+
+        """Get the format in which an image is encoded.
+
+        Parameters
+        ----------
+        file_name : str
+            The file name of the image.
+        image_format : str, optional
+            The format of the image set by the call.
+
+        Returns
+        -------
+        tuple
+            The file name of the image, with the extension of its format,
+            the extension, and the format, or None if the format is not one
+            of the formats with settings.
+
+        """
+
+        name, extension = os.path.splitext(file_name)
+        image_format = image_format or self.image_format
+        if image_format is None:
+            return file_name, extension, _FORMATS.get(extension.lower())
+        if _FORMATS.get(extension.lower()) != image_format:
+            extension = _EXTENSIONS[image_format]
+            file_name = name + extension
+        return file_name, extension, image_format
+
+    def _count(self, codec, size, seconds):
+
+        """Count an encoded image.
+
+        Parameters
+        ----------
+        codec : str
+            The name of the codec.
+        size : int
+            The size of the encoded image in bytes.
+        seconds : float
+            The time spent on encoding the image in seconds.
+
+        """
+
+        with self._lock:
+            counts = self.counts.setdefault(
+                codec, {'images': 0, 'bytes': 0, 'seconds': 0.0})
+            counts['images'] += 1
+            counts['bytes'] += size
+            counts['seconds'] += seconds
+
+
+def check_settings(image_format=None, scale=None, qualities=None):
+
+    """Check the encoding settings.
+
+    Parameters
+    ----------
+    image_format : str, optional
+        The image format, or None.
+    scale : float, optional
+        The scale, or None.
+    qualities : dict, optional
+        The quality of image formats, by the name of the format. A quality
+        of None, or of a format without qualities, is not checked.
+
+    Raises
+    ------
+    ValueError
+        If the value of `image_format`, `scale`, or a quality is invalid.
+
+    """
+
+    if image_format is not None and image_format not in _EXTENSIONS:
+        raise ValueError('Invalid image format: {}'.format(image_format))
+    if scale is not None and (
+            isinstance(scale, bool) or
+            not isinstance(scale, (int, long, float)) or not 0 < scale <= 1):
+        raise ValueError('Invalid image scale: {}'.format(scale))
+    for name, quality in sorted((qualities or {}).items()):
+        if quality is None or name not in _QUALITY_RANGES:
+            continue
+        low, high = _QUALITY_RANGES[name]
+        if isinstance(quality, bool) or \
+                not isinstance(quality, (int, long)) or quality < low or \
+                high is not None and quality > high:
+            raise ValueError('Invalid {} quality: {}'.format(name, quality))
@@ -0,0 +1,502 @@
+"""Provide the profiling of the analysis of a camera.
+
+This module provides the `Profiler` class that measures where the time of
+the analysis of a camera goes: fetching the frames, getting (and decoding)
+them in the analyzer, the event handlers of the analyzer, saving results, and
+sleeping between frames. The latencies of every stage are kept in a
+`LatencyHistogram`, a histogram of logarithmic buckets in the style of
+HdrHistogram, which records a latency in constant time and memory, and whose
+percentiles are accurate to about 1%. The profiler also holds the number of
+intervals missed because a frame took longer than the interval (see
+`FrameScheduler`), the numbers of images, bytes, and seconds spent on
+encoding of every codec of the saved images (see `ImageEncoder`), and can
+optionally profile the event handlers of the analyzer with cProfile.
+
+Class Listings
+--------------
+LatencyHistogram
+    Represent a histogram of latencies with logarithmic buckets.
+Profiler
+    Represent the profiling of the analysis of a camera.
+
+Constant Listings
+-----------------
+PROFILE_FILE_NAME
+    The file name of the report of the profiler.
+CALLBACKS_PROFILE_FILE_NAME
+    The file name of the cProfile statistics of the event handlers.
+
+"""
+
+import collections
+import cProfile
+import json
+import pstats
+import StringIO
+import threading
+
+import numpy as np
+
+from CAM2DistributedBackend.util.scheduler import monotonic
+
+# The file names of the reports saved with the results of a camera.
+PROFILE_FILE_NAME = 'cam2_profile.json'
+CALLBACKS_PROFILE_FILE_NAME = 'cam2_profile_callbacks.txt'
+
+# The number of functions listed in the cProfile statistics.
+_CALLBACKS_PROFILE_LINES = 40
+
+
+class LatencyHistogram(object):
+
+    """Represent a histogram of latencies with logarithmic buckets.
+
+    This class represents a histogram of latencies, counted in microseconds.
+    The latencies below `2 ** precision_bits` microseconds have a bucket of
+    their own, and every power of two above that is split into
+    `2 ** (precision_bits - 1)` buckets, so the relative error of a recorded
+    latency is at most `2 ** (1 - precision_bits)`.
+
+    Attributes
+    ----------
+    count : int
+        The number of recorded latencies.
+    total : float
+        The sum of the recorded latencies in seconds.
+    max : float
+        The maximum recorded latency in seconds.
+
+    Methods
+    -------
+    record(self, seconds)
+        Record a latency.
+    percentile(self, percent)
+        Get a percentile of the recorded latencies.
+    merge(self, other)
+        Add the latencies recorded by another histogram.
+    summary(self)
+        Summarize the recorded latencies.
+
+    """
+
+    def __init__(self, max_seconds=3600, precision_bits=7):
+
+        """Initialize an empty `LatencyHistogram` instance.
+
+        Parameters
+        ----------
+        max_seconds : float, optional
+            The maximum latency counted in its own bucket in seconds. Longer
+            latencies are counted in the last bucket.
+        precision_bits : int, optional
+            The number of bits of the buckets of every power of two.
+
+        """
+
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+        self._bits = precision_bits
+        self._sub_buckets = 1 << precision_bits
+        self._half = self._sub_buckets // 2
+        self._counts = np.zeros(
+            self._get_index(int(max_seconds * 1e6)) + 1, np.int64)
+
+    def record(self, seconds):
+
+        """Record a latency.
+
+        Parameters
+        ----------
+        seconds : float
+            The latency in seconds.
+
+        """
+
+        index = self._get_index(int(seconds * 1e6))
+        self._counts[min(index, len(self._counts) - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percent):
+
+        """Get a percentile of the recorded latencies.
+
+        Parameters
+        ----------
+        percent : float
+            The percentile, between 0 and 100.
+
+        Returns
+        -------
+        float
+            The latency in seconds below which `percent` percent of the
+            recorded latencies are, or 0 if there are none.
+
+        """
+
+        if not self.count:
+            return 0.0
+        rank = max(percent / 100.0 * self.count, 1)
+        index = int(np.searchsorted(np.cumsum(self._counts), rank))
+        low, high = self._get_range(index)
+        return min((low + high) / 2.0 / 1e6, self.max)
+
+    def merge(self, other):
+
+        """Add the latencies recorded by another histogram.
+
+        Parameters
+        ----------
+        other : `LatencyHistogram`
+            The histogram, of the same buckets.
+
+        """
+
+        self._counts += other._counts
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def summary(self):
+
+        """Summarize the recorded latencies.
+
+        Returns
+        -------
+        dict
+            The count, the total, the mean, the maximum, and the 50th, 90th,
+            99th, and 99.9th percentiles of the latencies, in seconds.
+
+        """
+
+        return collections.OrderedDict([
+            ('count', self.count),
+            ('total', self.total),
+            ('mean', self.total / self.count if self.count else 0.0),
+            ('p50', self.percentile(50)),
+            ('p90', self.percentile(90)),
+            ('p99', self.percentile(99)),
+            ('p99.9', self.percentile(99.9)),
+            ('max', self.max),
+        ])
+
+    def _get_index(self, value):
+
+        """Get the bucket of a latency.
+
+        Parameters
+        ----------
+        value : int
+            The latency in microseconds.
+
+        Returns
+        -------
+        int
+            The index of the bucket of the latency.
+
+        """
+
+        if value < self._sub_buckets:
+            return max(value, 0)
+        shift = value.bit_length() - self._bits
+        return self._sub_buckets + (shift - 1) * self._half + \
+            (value >> shift) - self._half
+
+    def _get_range(self, index):
+
+        """Get the range of the latencies of a bucket.
+
+        Parameters
+        ----------
+        index : int
+            The index of the bucket.
+
+        Returns
+        -------
+        tuple
+            The lowest latency of the bucket, and the lowest latency of the
+            next bucket, in microseconds.
+
+        """
+
+        if index < self._sub_buckets:
+            return index, index + 1
+        shift = (index - self._sub_buckets) // self._half + 1
+        mantissa = (index - self._sub_buckets) % self._half + self._half
+        return mantissa << shift, (mantissa + 1) << shift
+
+
+class Profiler(object):
+
+    """Represent the profiling of the analysis of a camera.
+
+    This class represents the latencies of the stages of the analysis of a
+    camera, each in a `LatencyHistogram`, the number of missed intervals,
+    the counts of the encoded images, and, optionally, the cProfile
+    statistics of the event handlers of the analyzer. The latencies may be
+    recorded by several threads (e.g. the threads uploading the results).
+    A disabled profiler records nothing, so that profiling costs nothing
+    unless the request sets `profile`.
+
+    Attributes
+    ----------
+    histograms : dict
+        The histogram of every stage, by the name of the stage.
+    missed_intervals : int
+        The number of intervals missed because a frame took longer than the
+        interval to be fetched and analyzed.
+    codecs : dict
+        The numbers of images, bytes, and seconds spent on encoding of every
+        codec of the saved images, by the name of the codec.
+    profile_callbacks : bool
+        Whether the event handlers are profiled with cProfile.
+    enabled : bool
+        Whether the latencies are recorded.
+
+    Methods
+    -------
+    record(self, stage, seconds)
+        Record the latency of a stage.
+    call(self, stage, function, *args)
+        Call a function, recording its latency as a stage.
+    call_handler(self, stage, handler, *args)
+        Call an event handler of the analyzer, recording its latency.
+    count_images(self, counts)
+        Add the counts of the images encoded with every codec.
+    merge(self, other)
+        Add the measurements of another profiler.
+    report(self)
+        Report the measurements.
+    save(self, save)
+        Save the measurements.
+
+    """
+
+    def __init__(self, profile_callbacks=False, enabled=True):
+
+        """Initialize an empty `Profiler` instance.
+
+        Parameters
+        ----------
+        profile_callbacks : bool, optional
+            Whether the event handlers are profiled with cProfile.
+        enabled : bool, optional
+            Whether the latencies are recorded.
+
+        """
+
+        self.histograms = collections.OrderedDict()
+        self.missed_intervals = 0
+        self.codecs = collections.OrderedDict()
+        self.profile_callbacks = profile_callbacks and enabled
+        self.enabled = enabled
+
+        # The cProfile profiler is created with the first profiled call, so
+        # that the profiler can be pickled before that.
+        self._cprofile = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+
+        """Get the state of the profiler to be pickled, without the lock.
+
+        Returns
+        -------
+        dict
+            The attributes of the profiler.
+
+        """
+
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+
+        """Set the state of an unpickled profiler, with a new lock.
+
+        Parameters
+        ----------
+        state : dict
+            The attributes of the profiler.
+
+        """
+
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+
+        """Record the latency of a stage.
+
+        Parameters
+        ----------
+        stage : str
+            The name of the stage.
+        seconds : float
+            The latency in seconds.
+
+        """
+
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def call(self, stage, function, *args):
+
+        """Call a function, recording its latency as a stage.
+
+        Parameters
+        ----------
+        stage : str
+            The name of the stage.
+        function : callable
+            The function.
+        *args
+            The arguments of the function.
+
+        Returns
+        -------
+        object
+            The return value of the function.
+
+        """
+
+        if not self.enabled:
+            return function(*args)
+        start_time = monotonic()
+        try:
+            return function(*args)
+        finally:
+            self.record(stage, monotonic() - start_time)
+
+    def call_handler(self, stage, handler, *args):
+
+        """Call an event handler of the analyzer, recording its latency.
+
+        The event handler is profiled with cProfile if `profile_callbacks` is
+        set.
+
+        Parameters
+        ----------
+        stage : str
+            The name of the stage.
+        handler : callable
+            The event handler.
+        *args
+            The arguments of the event handler.
+
+        Returns
+        -------
+        object
+            The return value of the event handler.
+
+        """
+
+        if not self.profile_callbacks:
+            return self.call(stage, handler, *args)
+        if self._cprofile is None:
+            self._cprofile = cProfile.Profile()
+        return self.call(stage, self._cprofile.runcall, handler, *args)
+
+    def count_images(self, counts):
+
+        """Add the counts of the images encoded with every codec.
+
+        Parameters
+        ----------
+        counts : dict
+            The numbers of images, bytes, and seconds spent on encoding of
+            every codec, by the name of the codec (see
+            `ImageEncoder.counts`).
+
+        """
+
+        for codec, codec_counts in sorted(counts.items()):
+            total = self.codecs.setdefault(
+                codec, {'images': 0, 'bytes': 0, 'seconds': 0.0})
+            for name, value in codec_counts.items():
+                total[name] += value
+
+    def merge(self, other):
+
+        """Add the measurements of another profiler.
+
+        This is used to report the measurements of the stages that run in
+        another process together.
+
+        Parameters
+        ----------
+        other : `Profiler`
+            The other profiler.
+
+        """
+
+        with self._lock:
+            for stage, histogram in other.histograms.items():
+                if stage not in self.histograms:
+                    self.histograms[stage] = LatencyHistogram()
+                self.histograms[stage].merge(histogram)
+        self.missed_intervals += other.missed_intervals
+        self.count_images(other.codecs)
+
+    def report(self):
+
+        """Report the measurements.
+
+        Returns
+        -------
+        dict
+            The summary of the histogram of every stage (see
+            `LatencyHistogram.summary`), the number of missed intervals,
+            and the numbers of images, bytes, bytes per image, and seconds
+            spent on encoding of every codec.
+
+        """
+
+        return collections.OrderedDict([
+            ('stages', collections.OrderedDict(
+                (stage, histogram.summary())
+                for stage, histogram in self.histograms.items())),
+            ('missed_intervals', self.missed_intervals),
+            ('codecs', collections.OrderedDict(
+                (codec, collections.OrderedDict([
+                    ('images', counts['images']),
+                    ('bytes', counts['bytes']),
+                    ('bytes_per_image',
+                     counts['bytes'] / float(counts['images'] or 1)),
+                    ('encode_seconds', counts['seconds']),
+                ])) for codec, counts in self.codecs.items())),
+        ])
+
+    def save(self, save):
+
+        """Save the measurements.
+
+        The report is saved as JSON in `PROFILE_FILE_NAME`, and the cProfile
+        statistics of the event handlers, if any, as text in
+        `CALLBACKS_PROFILE_FILE_NAME`.
+
+        Parameters
+        ----------
+        save : callable
+            The function saving a result, given its file name and the result
+            (see `StorageClient.save`).
+
+        """
+
+        save(PROFILE_FILE_NAME, json.dumps(self.report(), indent=2))
+        if self._cprofile is not None:
+            stream = StringIO.StringIO()
+            stats = pstats.Stats(self._cprofile, stream=stream)
+            stats.sort_stats('cumulative').print_stats(
+                _CALLBACKS_PROFILE_LINES)
+            save(CALLBACKS_PROFILE_FILE_NAME, stream.getvalue())
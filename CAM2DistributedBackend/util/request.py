@@ -16,7 +16,9 @@ Request
 
 import json
 
-from CAM2DistributedBackend.camera.camera import IPCamera, NonIPCamera
+from CAM2DistributedBackend.camera.camera import IPCamera, NonIPCamera, \
+    ReplayCamera
+from CAM2DistributedBackend.util import image_encoder
 import constants
 
 
@@ -50,9 +52,164 @@ class Request(object):
         the most recent snapshot from every camera. If `snapshots_to_keep` =
         10, the system will maintain the most recent 10 snapshots at any
         point of time.
+    metadata_to_keep : int
+        The number of most recent frames whose metadata is available to the
+        analysis program through its metadata history. This is optional and
+        defaults to 1000.
     is_video: bool
         The way that the system will communicate with the cameras. Is it
         video (high frame rates)? or snapshots (low frame rates)?
+    latest_frame_only : bool
+        Whether video streams are drained continuously so that every analyzed
+        frame is the most recent one sent by the camera, rather than the
+        oldest unread one. This is optional and defaults to False.
+    shared_streams : bool
+        Whether the frames are fetched through the stream server of the
+        worker, if it is running, which shares a single connection to every
+        camera between all the tasks of the worker analyzing it, including
+        the tasks of other submissions. The video streams of the stream
+        server are always drained continuously. This is optional and
+        defaults to False.
+    duplicate_frames : str
+        What to do with a frame that is identical to the frame before it
+        (e.g. from a camera that refreshes its image less often than it is
+        analyzed). If it is 'flag', the frame is analyzed and its metadata is
+        flagged as a duplicate. If it is 'skip', the frame is not analyzed.
+        This is optional and defaults to 'flag'.
+    overrun_policy : str
+        What to do when a frame takes longer than `interval`, so that the
+        next frame misses its time. If it is 'skip', the frames of the missed
+        times are skipped, and the next frame is taken at the next time of
+        the schedule. If it is 'catch_up', the frames of the missed times are
+        taken right away, one after the other, until the schedule is caught
+        up. If it is 'adapt', the interval is stretched to the time the
+        frames actually take, and shrinks back to `interval` once they take
+        less. In all cases, the frames are scheduled `interval` seconds apart
+        on a monotonic clock, unaffected by changes of the system time. This
+        is optional and defaults to 'skip'.
+    decode_scale : int
+        The factor by which the width and the height of the frames are
+        reduced while decoding them. This can be 1, 2, 4, or 8. This is
+        optional and defaults to 1.
+    decode_grayscale : bool
+        Whether the frames are decoded to grayscale. This is optional and
+        defaults to False.
+    cameras_per_task : int
+        The number of cameras analyzed together by a single Spark task. A
+        task spends most of its time waiting for the network, so a single
+        core can serve many cameras. This is optional and defaults to 1.
+    fetch_threads : int
+        The number of threads fetching frames in a task of more than one
+        camera. This is optional and defaults to one thread per camera.
+    analysis_threads : int
+        The number of threads analyzing frames in a task of more than one
+        camera. This is optional and defaults to 1.
+    max_corrupted_frames : int
+        The maximum number of corrupted frames from a camera before giving up
+        on the camera. This is optional and defaults to no limit.
+    backoff_initial : float
+        The time to wait after the first of consecutive corrupted frames from
+        a camera in seconds. The time doubles with every consecutive corrupted
+        frame. This is optional and defaults to 0.5.
+    backoff_max : float
+        The maximum time to wait after a corrupted frame in seconds. This is
+        optional and defaults to 30.
+    restart_after_failures : int
+        The number of consecutive corrupted frames from a camera after which
+        its stream is restarted. This is optional and defaults to 5.
+    give_up_after_failures : int
+        The number of consecutive corrupted frames from a camera after which
+        the analysis of the camera is stopped. This is optional and defaults
+        to no limit.
+    pipeline_depth : int
+        The maximum number of frames of a camera fetched and decoded ahead of
+        the analyzer, so that fetching, decoding, and analyzing the frames
+        overlap. This applies to the tasks of a single camera. This is
+        optional and defaults to 0, i.e. the frames are fetched, decoded, and
+        analyzed one after the other.
+    decode_threads : int
+        The number of threads decoding frames in every executor process when
+        `pipeline_depth` is set. This is optional and defaults to 2.
+    analyzer_process : bool
+        Whether the analyzer of a camera runs in a separate process from the
+        fetching of its frames, which are passed through shared memory. This
+        applies to the tasks of a single camera. At most `pipeline_depth`
+        frames (or 2 if it is not set) wait to be analyzed, and the frames
+        fetched while the analyzer is that far behind are dropped. This is
+        optional and defaults to False.
+    upload_workers : int
+        The number of threads uploading the saved results in every executor
+        process, so that saving a result only queues it. If it is 0, the
+        results are uploaded by the analyzer as they are saved. This is
+        optional and defaults to 4.
+    upload_queue_size : int
+        The maximum number of saved results waiting to be uploaded in every
+        executor process. This is optional and defaults to 64.
+    upload_overflow : str
+        What to do with a saved result when `upload_queue_size` results are
+        already waiting. If it is 'block', the analyzer waits for room in the
+        queue. If it is 'drop', the result is dropped. If it is 'inline', the
+        result is uploaded right away by the analyzer. This is optional and
+        defaults to 'block'.
+    pack_results : bool
+        Whether the results of a camera are appended to a few large result
+        containers (see `CAM2Results`), rather than saved in a file each, to
+        spare the HDFS namenode. This is optional and defaults to False.
+    pack_max_size : int
+        The size in bytes after which a result container is closed and the
+        next one is started. This is optional and defaults to 128 MiB.
+    pack_max_age : float
+        The time in seconds after which a result container is closed and the
+        next one is started. This is optional and defaults to 600.
+    image_format : str
+        The format in which the images saved by the analyzers are encoded:
+        'jpeg', 'png', or 'webp'. The extension of the file name of an image
+        is replaced by the extension of the format if they differ. This is
+        optional and defaults to the format of the extension of the file
+        name of every image.
+    jpeg_quality : int
+        The quality of the saved JPEG images from 0 to 100. This is optional
+        and defaults to the default quality of OpenCV (95).
+    png_compression : int
+        The compression level of the saved PNG images from 0 to 9. This is
+        optional and defaults to the default level of OpenCV (1).
+    webp_quality : int
+        The quality of the saved WebP images from 1 to 100, or above 100 for
+        lossless images. This is optional and defaults to the default
+        quality of OpenCV (lossless).
+    image_scale : float
+        The factor by which the width and the height of the saved images are
+        reduced before encoding them, in (0, 1]. This is optional and
+        defaults to 1.
+    batch_size : int
+        The number of frames passed together to the `on_new_batch` method of
+        the analyzer, instead of passing every frame to its `on_new_frame`
+        method. This is optional and defaults to 1, i.e. no batches.
+    batch_max_wait : float
+        The maximum time in seconds the first frame of a batch waits for the
+        batch to be full before the batch is analyzed as it is. This is
+        optional and defaults to no limit.
+    partition_batch : bool
+        Whether the cameras analyzed by a single Spark task share a single
+        analyzer, which receives a frame from every camera at once through
+        its `on_new_frames` method. This is optional and defaults to False.
+    profile : bool
+        Whether the latency histograms of the stages of the analysis (e.g.
+        fetching frames, `on_new_frame`, and saving results) and the number
+        of missed intervals are saved with the results of every camera. This
+        is optional and defaults to False.
+    profile_callbacks : bool
+        Whether the event handlers of the analyzer are profiled with
+        cProfile, and the statistics saved with the results of every camera
+        if `profile` is set. This is optional and defaults to False.
+    analysis_classes : list of str
+        The names of the analysis classes. The `analysis_class` of the JSON
+        object is either the name of a single class, or a list of names, in
+        which case the frames of every camera are fetched and decoded once,
+        and passed to an instance of every class. The results of every class
+        are then saved in a directory of their own.
+    analysis_class : str
+        The name of the first analysis class.
     cameras : list of `Camera`
         The list of cameras to be analyzed.
 
@@ -75,6 +232,11 @@ class Request(object):
         file_name : str
             The file name of the input JSON file.
 
+        Raises
+        ------
+        ValueError
+            If the value of an optional attribute is invalid.
+
         See Also
         --------
         write_to_file(file_name) : Write the request to a JSON file.
@@ -90,9 +252,75 @@ class Request(object):
         self.interval = request[constants.INTERVAL_ATTRIBUTE]
         self.duration = request[constants.DURATION_ATTRIBUTE]
         self.snapshots_to_keep = request[constants.SNAPSHOTS_TO_KEEP_ATTRIBUTE]
+        self.metadata_to_keep = request.get(
+            constants.METADATA_TO_KEEP_ATTRIBUTE, 1000)
         self.is_video = request[constants.IS_VIDEO_ATTRIBUTE]
-        self.analysis_class = request[constants.ANALYSIS_CLASS_ATTRIBUTE]
+        self.latest_frame_only = request.get(
+            constants.LATEST_FRAME_ONLY_ATTRIBUTE, False)
+        self.shared_streams = request.get(
+            constants.SHARED_STREAMS_ATTRIBUTE, False)
+        self.duplicate_frames = request.get(
+            constants.DUPLICATE_FRAMES_ATTRIBUTE,
+            constants.DUPLICATE_FRAMES_FLAG)
+        self.overrun_policy = request.get(
+            constants.OVERRUN_POLICY_ATTRIBUTE,
+            constants.OVERRUN_POLICY_SKIP)
+        self.decode_scale = request.get(constants.DECODE_SCALE_ATTRIBUTE, 1)
+        self.decode_grayscale = request.get(
+            constants.DECODE_GRAYSCALE_ATTRIBUTE, False)
+        self.cameras_per_task = request.get(
+            constants.CAMERAS_PER_TASK_ATTRIBUTE, 1)
+        self.fetch_threads = request.get(constants.FETCH_THREADS_ATTRIBUTE)
+        self.analysis_threads = request.get(
+            constants.ANALYSIS_THREADS_ATTRIBUTE, 1)
+        self.max_corrupted_frames = request.get(
+            constants.MAX_CORRUPTED_FRAMES_ATTRIBUTE)
+        self.backoff_initial = request.get(
+            constants.BACKOFF_INITIAL_ATTRIBUTE, 0.5)
+        self.backoff_max = request.get(constants.BACKOFF_MAX_ATTRIBUTE, 30)
+        self.restart_after_failures = request.get(
+            constants.RESTART_AFTER_FAILURES_ATTRIBUTE, 5)
+        self.give_up_after_failures = request.get(
+            constants.GIVE_UP_AFTER_FAILURES_ATTRIBUTE)
+        self.pipeline_depth = request.get(
+            constants.PIPELINE_DEPTH_ATTRIBUTE, 0)
+        self.decode_threads = request.get(
+            constants.DECODE_THREADS_ATTRIBUTE, 2)
+        self.analyzer_process = request.get(
+            constants.ANALYZER_PROCESS_ATTRIBUTE, False)
+        self.upload_workers = request.get(
+            constants.UPLOAD_WORKERS_ATTRIBUTE, 4)
+        self.upload_queue_size = request.get(
+            constants.UPLOAD_QUEUE_SIZE_ATTRIBUTE, 64)
+        self.upload_overflow = request.get(
+            constants.UPLOAD_OVERFLOW_ATTRIBUTE,
+            constants.UPLOAD_OVERFLOW_BLOCK)
+        self.pack_results = request.get(constants.PACK_RESULTS_ATTRIBUTE,
+                                        False)
+        self.pack_max_size = request.get(constants.PACK_MAX_SIZE_ATTRIBUTE,
+                                         128 << 20)
+        self.pack_max_age = request.get(constants.PACK_MAX_AGE_ATTRIBUTE, 600)
+        self.image_format = request.get(constants.IMAGE_FORMAT_ATTRIBUTE)
+        self.jpeg_quality = request.get(constants.JPEG_QUALITY_ATTRIBUTE)
+        self.png_compression = request.get(
+            constants.PNG_COMPRESSION_ATTRIBUTE)
+        self.webp_quality = request.get(constants.WEBP_QUALITY_ATTRIBUTE)
+        self.image_scale = request.get(constants.IMAGE_SCALE_ATTRIBUTE, 1)
+        self.batch_size = request.get(constants.BATCH_SIZE_ATTRIBUTE, 1)
+        self.batch_max_wait = request.get(constants.BATCH_MAX_WAIT_ATTRIBUTE)
+        self.partition_batch = request.get(
+            constants.PARTITION_BATCH_ATTRIBUTE, False)
+        self.profile = request.get(constants.PROFILE_ATTRIBUTE, False)
+        self.profile_callbacks = request.get(
+            constants.PROFILE_CALLBACKS_ATTRIBUTE, False)
+        analysis_class = request[constants.ANALYSIS_CLASS_ATTRIBUTE]
+        if isinstance(analysis_class, basestring):
+            self.analysis_classes = [analysis_class]
+        else:
+            self.analysis_classes = list(analysis_class)
+        self.analysis_class = self.analysis_classes[0]
         self.timestamp = request[constants.TIMESTAMP_ATTRIBUTE]
+        self._validate()
 
         # Construct the list of `Camera` objects using the information
         # extracted from the JSON object.
@@ -127,3 +355,61 @@ class Request(object):
                     camera[constants.CAMERA_LATITUDE_ATTRIBUTE],
                     camera[constants.CAMERA_LONGITUDE_ATTRIBUTE])
                 self.cameras.append(non_ip_camera)
+
+            elif camera[constants.CAMERA_TYPE_ATTRIBUTE] == \
+                    constants.CAMERA_TYPE_REPLAY:
+                # If it is a recorded camera, Initialize a `ReplayCamera`
+                # instance with the capture file, and add it to the `cameras`
+                # list. The capture file has to be readable by all the
+                # workers (e.g. on a shared file system).
+                replay_camera = ReplayCamera(
+                    camera[constants.CAMERA_KEY_ATTRIBUTE],
+                    camera[constants.CAMERA_FILE_ATTRIBUTE],
+                    camera.get(constants.CAMERA_REALTIME_ATTRIBUTE, True),
+                    camera.get(constants.CAMERA_LOOP_ATTRIBUTE, False),
+                    camera.get(constants.CAMERA_LATITUDE_ATTRIBUTE),
+                    camera.get(constants.CAMERA_LONGITUDE_ATTRIBUTE))
+                self.cameras.append(replay_camera)
+
+        # Set the decode mode of all the cameras.
+        for camera in self.cameras:
+            camera.set_decode_mode(self.decode_scale, self.decode_grayscale)
+
+    def _validate(self):
+
+        """Check the values of the optional attributes.
+
+        The values are checked when the request is read, so that an invalid
+        request fails before any camera stream is opened.
+
+        Raises
+        ------
+        ValueError
+            If the value of an optional attribute is invalid.
+
+        """
+
+        if self.duplicate_frames not in (constants.DUPLICATE_FRAMES_FLAG,
+                                         constants.DUPLICATE_FRAMES_SKIP):
+            raise ValueError('Invalid duplicate frames policy: {}'.format(
+                self.duplicate_frames))
+        if self.overrun_policy not in (constants.OVERRUN_POLICY_SKIP,
+                                       constants.OVERRUN_POLICY_CATCH_UP,
+                                       constants.OVERRUN_POLICY_ADAPT):
+            raise ValueError('Invalid overrun policy: {}'.format(
+                self.overrun_policy))
+        if self.upload_overflow not in (constants.UPLOAD_OVERFLOW_BLOCK,
+                                        constants.UPLOAD_OVERFLOW_DROP,
+                                        constants.UPLOAD_OVERFLOW_INLINE):
+            raise ValueError('Invalid upload overflow policy: {}'.format(
+                self.upload_overflow))
+        for name, value, minimum in [
+                ('cameras per task', self.cameras_per_task, 1),
+                ('batch size', self.batch_size, 1),
+                ('pipeline depth', self.pipeline_depth, 0)]:
+            if isinstance(value, bool) or \
+                    not isinstance(value, (int, long)) or value < minimum:
+                raise ValueError('Invalid {}: {}'.format(name, value))
+        image_encoder.check_settings(self.image_format, self.image_scale, {
+            'jpeg': self.jpeg_quality, 'png': self.png_compression,
+            'webp': self.webp_quality})
@@ -0,0 +1,570 @@
+"""Provide the packing of many results into a few large files.
+
+This module provides an append-only container format for the results of a
+camera, so that a long analysis saves a few large files to HDFS rather than
+a file for every result, which costs the namenode memory and RPCs. The
+results are appended to a container until it reaches a maximum size or age,
+and then the container is closed and the next one is started.
+
+A result container consists of:
+1. A header holding the magic bytes, and the metadata of the container as a
+JSON object (e.g. the time at which it has been started).
+2. A record for every result, holding the time at which it has been saved,
+the size of its file name, and the size of its data, followed by the file
+name and the data.
+3. An index of the records as a JSON list, followed by a trailer pointing to
+it. These are appended when the container is closed. The index of a
+container that has not been closed (e.g. after a crash) is rebuilt by
+scanning the records.
+
+Class Listings
+--------------
+FormatError
+    Represent an error when a file is not a valid result container.
+ResultPackWriter
+    Represent a writer of the rolling result containers of a directory.
+ResultPackReader
+    Represent a reader of a result container.
+
+Function Listings
+-----------------
+list_packs
+    List the result containers of a directory.
+
+"""
+
+import json
+import struct
+import threading
+import time
+
+from CAM2DistributedBackend.util.scheduler import monotonic
+
+# The magic bytes at the start of a result container, and before its index.
+MAGIC = b'CAM2PAK1'
+INDEX_MAGIC = b'CAM2IDX1'
+
+# The extension of the file names of the result containers.
+PACK_EXTENSION = '.pack'
+
+# The structures of the header, the header of every record, and the trailer.
+_HEADER = struct.Struct('<8sI')
+_RECORD_HEADER = struct.Struct('<dII')
+_TRAILER = struct.Struct('<QQ8s')
+
+# The records are appended to the storage in chunks of at least this size, or
+# when the container is closed.
+_FLUSH_SIZE = 1 << 20
+
+
+class FormatError(Exception):
+
+    """Represent an error when a file is not a valid result container.
+
+    """
+
+    pass
+
+
+class ResultPackWriter(object):
+
+    """Represent a writer of the rolling result containers of a directory.
+
+    This class represents the containers to which the results of a camera are
+    appended, in the directory of a storage backend. The containers are named
+    'results-00000.pack', 'results-00001.pack', etc. The records are buffered
+    in memory, and appended in chunks. A container is closed once it reaches
+    its maximum age even if no result is written after that, by a timer. The
+    methods are thread-safe.
+
+    Attributes
+    ----------
+    max_size : int
+        The size in bytes after which a container is closed.
+    max_age : float
+        The time in seconds after which a container is closed, or None if
+        the containers are closed only by size.
+    containers : int
+        The number of containers started so far.
+
+    Methods
+    -------
+    write(self, name, data, timestamp=None)
+        Append a result to the current container.
+    close(self)
+        Close the current container.
+
+    """
+
+    def __init__(self, client, max_size, max_age=None, prefix='results'):
+
+        """Initialize a `ResultPackWriter` instance.
+
+        Parameters
+        ----------
+        client : `StorageBackend`
+            The storage backend of the directory of the containers.
+        max_size : int
+            The size in bytes after which a container is closed.
+        max_age : float, optional
+            The time in seconds after which a container is closed. By
+            default, the containers are closed only by size.
+        prefix : str, optional
+            The prefix of the file names of the containers.
+
+        """
+
+        self.max_size = max_size
+        self.max_age = max_age
+        self.containers = 0
+
+        self._client = client
+        self._prefix = prefix
+        self._lock = threading.Lock()
+
+        # The file name, the size, and the start time of the current
+        # container, the data not appended yet and its records, the index of
+        # the records, and the timer closing the container at its maximum
+        # age.
+        self._file_name = None
+        self._size = 0
+        self._start_time = None
+        self._buffer = []
+        self._buffer_size = 0
+        self._records = []
+        self._created = False
+        self._index = []
+        self._timer = None
+
+    def write(self, name, data, timestamp=None):
+
+        """Append a result to the current container.
+
+        A container is started if there is none, and closed after the result
+        if it has reached its maximum size or age.
+
+        Parameters
+        ----------
+        name : str
+            The file name of the result.
+        data : str
+            The data of the result.
+        timestamp : float, optional
+            The time at which the result has been saved. By default, it is
+            the current time.
+
+        """
+
+        if timestamp is None:
+            timestamp = time.time()
+        if isinstance(name, unicode):
+            name = name.encode('utf-8')
+        with self._lock:
+            if self._file_name is None:
+                self._start()
+            self._append_record(name, data, timestamp)
+
+            if self._size >= self.max_size or (
+                    self.max_age is not None and
+                    monotonic() - self._start_time >= self.max_age):
+                self._close()
+            elif self._buffer_size >= _FLUSH_SIZE:
+                self._flush()
+
+    def close(self):
+
+        """Close the current container.
+
+        The index and the trailer are appended to the container. The next
+        result starts a new container.
+
+        """
+
+        with self._lock:
+            timer = self._timer
+            if self._file_name is not None:
+                self._close()
+
+        # Wait for the timer of the container to stop, outside of the lock,
+        # which the timer may be waiting for.
+        if timer is not None and timer is not threading.current_thread():
+            timer.join()
+
+    def _start(self):
+
+        """Start a new container.
+
+        """
+
+        self._file_name = '{}-{:05d}{}'.format(self._prefix, self.containers,
+                                               PACK_EXTENSION)
+        self._size = 0
+        self._start_time = monotonic()
+        self._created = False
+        self._index = []
+        self.containers += 1
+        header = json.dumps({'created': time.time()})
+        self._append(_HEADER.pack(MAGIC, len(header)) + header)
+
+        if self.max_age is not None:
+            self._timer = threading.Timer(self.max_age, self._expire,
+                                          (self._file_name,))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _expire(self, file_name):
+
+        """Close a container that has reached its maximum age.
+
+        Parameters
+        ----------
+        file_name : str
+            The file name of the container, which is not closed if it has
+            already been closed.
+
+        """
+
+        with self._lock:
+            if self._file_name != file_name:
+                return
+            try:
+                self._close()
+            except Exception:
+                # The records are kept, and appended by the next write or
+                # close.
+                pass
+
+    def _append_record(self, name, data, timestamp):
+
+        """Append a result to the buffer of the current container.
+
+        Parameters
+        ----------
+        name : str
+            The file name of the result.
+        data : str
+            The data of the result.
+        timestamp : float
+            The time at which the result has been saved.
+
+        """
+
+        record_header = _RECORD_HEADER.pack(timestamp, len(name), len(data))
+        offset = self._size + len(record_header) + len(name)
+        self._append(record_header + name)
+        self._append(data)
+        self._index.append((name, timestamp, offset, len(data)))
+        self._records.append((name, data, timestamp))
+
+    def _append(self, data):
+
+        """Append data to the buffer of the current container.
+
+        Parameters
+        ----------
+        data : str
+            The data.
+
+        """
+
+        self._buffer.append(data)
+        self._buffer_size += len(data)
+        self._size += len(data)
+
+    def _flush(self):
+
+        """Append the buffer to the current container in the storage.
+
+        The container is created by the first flush, overwriting a container
+        left by an earlier attempt of the task. If the flush fails, the
+        container, which may hold a part of the buffer, is left as it is,
+        without an index, and the records of the buffer are moved to a new
+        container, to be appended by the next flush. A record appended in
+        full before the failure is then found in both containers.
+
+        """
+
+        if not self._buffer:
+            return
+        data = b''.join(self._buffer)
+        try:
+            if self._created:
+                self._client.write(self._file_name, data, append=True)
+            else:
+                self._client.write(self._file_name, data, overwrite=True)
+                self._created = True
+        except Exception:
+            records = self._records
+            self._clear_buffer()
+            self._cancel_timer()
+            self._file_name = None
+            if records:
+                self._start()
+                for record in records:
+                    self._append_record(*record)
+            raise
+        self._clear_buffer()
+
+    def _clear_buffer(self):
+
+        """Clear the buffer of the current container.
+
+        """
+
+        self._buffer = []
+        self._buffer_size = 0
+        self._records = []
+
+    def _cancel_timer(self):
+
+        """Cancel the timer closing the current container, if any.
+
+        """
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _close(self):
+
+        """Append the index and the trailer, and close the current container.
+
+        If appending fails, the records that have not been appended are kept
+        in a new container (see `_flush`).
+
+        """
+
+        index = json.dumps(self._index)
+        index_offset = self._size
+        self._append(index)
+        self._append(_TRAILER.pack(index_offset, len(index), INDEX_MAGIC))
+        self._flush()
+        self._cancel_timer()
+        self._file_name = None
+
+
+class ResultPackReader(object):
+
+    """Represent a reader of a result container.
+
+    Attributes
+    ----------
+    file_name : str
+        The file name of the container.
+    metadata : dict
+        The metadata of the container.
+    index : list of tuple
+        The file name, the time at which it has been saved, the offset of
+        the data, and the size of the data of every result, in the order in
+        which the results have been saved.
+    is_closed : bool
+        Whether the container has been closed. The index of a container that
+        has not been closed is rebuilt from its records.
+
+    Methods
+    -------
+    read(self, name)
+        Read the data of a result.
+    read_entry(self, i)
+        Read the data of the result of an entry of the index.
+
+    """
+
+    def __init__(self, client, file_name):
+
+        """Initialize a `ResultPackReader` instance, and read the index.
+
+        Parameters
+        ----------
+        client : `StorageBackend`
+            The storage backend of the directory of the container.
+        file_name : str
+            The file name of the container.
+
+        Raises
+        ------
+        FormatError
+            If the file is not a valid result container.
+
+        """
+
+        self.file_name = file_name
+
+        self._client = client
+        self._size = client.size(file_name)
+        header = self._read(0, min(self._size, _HEADER.size))
+        if len(header) < _HEADER.size:
+            raise FormatError('Truncated result container.')
+        magic, header_size = _HEADER.unpack(header)
+        if magic != MAGIC:
+            raise FormatError('Not a result container.')
+        records_offset = _HEADER.size + header_size
+        try:
+            self.metadata = json.loads(self._read(_HEADER.size, header_size))
+        except ValueError:
+            raise FormatError('Invalid metadata.')
+
+        self.index = self._read_index(records_offset)
+        self.is_closed = self.index is not None
+        if not self.is_closed:
+            self.index = self._scan_records(records_offset)
+
+        # The most recent entry of every file name.
+        self._entries = dict((entry[0], i)
+                             for i, entry in enumerate(self.index))
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def read(self, name):
+
+        """Read the data of a result.
+
+        Parameters
+        ----------
+        name : str
+            The file name of the result. If many results have been saved
+            with the file name, the most recent of them is read.
+
+        Returns
+        -------
+        str
+            The data of the result.
+
+        Raises
+        ------
+        KeyError
+            If there is no result with the file name.
+
+        """
+
+        return self.read_entry(self._entries[name])
+
+    def read_entry(self, i):
+
+        """Read the data of the result of an entry of the index.
+
+        Parameters
+        ----------
+        i : int
+            The position of the entry in the index.
+
+        Returns
+        -------
+        str
+            The data of the result.
+
+        """
+
+        _, _, offset, size = self.index[i]
+        return self._read(offset, size)
+
+    def _read(self, offset, length):
+
+        """Read a range of the container.
+
+        Parameters
+        ----------
+        offset : int
+            The offset of the range.
+        length : int
+            The length of the range.
+
+        Returns
+        -------
+        str
+            The data of the range.
+
+        """
+
+        if length == 0:
+            return b''
+        return self._client.read(self.file_name, offset, length)
+
+    def _read_index(self, records_offset):
+
+        """Read the index of the container.
+
+        Parameters
+        ----------
+        records_offset : int
+            The offset of the first record in the container.
+
+        Returns
+        -------
+        list of tuple
+            The index of the results, or None if the container has not been
+            closed.
+
+        """
+
+        if self._size < records_offset + _TRAILER.size:
+            return None
+        index_offset, index_size, magic = _TRAILER.unpack(
+            self._read(self._size - _TRAILER.size, _TRAILER.size))
+        if magic != INDEX_MAGIC or \
+                index_offset + index_size != self._size - _TRAILER.size:
+            return None
+        try:
+            index = json.loads(self._read(index_offset, index_size))
+        except ValueError:
+            return None
+        return [(name.encode('utf-8'), timestamp, offset, size)
+                for name, timestamp, offset, size in index]
+
+    def _scan_records(self, records_offset):
+
+        """Rebuild the index of the container from its records.
+
+        A record that has been cut short is ignored.
+
+        Parameters
+        ----------
+        records_offset : int
+            The offset of the first record in the container.
+
+        Returns
+        -------
+        list of tuple
+            The index of the results.
+
+        """
+
+        data = self._read(0, self._size)
+        index = []
+        position = records_offset
+        while position + _RECORD_HEADER.size <= len(data):
+            timestamp, name_size, size = _RECORD_HEADER.unpack_from(
+                data, position)
+            position += _RECORD_HEADER.size
+            if position + name_size + size > len(data):
+                break
+            name = data[position:position + name_size]
+            position += name_size
+            index.append((name, timestamp, position, size))
+            position += size
+        return index
+
+
+def list_packs(client):
+
+    """List the result containers of a directory.
+
+    Parameters
+    ----------
+    client : `StorageBackend`
+        The storage backend of the directory.
+
+    Returns
+    -------
+    list of str
+        The file names of the containers, in the order in which they have
+        been started.
+
+    """
+
+    return sorted(name for name in client.list('')
+                  if name.endswith(PACK_EXTENSION))
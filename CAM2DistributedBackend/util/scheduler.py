@@ -0,0 +1,340 @@
+"""Provide the scheduling of the frames of a camera.
+
+This module provides the `FrameScheduler` class that decides when the next
+frame of a camera is due. The frames are scheduled at absolute deadlines of a
+monotonic clock, `interval` seconds apart, so neither the time spent on a
+frame nor a jump of the wall clock (e.g. by NTP) shifts the schedule. A frame
+that takes longer than the interval overruns the deadline of the next frame,
+and the scheduler handles it according to its overrun policy:
+
+skip
+    The frames of the missed deadlines are skipped, and the next frame is
+    due at the next deadline of the schedule.
+catch_up
+    The frames of the missed deadlines are fetched right away, one after
+    the other, until the schedule is caught up.
+adapt
+    The interval is stretched to the time the frames actually take, and
+    shrinks back to the requested interval once they take less.
+
+The time at which every frame has been scheduled and how late it started are
+recorded in the metadata of the frame, and the lateness and the missed
+intervals are measured by the profiler of the camera.
+
+Class Listings
+--------------
+FrameScheduler
+    Represent the schedule of the frames of a camera.
+
+Function Listings
+-----------------
+monotonic
+    Get the time of a monotonic clock.
+
+"""
+
+import ctypes
+import ctypes.util
+import math
+import os
+import sys
+import time
+
+import constants
+
+# The weight of the time of the most recent frame in the average time of the
+# frames, which the `adapt` policy stretches the interval to.
+_ADAPT_WEIGHT = 0.25
+
+
+class _Timespec(ctypes.Structure):
+
+    """Represent the `struct timespec` of the C library.
+
+    """
+
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def _get_clock_gettime():
+
+    """Get the `clock_gettime` function of the C library, if there is one.
+
+    Returns
+    -------
+    callable
+        The `clock_gettime` function, or None if it is not available (e.g.
+        on systems other than Linux).
+
+    """
+
+    # The ID of the monotonic clock differs between systems.
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        library = ctypes.CDLL(ctypes.util.find_library('rt') or
+                              ctypes.util.find_library('c'), use_errno=True)
+        clock_gettime = library.clock_gettime
+    except (OSError, AttributeError):
+        return None
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+    return clock_gettime
+
+
+# CLOCK_MONOTONIC on Linux.
+_CLOCK_MONOTONIC = 1
+_clock_gettime = _get_clock_gettime()
+
+
+def monotonic():
+
+    """Get the time of a monotonic clock.
+
+    The clock never goes backwards, and is not affected by changes of the
+    wall clock. It falls back to the wall clock on systems without
+    `clock_gettime`.
+
+    Returns
+    -------
+    float
+        The time of the clock in seconds, from an arbitrary origin.
+
+    """
+
+    if _clock_gettime is None:
+        return time.time()
+    timespec = _Timespec()
+    if _clock_gettime(_CLOCK_MONOTONIC, ctypes.byref(timespec)) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+    return timespec.tv_sec + timespec.tv_nsec * 1e-9
+
+
+class FrameScheduler(object):
+
+    """Represent the schedule of the frames of a camera.
+
+    This class represents the deadlines at which the frames of a camera are
+    due, from the time the scheduler is created until the end of the analysis
+    duration. The first frame is due right away.
+
+    Attributes
+    ----------
+    interval : float
+        The requested interval between every two successive frames in
+        seconds.
+    policy : str
+        The overrun policy: `constants.OVERRUN_POLICY_SKIP`,
+        `constants.OVERRUN_POLICY_CATCH_UP`, or
+        `constants.OVERRUN_POLICY_ADAPT`.
+    current_interval : float
+        The interval between the current frame and the next frame in
+        seconds, which differs from `interval` only if it is adapted.
+    deadline : float
+        The time of the monotonic clock at which the next frame is due.
+    end_time : float
+        The time of the monotonic clock at which the analysis ends.
+    scheduled_time : float
+        The time since the epoch at which the current frame has been
+        scheduled in seconds.
+    lateness : float
+        The time in seconds by which the current frame started after its
+        deadline.
+
+    Methods
+    -------
+    is_due(self)
+        Check whether the next frame is due.
+    wait(self)
+        Sleep until the next frame is due.
+    start_frame(self)
+        Mark the start of the next frame.
+    end_frame(self, delay=0)
+        Mark the end of the current frame, and schedule the next frame.
+
+    """
+
+    def __init__(self, interval, duration, policy=None, profiler=None):
+
+        """Initialize a `FrameScheduler` instance.
+
+        Parameters
+        ----------
+        interval : float
+            The interval between every two successive frames in seconds.
+        duration : float
+            The total analysis duration in seconds.
+        policy : str, optional
+            The overrun policy. This defaults to
+            `constants.OVERRUN_POLICY_SKIP`.
+        profiler : `Profiler`, optional
+            The profiler measuring the sleeping time, the lateness of the
+            frames, and the missed intervals.
+
+        Raises
+        ------
+        ValueError
+            If the value of `policy` is invalid.
+
+        """
+
+        if policy is None:
+            policy = constants.OVERRUN_POLICY_SKIP
+        if policy not in (constants.OVERRUN_POLICY_SKIP,
+                          constants.OVERRUN_POLICY_CATCH_UP,
+                          constants.OVERRUN_POLICY_ADAPT):
+            raise ValueError('Invalid overrun policy: {}'.format(policy))
+
+        self.interval = interval
+        self.policy = policy
+        self.current_interval = interval
+        self.deadline = monotonic()
+        self.end_time = self.deadline + duration
+        self.scheduled_time = None
+        self.lateness = None
+
+        self._profiler = profiler
+
+        # The deadlines are computed from the origin of the schedule and the
+        # number of intervals since, rather than added up, so no rounding
+        # error accumulates over a long analysis.
+        self._origin = self.deadline
+        self._slot = 0
+
+        # The wall clock is read once, to convert the deadlines to times
+        # since the epoch in the metadata of the frames.
+        self._epoch_offset = time.time() - self.deadline
+
+        # The start of the current frame, and the average time of the frames
+        # for the `adapt` policy.
+        self._frame_start = None
+        self._average_time = None
+
+    def is_due(self):
+
+        """Check whether the next frame is due.
+
+        Returns
+        -------
+        bool
+            Whether the deadline of the next frame has passed.
+
+        """
+
+        return monotonic() >= self.deadline
+
+    def wait(self):
+
+        """Sleep until the next frame is due.
+
+        Returns
+        -------
+        bool
+            Whether the next frame is due before the end of the analysis
+            duration. If it is not, the method returns without sleeping.
+
+        """
+
+        if self.deadline >= self.end_time:
+            return False
+        sleep_time = self.deadline - monotonic()
+        if sleep_time > 0:
+            time.sleep(sleep_time)
+            if self._profiler is not None:
+                self._profiler.record('sleep', sleep_time)
+        return True
+
+    def start_frame(self):
+
+        """Mark the start of the next frame.
+
+        This sets the `scheduled_time` and the `lateness` of the frame.
+
+        """
+
+        self._frame_start = monotonic()
+        self.scheduled_time = self.deadline + self._epoch_offset
+        self.lateness = max(self._frame_start - self.deadline, 0.0)
+        if self._profiler is not None:
+            self._profiler.record('lateness', self.lateness)
+
+    def end_frame(self, delay=0):
+
+        """Mark the end of the current frame, and schedule the next frame.
+
+        Parameters
+        ----------
+        delay : float, optional
+            The minimum time to wait before the next frame in seconds (e.g.
+            to back off after a corrupted frame). The schedule starts over
+            after the delay, rather than catching up with it.
+
+        """
+
+        now = monotonic()
+        missed = 0
+        if self.interval <= 0:
+            self._start_over(now)
+        elif self.policy == constants.OVERRUN_POLICY_SKIP:
+            self._slot += 1
+            if self._get_deadline() < now:
+                missed = int(math.ceil(
+                    (now - self._get_deadline()) / self.interval))
+                self._slot += missed
+        elif self.policy == constants.OVERRUN_POLICY_CATCH_UP:
+            self._slot += 1
+        else:
+            # Stretch the interval to the average time of the frames, and
+            # start the schedule over if the frame still overran it.
+            frame_time = now - (self._frame_start or now)
+            if self._average_time is None:
+                self._average_time = frame_time
+            else:
+                self._average_time += _ADAPT_WEIGHT * \
+                    (frame_time - self._average_time)
+            self.current_interval = max(self.interval, self._average_time)
+            deadline = max(self.deadline + self.current_interval, now)
+            missed = int((deadline - self.deadline) / self.interval) - 1
+            self._start_over(deadline)
+
+        # Back off, skipping to the first deadline of the schedule after the
+        # delay for the `skip` policy.
+        if delay > 0 and self._get_deadline() < now + delay:
+            if self.policy == constants.OVERRUN_POLICY_SKIP and \
+                    self.interval > 0:
+                self._slot += int(math.ceil(
+                    (now + delay - self._get_deadline()) / self.interval))
+            else:
+                self._start_over(now + delay)
+
+        self.deadline = self._get_deadline()
+        if missed > 0 and self._profiler is not None:
+            self._profiler.missed_intervals += missed
+
+    def _get_deadline(self):
+
+        """Get the deadline of the current slot of the schedule.
+
+        Returns
+        -------
+        float
+            The time of the monotonic clock at which the slot is due.
+
+        """
+
+        return self._origin + self._slot * self.current_interval
+
+    def _start_over(self, origin):
+
+        """Start the schedule over at a new origin.
+
+        Parameters
+        ----------
+        origin : float
+            The time of the monotonic clock at which the first frame of the
+            new schedule is due.
+
+        """
+
+        self._origin = origin
+        self._slot = 0
@@ -0,0 +1,595 @@
+"""Provide the storage backends of the results.
+
+This module provides the backends in which the results are stored, and the
+`create_backend` function that chooses one by the scheme of a storage URL:
+
+http://, https://, hdfs://, webhdfs://, swebhdfs://
+    HDFS, through the WebHDFS API of the namenode at the host and port of
+    the URL (e.g. 'hdfs://namenode:50070'), under the path of the URL, if
+    any (e.g. 'hdfs://namenode:50070/cam2'). The 'https' and 'swebhdfs'
+    schemes use HTTPS.
+file://
+    A directory of the local file system (e.g. 'file:///data/cam2'). The
+    data written since the last fsync, and the directories holding it, are
+    synced every `fsync` writes or every `fsync_interval` seconds if the URL
+    sets them (e.g. 'file:///data/cam2?fsync=100&fsync_interval=10'), once
+    many files have been written, and when the backend is closed.
+memory://
+    A dictionary in the memory of the process, shared by all the memory
+    backends of the process, for tests.
+
+Class Listings
+--------------
+StorageBackend
+    Represent the base class of all the storage backends.
+HDFSBackend
+    Represent a directory of HDFS.
+LocalBackend
+    Represent a directory of the local file system.
+MemoryBackend
+    Represent a directory of files kept in memory.
+
+Function Listings
+-----------------
+create_backend
+    Create the storage backend of a storage URL.
+
+"""
+
+import errno
+import os
+import posixpath
+import threading
+import urlparse
+
+from hdfs import InsecureClient
+
+from CAM2DistributedBackend.util.scheduler import monotonic
+
+# The schemes of the storage URLs of HDFS, and the scheme of the URL of the
+# WebHDFS API of every one of them.
+_HDFS_SCHEMES = {
+    'http': 'http',
+    'https': 'https',
+    'hdfs': 'http',
+    'webhdfs': 'http',
+    'swebhdfs': 'https',
+}
+
+# The number of files written to a local directory after which they are
+# synced, whatever the `fsync` setting, so that the files to be synced do not
+# pile up.
+_MAX_UNSYNCED_FILES = 1000
+
+
+class StorageBackend(object):
+
+    """Represent the base class of all the storage backends.
+
+    A storage backend holds the files of a single directory, given by their
+    paths relative to it.
+
+    Methods
+    -------
+    write(self, path, data, overwrite=False, append=False)
+        Write data to a file.
+    read(self, path, offset=0, length=None)
+        Read data from a file.
+    size(self, path)
+        Get the size of a file.
+    list(self, path='')
+        List the files of a directory.
+    close(self)
+        Make sure the written data is stored.
+
+    """
+
+    def write(self, path, data, overwrite=False, append=False):
+
+        """Write data to a file.
+
+        Parameters
+        ----------
+        path : str
+            The path of the file.
+        data : str
+            The data.
+        overwrite : bool, optional
+            Whether to overwrite the file if it exists.
+        append : bool, optional
+            Whether to append the data to the file.
+
+        Raises
+        ------
+        NotImplementedError
+            If the method is not overridden.
+
+        """
+
+        raise NotImplementedError('The write method has to be overridden.')
+
+    def read(self, path, offset=0, length=None):
+
+        """Read data from a file.
+
+        Parameters
+        ----------
+        path : str
+            The path of the file.
+        offset : int, optional
+            The offset of the data.
+        length : int, optional
+            The length of the data. By default, the data extends to the end
+            of the file.
+
+        Returns
+        -------
+        str
+            The data.
+
+        Raises
+        ------
+        NotImplementedError
+            If the method is not overridden.
+
+        """
+
+        raise NotImplementedError('The read method has to be overridden.')
+
+    def size(self, path):
+
+        """Get the size of a file.
+
+        Parameters
+        ----------
+        path : str
+            The path of the file.
+
+        Returns
+        -------
+        int
+            The size of the file in bytes.
+
+        Raises
+        ------
+        NotImplementedError
+            If the method is not overridden.
+
+        """
+
+        raise NotImplementedError('The size method has to be overridden.')
+
+    def list(self, path=''):
+
+        """List the files of a directory.
+
+        Parameters
+        ----------
+        path : str, optional
+            The path of the directory. By default, it is the directory of
+            the backend.
+
+        Returns
+        -------
+        list of str
+            The names of the files.
+
+        Raises
+        ------
+        NotImplementedError
+            If the method is not overridden.
+
+        """
+
+        raise NotImplementedError('The list method has to be overridden.')
+
+    def close(self):
+
+        """Make sure the written data is stored.
+
+        This method does nothing in the parent `StorageBackend` class.
+
+        """
+
+        pass
+
+
+class HDFSBackend(StorageBackend):
+
+    """Represent a directory of HDFS.
+
+    The files are accessed through the WebHDFS API of the namenode.
+
+    """
+
+    def __init__(self, url, root):
+
+        """Initialize an `HDFSBackend` instance.
+
+        Parameters
+        ----------
+        url : str
+            The URL of the WebHDFS API of the namenode.
+        root : str
+            The path of the directory.
+
+        """
+
+        self._client = InsecureClient(url, user='CAM2', root=root)
+
+    def write(self, path, data, overwrite=False, append=False):
+
+        """Write data to a file.
+
+        See `StorageBackend.write`.
+
+        """
+
+        self._client.write(path, data, overwrite=overwrite, append=append)
+
+    def read(self, path, offset=0, length=None):
+
+        """Read data from a file.
+
+        See `StorageBackend.read`.
+
+        """
+
+        with self._client.read(path, offset=offset, length=length) as reader:
+            return reader.read()
+
+    def size(self, path):
+
+        """Get the size of a file.
+
+        See `StorageBackend.size`.
+
+        """
+
+        return self._client.status(path)['length']
+
+    def list(self, path=''):
+
+        """List the files of a directory.
+
+        See `StorageBackend.list`.
+
+        """
+
+        return self._client.list(path)
+
+
+class LocalBackend(StorageBackend):
+
+    """Represent a directory of the local file system.
+
+    Every write is a single system call, and the written files are synced in
+    batches rather than after every write. The directories holding the
+    written files are synced with them, so that new files are not lost
+    either.
+
+    """
+
+    def __init__(self, root, fsync=0, fsync_interval=None):
+
+        """Initialize a `LocalBackend` instance.
+
+        Parameters
+        ----------
+        root : str
+            The path of the directory.
+        fsync : int, optional
+            The number of writes after which the written files are synced. By
+            default, the files are synced when the backend is closed, or once
+            `_MAX_UNSYNCED_FILES` files have been written.
+        fsync_interval : float, optional
+            The time in seconds after which the files written since the last
+            sync are synced by the next write.
+
+        """
+
+        self.root = root
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+
+        # The directories known to exist, and the files and the directories
+        # written since they have been synced.
+        self._directories = set()
+        self._written_paths = set()
+        self._written_directories = set()
+        self._writes = 0
+        self._sync_time = monotonic()
+        self._lock = threading.Lock()
+
+    def write(self, path, data, overwrite=False, append=False):
+
+        """Write data to a file.
+
+        See `StorageBackend.write`.
+
+        """
+
+        path = os.path.join(self.root, path)
+        directory = os.path.dirname(path)
+        new_directories = []
+        if directory not in self._directories:
+            # The entries of the directories to be created are in their
+            # parents, which are synced too.
+            missing = directory
+            while not os.path.isdir(missing):
+                missing = os.path.dirname(missing)
+                new_directories.append(missing)
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            self._directories.add(directory)
+
+        flags = os.O_WRONLY | os.O_CREAT
+        if append:
+            flags |= os.O_APPEND
+        elif overwrite:
+            flags |= os.O_TRUNC
+        else:
+            flags |= os.O_EXCL
+        fd = os.open(path, flags, 0o644)
+        try:
+            data = buffer(data)
+            while data:
+                data = data[os.write(fd, data):]
+        finally:
+            os.close(fd)
+
+        # Sync the written files once there are enough writes, or enough
+        # time has passed.
+        with self._lock:
+            self._written_paths.add(path)
+            self._written_directories.add(directory)
+            self._written_directories.update(new_directories)
+            self._writes += 1
+            if not (self.fsync and self._writes >= self.fsync or
+                    len(self._written_paths) >= _MAX_UNSYNCED_FILES or
+                    self.fsync_interval is not None and
+                    monotonic() - self._sync_time >= self.fsync_interval):
+                return
+            paths, directories = self._take_written()
+        _sync(paths)
+        _sync(directories)
+
+    def read(self, path, offset=0, length=None):
+
+        """Read data from a file.
+
+        See `StorageBackend.read`.
+
+        """
+
+        with open(os.path.join(self.root, path), 'rb') as f:
+            f.seek(offset)
+            return f.read() if length is None else f.read(length)
+
+    def size(self, path):
+
+        """Get the size of a file.
+
+        See `StorageBackend.size`.
+
+        """
+
+        return os.path.getsize(os.path.join(self.root, path))
+
+    def list(self, path=''):
+
+        """List the files of a directory.
+
+        See `StorageBackend.list`.
+
+        """
+
+        return os.listdir(os.path.join(self.root, path))
+
+    def close(self):
+
+        """Sync the files written since they have been synced.
+
+        """
+
+        with self._lock:
+            paths, directories = self._take_written()
+        _sync(paths)
+        _sync(directories)
+
+    def _take_written(self):
+
+        """Take the files and the directories written since the last sync.
+
+        This is called with the lock held.
+
+        Returns
+        -------
+        paths : set of str
+            The paths of the written files.
+        directories : set of str
+            The paths of the directories of the written files, and of the
+            parents of the new directories.
+
+        """
+
+        paths = self._written_paths
+        directories = self._written_directories
+        self._written_paths = set()
+        self._written_directories = set()
+        self._writes = 0
+        self._sync_time = monotonic()
+        return paths, directories
+
+
+class MemoryBackend(StorageBackend):
+
+    """Represent a directory of files kept in memory.
+
+    Attributes
+    ----------
+    files : dict
+        The data of every file of all the memory backends of the process, by
+        the absolute path of the file. This is a class attribute.
+
+    """
+
+    files = {}
+    _lock = threading.Lock()
+
+    def __init__(self, root):
+
+        """Initialize a `MemoryBackend` instance.
+
+        Parameters
+        ----------
+        root : str
+            The path of the directory.
+
+        """
+
+        self.root = root
+
+    def write(self, path, data, overwrite=False, append=False):
+
+        """Write data to a file.
+
+        See `StorageBackend.write`.
+
+        """
+
+        path = posixpath.join(self.root, path)
+        with self._lock:
+            if append and path in self.files:
+                self.files[path] += data
+            elif path in self.files and not (overwrite or append):
+                raise IOError(errno.EEXIST, 'File exists', path)
+            else:
+                self.files[path] = str(data)
+
+    def read(self, path, offset=0, length=None):
+
+        """Read data from a file.
+
+        See `StorageBackend.read`.
+
+        """
+
+        data = self._get(path)
+        return data[offset:] if length is None else \
+            data[offset:offset + length]
+
+    def size(self, path):
+
+        """Get the size of a file.
+
+        See `StorageBackend.size`.
+
+        """
+
+        return len(self._get(path))
+
+    def list(self, path=''):
+
+        """List the files of a directory.
+
+        See `StorageBackend.list`.
+
+        """
+
+        prefix = posixpath.join(self.root, path, '')
+        with self._lock:
+            return sorted(set(
+                name[len(prefix):].split('/')[0] for name in self.files
+                if name.startswith(prefix)))
+
+    def _get(self, path):
+
+        """Get the data of a file.
+
+        Parameters
+        ----------
+        path : str
+            The path of the file.
+
+        Returns
+        -------
+        str
+            The data of the file.
+
+        Raises
+        ------
+        IOError
+            If there is no such file.
+
+        """
+
+        path = posixpath.join(self.root, path)
+        with self._lock:
+            if path not in self.files:
+                raise IOError(errno.ENOENT, 'No such file', path)
+            return self.files[path]
+
+
+def _sync(paths):
+
+    """Sync written files or directories to the disk.
+
+    Parameters
+    ----------
+    paths : iterable of str
+        The paths of the files or the directories.
+
+    """
+
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def create_backend(url, root):
+
+    """Create the storage backend of a storage URL.
+
+    Parameters
+    ----------
+    url : str
+        The storage URL (see the module documentation).
+    root : str
+        The absolute path of the directory of the backend, under the path of
+        the URL.
+
+    Returns
+    -------
+    `StorageBackend`
+        The storage backend.
+
+    Raises
+    ------
+    ValueError
+        If the scheme of the URL is not supported.
+
+    """
+
+    parsed_url = urlparse.urlparse(url)
+    if parsed_url.scheme in _HDFS_SCHEMES:
+        return HDFSBackend(
+            '{}://{}'.format(_HDFS_SCHEMES[parsed_url.scheme],
+                             parsed_url.netloc),
+            parsed_url.path.rstrip('/') + root)
+    elif parsed_url.scheme == 'file':
+        query = urlparse.parse_qs(parsed_url.query)
+        fsync_interval = query.get('fsync_interval')
+        return LocalBackend(
+            parsed_url.path.rstrip('/') + root,
+            int(query.get('fsync', [0])[0]),
+            float(fsync_interval[0]) if fsync_interval else None)
+    elif parsed_url.scheme == 'memory':
+        return MemoryBackend(root)
+    raise ValueError('Unsupported storage URL: {}'.format(url))
@@ -3,40 +3,70 @@
 Class Listings
 --------------
 StorageClient
-    Represent a storage client that supports saving results to HDFS
+    Represent a storage client that supports saving results to HDFS, or to
+    any other storage backend
 
 """
 
-from hdfs import InsecureClient
+import numpy
 
-import numpy, cv2, tempfile, os
+from CAM2DistributedBackend.camera.encoded_frame import EncodedFrame
+from CAM2DistributedBackend.util.image_encoder import ImageEncoder
+from CAM2DistributedBackend.util.result_pack import ResultPackWriter
+from CAM2DistributedBackend.util.storage_backend import create_backend
 
 class StorageClient(object):
     
-    """Represent a storage client that supports saving results to HDFS
+    """Represent a storage client that supports saving results to HDFS, or to
+    any other storage backend
+
+    Attributes
+    ----------
+    encoder : `ImageEncoder`
+        The encoding settings of the saved images, and the counts of the
+        encoded images.
 
     Methods
     -------
-    save(self, file_name, result)
+    save(self, file_name, result, image_format=None, quality=None, scale=None)
         Save results permanently to persistent storage.
+    close(self)
+        Close the result container, if the results are packed.
 
     """
 
-    def __init__(self, namenode_url, username, submission_id, camera_id):
+    def __init__(self, namenode_url, username, submission_id, camera_id, namespace=None, pack=False, pack_max_size=128 << 20, pack_max_age=None, encoder=None):
         """Initialize an internal client
 
-        This constructor initializes an HDFS client.
+        This constructor initializes the storage backend of `namenode_url`,
+        which can be the URL of an HDFS namenode or any other storage URL
+        (see `create_backend`). The results are saved in the directory of
+        the camera, or in the `namespace` subdirectory of it
+        if one is given (e.g. the name of one of many analysis classes). If
+        `pack` is set, the results are appended to rolling result containers
+        of at most `pack_max_size` bytes and `pack_max_age` seconds (see
+        `ResultPackWriter`), rather than saved in a file each. The images are
+        encoded by `encoder`, which defaults to the format of the extension
+        of their file names and the default settings of OpenCV.
 
         """
 
-        self._internal_client = InsecureClient(namenode_url, user='CAM2', root='/'.join(['/users', username, str(submission_id), str(camera_id)]))
+        root = ['/users', username, str(submission_id), str(camera_id)]
+        if namespace is not None:
+            root.append(namespace)
+        self._internal_client = create_backend(namenode_url, '/'.join(root))
+        if pack:
+            self._pack_writer = ResultPackWriter(self._internal_client, pack_max_size, pack_max_age)
+        else:
+            self._pack_writer = None
+        self.encoder = encoder or ImageEncoder()
         
-    def save(self, file_name, result):
+    def save(self, file_name, result, image_format=None, quality=None, scale=None):
         """Save results permanently to persistent storage.
 
         This method saves results permanently to persistent storage so that they
         can be retrieved by the user later. This method currently accepts results as
-        numpy.ndarray. If an instance with any other type is passed, the method
+        numpy.ndarray, EncodedFrame. If an instance with any other type is passed, the method
         will save the string representation of the instance. This enables the method
         to save strings, integers, and other primitive data types.
 
@@ -45,25 +75,77 @@ class StorageClient(object):
         file_name : str
             The file name to be used to save the results.
         result : object
-            The results to be saved. The `result` can be numpy.ndarray.
+            The results to be saved. The `result` can be numpy.ndarray, EncodedFrame.
             If an instance with any other type is passed, the method will
             save the string representation of the instance. This enables the
             method to save strings, integers, and other primitive data types.
+        image_format : str, optional
+            The format in which an image is saved: 'jpeg', 'png', or 'webp'.
+            By default, it is the format of `encoder`, if any, or else the
+            format of the extension of the file name, which is replaced by
+            the extension of the format if they differ.
+        quality : int, optional
+            The quality of a JPEG or WebP image from 0 to 100, or the
+            compression level of a PNG image from 0 to 9. By default, it is
+            the quality of the format set by `encoder`.
+        scale : float, optional
+            The factor by which the width and the height of an image are
+            reduced before encoding it. By default, it is the scale of
+            `encoder`.
 
         """
 
         # Make sure the file name is legit
         file_name = file_name.replace('/', '.')
-        # If the result is an OpenCV image, save it as an image.
+        file_name, data = self._encode(file_name, result, image_format, quality, scale)
+        if self._pack_writer is not None:
+            self._pack_writer.write(file_name, data)
+        else:
+            self._internal_client.write(file_name, data, overwrite=True)
+
+    def close(self):
+        """Close the result container, if the results are packed.
+
+        This method appends the index of the current result container, so
+        that the results can be listed without scanning the container, and
+        makes sure the saved results are stored (e.g. synced to the disk of
+        the local file system).
+
+        """
+
+        if self._pack_writer is not None:
+            self._pack_writer.close()
+        self._internal_client.close()
+
+    def _encode(self, file_name, result, image_format=None, quality=None, scale=None):
+        """Encode a result.
+
+        Parameters
+        ----------
+        file_name : str
+            The file name to be used to save the result.
+        result : object
+            The result to be saved.
+        image_format : str, optional
+            The format in which an image is saved.
+        quality : int, optional
+            The quality of an image.
+        scale : float, optional
+            The scale of an image.
+
+        Returns
+        -------
+        tuple
+            The file name and the data to be saved.
+
+        """
+
+        # If the result is a compressed frame, save its data as it is if it is
+        # saved in the same format, otherwise save it as an image.
+        if (isinstance(result, EncodedFrame)):
+            return self.encoder.encode_frame(file_name, result, image_format, quality, scale)
+        # If the result is an OpenCV image, encode it in memory.
         if (isinstance(result, numpy.ndarray)):
-            # Create temp files
-            temp_directory = tempfile.mkdtemp()
-            temp_image_path = os.path.join(temp_directory, file_name)
-            cv2.imwrite(temp_image_path, result)
-            self._internal_client.upload(file_name, temp_image_path, overwrite=True)
-            # Remove temp files
-            os.remove(temp_image_path)
-            os.rmdir(temp_directory)
+            return self.encoder.encode(file_name, result, image_format, quality, scale)
         # Else, save the string representation of the object in a text file.
-        else:
-            self._internal_client.write(file_name, str(result), overwrite=True)
+        return file_name, str(result)
@@ -0,0 +1,342 @@
+"""Provide the uploading of the results in the background.
+
+This module provides the `UploadQueue` class, a bounded queue of results
+uploaded to persistent storage by a pool of threads shared by all the tasks
+of an executor process, and the `Uploader` class, which saves the results of
+a single task through the queue. Saving a result only queues it, so the
+analysis of the frames does not wait for the round trips to HDFS. When the
+queue is full, the result is handled according to the overflow policy of the
+task:
+
+block
+    The analyzer waits for room in the queue, so the analysis slows down to
+    the rate at which the results are uploaded.
+drop
+    The result is dropped and counted.
+inline
+    The result is uploaded right away by the analyzer, as if there were no
+    queue.
+
+The uploads that fail are counted and reported with the task rather than
+raised from `Analyzer.save`.
+
+Class Listings
+--------------
+UploadQueue
+    Represent a queue of results uploaded by a pool of threads.
+Uploader
+    Represent the uploading of the results of a task through a queue.
+
+Function Listings
+-----------------
+get_upload_queue
+    Get the upload queue of the executor process.
+
+"""
+
+import os
+import Queue
+import threading
+
+import numpy as np
+
+from CAM2DistributedBackend.camera.encoded_frame import EncodedFrame
+from CAM2DistributedBackend.util.scheduler import monotonic
+import constants
+
+# The upload queue shared by all the tasks of the executor process.
+_upload_queue = None
+_upload_queue_pid = None
+_upload_queue_lock = threading.Lock()
+
+
+class UploadQueue(object):
+
+    """Represent a queue of results uploaded by a pool of threads.
+
+    This class represents a bounded queue of results waiting to be uploaded,
+    and the daemon threads uploading them. The threads run for as long as
+    the process.
+
+    Attributes
+    ----------
+    workers : int
+        The number of threads uploading the results.
+    max_pending : int
+        The maximum number of results waiting in the queue.
+
+    Methods
+    -------
+    put(self, item, block=True)
+        Queue a result to be uploaded.
+
+    """
+
+    def __init__(self, workers, max_pending):
+
+        """Initialize an `UploadQueue` instance, and start its threads.
+
+        Parameters
+        ----------
+        workers : int
+            The number of threads uploading the results.
+        max_pending : int
+            The maximum number of results waiting in the queue.
+
+        """
+
+        self.workers = workers
+        self.max_pending = max_pending
+
+        self._queue = Queue.Queue(max_pending)
+        for _ in range(workers):
+            thread = threading.Thread(target=self._upload_results)
+            thread.daemon = True
+            thread.start()
+
+    def put(self, item, block=True):
+
+        """Queue a result to be uploaded.
+
+        Parameters
+        ----------
+        item : tuple
+            The `Uploader` of the result, the function saving it, its file
+            name, the result, and the keyword arguments of the function.
+        block : bool, optional
+            Whether to wait for room in the queue if it is full.
+
+        Raises
+        ------
+        Queue.Full
+            If the queue is full, and `block` is False.
+
+        """
+
+        self._queue.put(item, block)
+
+    def _upload_results(self):
+
+        """Upload the queued results, in a thread of the pool.
+
+        """
+
+        while True:
+            uploader, save, file_name, result, options = self._queue.get()
+            uploader._upload(save, file_name, result, options)
+
+
+class Uploader(object):
+
+    """Represent the uploading of the results of a task through a queue.
+
+    This class represents the results of a single task waiting in an
+    `UploadQueue`, and the outcome of their uploads.
+
+    Attributes
+    ----------
+    overflow : str
+        The overflow policy: `constants.UPLOAD_OVERFLOW_BLOCK`,
+        `constants.UPLOAD_OVERFLOW_DROP`, or
+        `constants.UPLOAD_OVERFLOW_INLINE`.
+    pending : int
+        The number of results of the task that are not uploaded yet.
+    failed : int
+        The number of results whose upload has failed.
+    dropped : int
+        The number of results dropped because the queue was full.
+    last_error : str
+        The message of the error of the last failed upload, or None if no
+        upload has failed.
+
+    Methods
+    -------
+    wrap(self, save)
+        Wrap a function saving results to upload them through the queue.
+    save(self, save, file_name, result, **options)
+        Queue a result to be uploaded.
+    flush(self)
+        Wait until all the queued results are uploaded.
+
+    """
+
+    def __init__(self, upload_queue, overflow=None, profiler=None):
+
+        """Initialize an `Uploader` instance.
+
+        Parameters
+        ----------
+        upload_queue : `UploadQueue`
+            The queue through which the results are uploaded.
+        overflow : str, optional
+            The overflow policy. This defaults to
+            `constants.UPLOAD_OVERFLOW_BLOCK`.
+        profiler : `Profiler`, optional
+            The profiler measuring the latency of the uploads.
+
+        Raises
+        ------
+        ValueError
+            If the value of `overflow` is invalid.
+
+        """
+
+        if overflow is None:
+            overflow = constants.UPLOAD_OVERFLOW_BLOCK
+        if overflow not in (constants.UPLOAD_OVERFLOW_BLOCK,
+                            constants.UPLOAD_OVERFLOW_DROP,
+                            constants.UPLOAD_OVERFLOW_INLINE):
+            raise ValueError('Invalid upload overflow policy: {}'.format(
+                overflow))
+
+        self.overflow = overflow
+        self.pending = 0
+        self.failed = 0
+        self.dropped = 0
+        self.last_error = None
+
+        self._upload_queue = upload_queue
+        self._profiler = profiler
+
+        # The condition guarding the counters, which is notified whenever a
+        # result is no longer pending.
+        self._condition = threading.Condition()
+
+    def wrap(self, save):
+
+        """Wrap a function saving results to upload them through the queue.
+
+        Parameters
+        ----------
+        save : callable
+            The function saving a result, given its file name and the result
+            (see `StorageClient.save`).
+
+        Returns
+        -------
+        callable
+            The function queuing a result to be saved by `save`, given its
+            file name, the result, and the keyword arguments of `save`.
+
+        """
+
+        return lambda file_name, result, **options: self.save(
+            save, file_name, result, **options)
+
+    def save(self, save, file_name, result, **options):
+
+        """Queue a result to be uploaded.
+
+        The result is copied first (or converted to its string
+        representation if it is neither an image nor a frame), so that the
+        analyzer can keep modifying it.
+
+        Parameters
+        ----------
+        save : callable
+            The function saving the result, given its file name and the
+            result (see `StorageClient.save`).
+        file_name : str
+            The file name to be used to save the result.
+        result : object
+            The result to be saved.
+        **options
+            The keyword arguments of `save` (e.g. the encoding settings of an
+            image).
+
+        """
+
+        if isinstance(result, np.ndarray):
+            result = result.copy()
+        elif not isinstance(result, EncodedFrame):
+            result = str(result)
+        with self._condition:
+            self.pending += 1
+
+        item = (self, save, file_name, result, options)
+        if self.overflow == constants.UPLOAD_OVERFLOW_BLOCK:
+            self._upload_queue.put(item)
+            return
+        try:
+            self._upload_queue.put(item, False)
+        except Queue.Full:
+            if self.overflow == constants.UPLOAD_OVERFLOW_INLINE:
+                self._upload(save, file_name, result, options)
+            else:
+                with self._condition:
+                    self.pending -= 1
+                    self.dropped += 1
+                    self._condition.notify_all()
+
+    def flush(self):
+
+        """Wait until all the queued results are uploaded.
+
+        """
+
+        with self._condition:
+            while self.pending:
+                self._condition.wait()
+
+    def _upload(self, save, file_name, result, options):
+
+        """Upload a result, counting it as failed if an error is raised.
+
+        Parameters
+        ----------
+        save : callable
+            The function saving the result.
+        file_name : str
+            The file name to be used to save the result.
+        result : object
+            The result to be saved.
+        options : dict
+            The keyword arguments of `save`.
+
+        """
+
+        start_time = monotonic()
+        error = None
+        try:
+            save(file_name, result, **options)
+        except Exception as e:
+            error = '{}: {}'.format(type(e).__name__, e)
+        with self._condition:
+            if self._profiler is not None:
+                self._profiler.record('upload', monotonic() - start_time)
+            if error is not None:
+                self.failed += 1
+                self.last_error = error
+            self.pending -= 1
+            self._condition.notify_all()
+
+
+def get_upload_queue(workers, max_pending):
+
+    """Get the upload queue of the executor process.
+
+    The queue is created by the first task of the process that uploads its
+    results through it, with the settings of that task.
+
+    Parameters
+    ----------
+    workers : int
+        The number of threads uploading the results, if the queue has to be
+        created.
+    max_pending : int
+        The maximum number of results waiting in the queue, if the queue has
+        to be created.
+
+    Returns
+    -------
+    `UploadQueue`
+        The upload queue of the executor process.
+
+    """
+
+    global _upload_queue, _upload_queue_pid
+    with _upload_queue_lock:
+        if _upload_queue is None or _upload_queue_pid != os.getpid():
+            _upload_queue = UploadQueue(workers, max_pending)
+            _upload_queue_pid = os.getpid()
+        return _upload_queue
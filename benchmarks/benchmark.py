@@ -0,0 +1,485 @@
+"""Benchmark the stream parsers and the analysis loop against a local camera.
+
+This script serves simulated camera streams (see camera_simulator.py) from a
+child process, and measures the frame rate, the per-frame latency, the CPU
+time per frame, and the memory of every stream parser and of the analysis
+loop run by the Spark tasks. The results are written as JSON, so that runs on
+different revisions can be compared to catch regressions.
+
+Benchmark Listings
+------------------
+image
+    Fetch and decode frames through the image stream parser.
+image_lazy
+    Fetch frames through the image stream parser without decoding them.
+mjpeg
+    Fetch and decode frames through the MJPEG stream parser.
+mjpeg_latest
+    Fetch and decode the latest frames through the MJPEG stream parser.
+loop
+    Run the analysis loop of a single camera with an analyzer that only
+    decodes the frames.
+loop_pipelined
+    Run the pipelined analysis loop of a single camera with the same
+    analyzer.
+replay
+    Fetch and decode frames recorded from the MJPEG stream through the
+    replay stream parser, as fast as possible.
+save
+    Save JPEG frames as they are to the local file system, a file each.
+save_packed
+    Save JPEG frames as they are to the local file system, packed into
+    result containers.
+
+Examples
+--------
+The examples run from the root of the repository. PYTHONPATH has to point at
+it unless the package is installed.
+
+Example 1: To benchmark everything at 1280x720, and save the results:
+
+PYTHONPATH=. python benchmarks/benchmark.py --width 1280 --height 720 \
+    -o results.json
+
+Example 2: To benchmark the MJPEG parser against a camera that truncates 5%
+of its frames:
+
+PYTHONPATH=. python benchmarks/benchmark.py mjpeg --truncated 0.05
+
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from CAM2DistributedBackend.camera.camera import IPCamera, ReplayCamera, \
+    StreamFormat
+from CAM2DistributedBackend.camera.capture_file import record
+from CAM2DistributedBackend.camera.error import CorruptedFrameError
+from CAM2DistributedBackend.util.camera_task import CameraTask, run_camera, \
+    run_camera_pipelined
+from CAM2DistributedBackend.util.request import Request
+from CAM2DistributedBackend.util.storage_client import StorageClient
+from camera_simulator import CameraSimulator, SNAPSHOT_PATH, MJPEG_PATH
+import null_analyzer
+
+BENCHMARKS = ['image', 'image_lazy', 'mjpeg', 'mjpeg_latest', 'loop',
+              'loop_pipelined', 'replay', 'save', 'save_packed']
+
+
+def get_rss():
+    """Get the resident memory of the process.
+
+    Returns
+    -------
+    int
+        The resident memory of the process in kilobytes.
+
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() // 1024
+    except IOError:
+        # Fall back to the peak memory where /proc is not available.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def get_cpu_time():
+    """Get the CPU time used by the process, including all its threads.
+
+    Returns
+    -------
+    float
+        The user and system CPU time in seconds.
+
+    """
+    times = os.times()
+    return times[0] + times[1]
+
+
+def percentile(values, fraction):
+    """Get a percentile of a list of values.
+
+    Parameters
+    ----------
+    values : list of float
+        The sorted values.
+    fraction : float
+        The fraction of the values below the percentile.
+
+    Returns
+    -------
+    float
+        The percentile, or None if there are no values.
+
+    """
+    if not values:
+        return None
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+class Measurement(object):
+    """Represent the measurement of a single benchmark.
+
+    Attributes
+    ----------
+    latencies : list of float
+        The time taken by every frame in seconds.
+    corrupted_frames : int
+        The number of corrupted frames.
+
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self.corrupted_frames = 0
+        self._start_time = time.time()
+        self._start_cpu_time = get_cpu_time()
+        self._start_rss = get_rss()
+        self._time = None
+        self._cpu_time = None
+        self._rss = None
+
+    def stop(self):
+        """Stop measuring the time, the CPU time and the memory.
+
+        """
+        self._time = time.time() - self._start_time
+        self._cpu_time = get_cpu_time() - self._start_cpu_time
+        self._rss = get_rss()
+
+    def results(self):
+        """Get the results of the measurement.
+
+        Returns
+        -------
+        dict
+            The results of the measurement. The times are in milliseconds,
+            and the memory in kilobytes.
+
+        """
+        frames = len(self.latencies)
+        latencies = sorted(latency * 1000 for latency in self.latencies)
+        return {
+            'frames': frames,
+            'corrupted_frames': self.corrupted_frames,
+            'seconds': self._time,
+            'fps': frames / self._time if self._time else None,
+            'latency_ms': {
+                'mean': sum(latencies) / frames if frames else None,
+                'p50': percentile(latencies, 0.5),
+                'p90': percentile(latencies, 0.9),
+                'p99': percentile(latencies, 0.99),
+                'max': latencies[-1] if latencies else None,
+            },
+            'cpu_ms_per_frame':
+                self._cpu_time * 1000 / frames if frames else None,
+            'rss_kb': self._rss,
+            'rss_growth_kb': self._rss - self._start_rss,
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+
+
+def benchmark_parser(camera, stream_format, frames, decode=True,
+                     latest_frame_only=False):
+    """Measure fetching frames from a camera through a stream parser.
+
+    Parameters
+    ----------
+    camera : Camera
+        The camera.
+    stream_format : int
+        The format of the stream (e.g. StreamFormat.MJPEG).
+    frames : int
+        The number of frames to be fetched.
+    decode : bool, optional
+        Whether to decode the frames.
+    latest_frame_only : bool, optional
+        Whether to drain the MJPEG stream in the background.
+
+    Returns
+    -------
+    dict
+        The results of the benchmark.
+
+    """
+    camera.open_stream(stream_format, latest_frame_only)
+    try:
+        camera.get_frame(decode)
+    except CorruptedFrameError:
+        pass
+
+    measurement = Measurement()
+    while len(measurement.latencies) < frames:
+        start_time = time.time()
+        try:
+            camera.get_frame(decode)
+        except CorruptedFrameError:
+            measurement.corrupted_frames += 1
+            continue
+        measurement.latencies.append(time.time() - start_time)
+    measurement.stop()
+
+    camera.close_stream()
+    return measurement.results()
+
+
+def benchmark_replay(camera, frames):
+    """Measure replaying frames recorded from a camera.
+
+    Parameters
+    ----------
+    camera : Camera
+        The camera from which the frames are recorded.
+    frames : int
+        The number of frames to be replayed.
+
+    Returns
+    -------
+    dict
+        The results of the benchmark.
+
+    """
+    capture_file = tempfile.NamedTemporaryFile(suffix='.cap', delete=False)
+    capture_file.close()
+    try:
+        # Record a second of the stream, and replay it as many times as
+        # needed.
+        camera.open_stream(StreamFormat.MJPEG)
+        record(camera.parser, capture_file.name, 1)
+        camera.close_stream()
+
+        replay_camera = ReplayCamera(1, capture_file.name, realtime=False,
+                                     loop=True)
+        return benchmark_parser(replay_camera, StreamFormat.MJPEG, frames)
+    finally:
+        os.remove(capture_file.name)
+
+
+def benchmark_save(camera, frames, pack=False):
+    """Measure saving frames to the local file system.
+
+    Parameters
+    ----------
+    camera : Camera
+        The camera from which the saved frame is fetched.
+    frames : int
+        The number of frames to be saved.
+    pack : bool, optional
+        Whether to pack the frames into result containers.
+
+    Returns
+    -------
+    dict
+        The results of the benchmark.
+
+    """
+    camera.open_stream(StreamFormat.IMAGE)
+    frame = None
+    while frame is None:
+        try:
+            frame, _ = camera.get_frame(decode=False)
+        except CorruptedFrameError:
+            pass
+    camera.close_stream()
+
+    directory = tempfile.mkdtemp()
+    try:
+        storage_client = StorageClient('file://' + directory, 'benchmark', 0,
+                                       1, pack=pack)
+        measurement = Measurement()
+        for i in range(frames):
+            start_time = time.time()
+            storage_client.save('frame{}.jpg'.format(i), frame)
+            measurement.latencies.append(time.time() - start_time)
+        storage_client.close()
+        measurement.stop()
+        return measurement.results()
+    finally:
+        shutil.rmtree(directory)
+
+
+def benchmark_loop(simulator, duration, is_video, pipeline_depth=0):
+    """Measure the analysis loop of a single camera.
+
+    Parameters
+    ----------
+    simulator : CameraSimulator
+        The simulated camera.
+    duration : float
+        The duration of the analysis in seconds.
+    is_video : bool
+        Whether to analyze the MJPEG stream rather than the image stream.
+    pipeline_depth : int, optional
+        The depth of the pipeline, or 0 to run the loop without a pipeline.
+
+    Returns
+    -------
+    dict
+        The results of the benchmark. The latency of a frame is the time
+        since the analyzer got the frame before it.
+
+    """
+    request_file = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
+    with request_file:
+        json.dump({
+            'cameras': [{
+                'type': 'ip',
+                'key': 1,
+                'ip': simulator.host,
+                'port': simulator.port,
+                'snapshot_path': SNAPSHOT_PATH,
+                'mjpg_path': MJPEG_PATH,
+                'latitude': 0.0,
+                'longitude': 0.0,
+            }],
+            'duration': duration,
+            'interval': 0,
+            'is_video': is_video,
+            'snapshots_to_keep': 1,
+            'analysis_class': 'NullAnalyzer',
+            'pipeline_depth': pipeline_depth,
+            'timestamp': time.time(),
+        }, request_file)
+    try:
+        request = Request(request_file.name)
+    finally:
+        os.remove(request_file.name)
+
+    # The analyzer does not save anything, so the storage is never used.
+    task = CameraTask(request.cameras[0], request, 'memory://',
+                      'benchmark', 0, null_analyzer.__file__)
+
+    measurement = Measurement()
+    if pipeline_depth:
+        summary = run_camera_pipelined(task, duration, 0, pipeline_depth,
+                                       request.decode_threads)
+    else:
+        summary = run_camera(task, duration, 0)
+    measurement.stop()
+
+    frame_times = task.analyzer.frame_times
+    measurement.latencies = [
+        t - previous for previous, t in zip(frame_times, frame_times[1:])]
+    measurement.corrupted_frames = summary['corrupted_frames']
+    return measurement.results()
+
+
+def run_benchmark(name, simulator, frames, duration):
+    """Run a benchmark by name.
+
+    Parameters
+    ----------
+    name : str
+        The name of the benchmark (one of BENCHMARKS).
+    simulator : CameraSimulator
+        The simulated camera.
+    frames : int
+        The number of frames fetched by the parser benchmarks.
+    duration : float
+        The duration of the loop benchmarks in seconds.
+
+    Returns
+    -------
+    dict
+        The results of the benchmark.
+
+    """
+    camera = IPCamera(1, simulator.host, SNAPSHOT_PATH, MJPEG_PATH,
+                      simulator.port)
+    if name == 'image':
+        return benchmark_parser(camera, StreamFormat.IMAGE, frames)
+    elif name == 'image_lazy':
+        return benchmark_parser(camera, StreamFormat.IMAGE, frames,
+                                decode=False)
+    elif name == 'mjpeg':
+        return benchmark_parser(camera, StreamFormat.MJPEG, frames)
+    elif name == 'mjpeg_latest':
+        return benchmark_parser(camera, StreamFormat.MJPEG, frames,
+                                latest_frame_only=True)
+    elif name == 'replay':
+        return benchmark_replay(camera, frames)
+    elif name == 'save':
+        return benchmark_save(camera, frames)
+    elif name == 'save_packed':
+        return benchmark_save(camera, frames, pack=True)
+    elif name == 'loop':
+        return benchmark_loop(simulator, duration, True)
+    elif name == 'loop_pipelined':
+        return benchmark_loop(simulator, duration, True, pipeline_depth=2)
+    raise ValueError('Invalid Argument: name')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the stream parsers and the analysis loop.')
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help='the benchmarks to run (default: all of {})'
+                        .format(', '.join(BENCHMARKS)))
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--fps', type=float, default=0,
+                        help='frame rate of the camera (default: unlimited)')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='response time of the camera in seconds')
+    parser.add_argument('--truncated', type=float, default=0,
+                        help='fraction of truncated frames')
+    parser.add_argument('--tiny', type=float, default=0,
+                        help='fraction of 1x1 frames')
+    parser.add_argument('--frames', type=int, default=500,
+                        help='frames fetched by every parser benchmark')
+    parser.add_argument('--duration', type=float, default=10,
+                        help='duration of every loop benchmark in seconds')
+    parser.add_argument('-o', '--output',
+                        help='the JSON file of the results (default: stdout)')
+    args = parser.parse_args()
+
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: ' + name)
+
+    settings = {
+        'width': args.width,
+        'height': args.height,
+        'fps': args.fps,
+        'latency': args.latency,
+        'truncated_frames': args.truncated,
+        'tiny_frames': args.tiny,
+    }
+    simulator = CameraSimulator(**settings)
+    simulator.start_process()
+
+    results = {}
+    try:
+        for name in args.benchmarks or BENCHMARKS:
+            print >> sys.stderr, 'Running {}...'.format(name)
+            results[name] = run_benchmark(name, simulator, args.frames,
+                                          args.duration)
+    finally:
+        simulator.stop()
+
+    report = {
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': dict(settings, frames=args.frames,
+                         duration=args.duration),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4, sort_keys=True)
+    else:
+        print json.dumps(report, indent=4, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,398 @@
+"""Simulate an IP camera serving image and MJPEG streams on the local host.
+
+This module provides a local HTTP server that stands in for a public IP
+camera, so that the stream parsers and the analysis loop can be benchmarked
+and tested without depending on the network or on remote cameras. The server
+serves the image stream (snapshots) at SNAPSHOT_PATH and the MJPEG stream at
+MJPEG_PATH, with an adjustable resolution, frame rate, boundary, and latency.
+It can also inject the errors seen from real cameras, such as truncated
+frames and 1x1 images.
+
+The frames are encoded once when the simulator is created, so that serving
+them costs as little as possible.
+
+Examples
+--------
+Example 1: To serve the streams of a simulated camera in the background:
+
+simulator = CameraSimulator(width=1280, height=720, fps=15)
+simulator.start()
+camera = IPCamera(1, simulator.host, SNAPSHOT_PATH, MJPEG_PATH,
+                  simulator.port)
+...
+simulator.stop()
+
+Example 2: To run a simulated camera from the command line:
+
+python benchmarks/camera_simulator.py --port 8080 --fps 10 --truncated 0.1
+
+"""
+import argparse
+import BaseHTTPServer
+import multiprocessing
+import random
+import SocketServer
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# The paths of the streams served by the simulator.
+SNAPSHOT_PATH = '/axis-cgi/jpg/image.cgi'
+MJPEG_PATH = '/axis-cgi/mjpg/video.cgi'
+
+# The number of distinct frames the simulator cycles through.
+FRAMES_COUNT = 30
+
+
+def make_frames(width, height, count=FRAMES_COUNT, quality=90):
+    """Encode the frames served by the simulator.
+
+    Parameters
+    ----------
+    width : int
+        The width of the frames in pixels.
+    height : int
+        The height of the frames in pixels.
+    count : int, optional
+        The number of frames.
+    quality : int, optional
+        The JPEG quality of the frames.
+
+    Returns
+    -------
+    list of str
+        The JPEG data of the frames.
+
+    Notes
+    -----
+    Every frame has a noisy background, so that the frames compress like
+    camera images rather than like flat colors, and a square that moves from
+    one frame to the next.
+
+    """
+    state = np.random.RandomState(0)
+    background = cv2.GaussianBlur(
+        state.randint(0, 256, (height, width, 3)).astype(np.uint8), (5, 5), 0)
+    size = max(min(width, height) // 8, 1)
+    frames = []
+    for i in range(count):
+        frame = background.copy()
+        x = (width - size) * i // max(count - 1, 1)
+        y = (height - size) // 2
+        cv2.rectangle(frame, (x, y), (x + size, y + size), (255, 255, 255),
+                      -1)
+        frames.append(cv2.imencode(
+            '.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tostring())
+    return frames
+
+
+class CameraSimulator(object):
+    """Represent a simulated IP camera.
+
+    Parameters
+    ----------
+    host : str, optional
+        The host name or IP on which the simulator listens.
+    port : int, optional
+        The port on which the simulator listens. By default, a free port is
+        chosen.
+    width : int, optional
+        The width of the frames in pixels.
+    height : int, optional
+        The height of the frames in pixels.
+    fps : float, optional
+        The frame rate of the camera. The image stream changes its frame, and
+        the MJPEG stream sends a frame, fps times every second. If it is 0,
+        the MJPEG stream sends frames as fast as it can.
+    boundary : str, optional
+        The boundary of the MJPEG stream.
+    latency : float, optional
+        The time the camera takes to respond to a request in seconds.
+    truncated_frames : float, optional
+        The fraction of the frames that are cut short.
+    tiny_frames : float, optional
+        The fraction of the frames that are replaced by 1x1 images.
+    content_length : bool, optional
+        Whether the parts of the MJPEG stream have a Content-Length header.
+        Without it, the parts end where the next boundary starts.
+    quality : int, optional
+        The JPEG quality of the frames.
+    seed : int, optional
+        The seed of the choice of the frames with errors.
+
+    Attributes
+    ----------
+    host : str
+        The host name or IP on which the simulator listens.
+    port : int
+        The port on which the simulator listens.
+    frames : list of str
+        The JPEG data of the frames.
+    requests_count : int
+        The number of requests served so far (by a simulator running in a
+        thread).
+
+    Notes
+    -----
+    The settings are read by the server on every request, so they can be
+    changed while a simulator runs in a thread.
+
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, width=640, height=480,
+                 fps=30, boundary='myboundary', latency=0,
+                 truncated_frames=0, tiny_frames=0, content_length=True,
+                 quality=90, seed=0):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.boundary = boundary
+        self.latency = latency
+        self.truncated_frames = truncated_frames
+        self.tiny_frames = tiny_frames
+        self.content_length = content_length
+        self.requests_count = 0
+
+        self.frames = make_frames(width, height, quality=quality)
+        self._tiny_frame = cv2.imencode(
+            '.jpg', np.zeros((1, 1, 3), np.uint8))[1].tostring()
+        self._random = random.Random(seed)
+        self._start_time = time.time()
+
+        self._server = _Server((host, port), _Handler)
+        self._server.simulator = self
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = None
+        self._process = None
+
+    @property
+    def url(self):
+        """The URL of the simulator.
+
+        """
+        return 'http://{}:{}'.format(self.host, self.port)
+
+    @property
+    def snapshot_url(self):
+        """The URL of the image stream of the simulator.
+
+        """
+        return self.url + SNAPSHOT_PATH
+
+    @property
+    def mjpeg_url(self):
+        """The URL of the MJPEG stream of the simulator.
+
+        """
+        return self.url + MJPEG_PATH
+
+    def start(self):
+        """Serve the streams in a background thread.
+
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def start_process(self):
+        """Serve the streams in a child process.
+
+        Serving the streams in a child process keeps the work of the server
+        out of the CPU time and memory measured in the calling process.
+
+        """
+        self._process = multiprocessing.Process(
+            target=self._server.serve_forever)
+        self._process.daemon = True
+        self._process.start()
+
+    def serve_forever(self):
+        """Serve the streams in the calling thread until interrupted.
+
+        """
+        self._server.serve_forever()
+
+    def stop(self):
+        """Stop serving the streams.
+
+        """
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+        elif self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def current_frame(self):
+        """Get the frame the camera is showing now.
+
+        Returns
+        -------
+        number : int
+            The number of the frame since the simulator started.
+        data : str
+            The JPEG data of the frame, including the injected errors.
+
+        """
+        if self.fps:
+            number = int((time.time() - self._start_time) * self.fps)
+        else:
+            number = self.requests_count
+        return number, self._inject_errors(
+            self.frames[number % len(self.frames)])
+
+    def _inject_errors(self, data):
+        """Replace a frame by a corrupted one as often as requested.
+
+        Parameters
+        ----------
+        data : str
+            The JPEG data of the frame.
+
+        Returns
+        -------
+        str
+            The JPEG data to be sent.
+
+        """
+        value = self._random.random()
+        if value < self.truncated_frames:
+            return data[:len(data) // 2]
+        if value < self.truncated_frames + self.tiny_frames:
+            return self._tiny_frame
+        return data
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Represent the HTTP server of a simulator.
+
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, client_address):
+        # Ignore the clients that close the connection in the middle of a
+        # response, which is how the MJPEG streams are closed.
+        if not isinstance(sys.exc_info()[1], IOError):
+            BaseHTTPServer.HTTPServer.handle_error(self, request,
+                                                   client_address)
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Represent the handler of the requests to a simulator.
+
+    """
+    # Keep the connections open between snapshots, like most cameras do.
+    protocol_version = 'HTTP/1.1'
+
+    # Send the body right after the headers rather than waiting for the
+    # acknowledgment of the headers.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        simulator = self.server.simulator
+        simulator.requests_count += 1
+        if simulator.latency:
+            time.sleep(simulator.latency)
+
+        path = self.path.split('?')[0]
+        if path == SNAPSHOT_PATH:
+            self._send_snapshot(simulator)
+        elif path == MJPEG_PATH:
+            self._send_mjpeg(simulator)
+        else:
+            self.send_error(404)
+
+    def _send_snapshot(self, simulator):
+        """Send the current frame as a single image.
+
+        """
+        number, data = simulator.current_frame()
+        etag = '"{}"'.format(number)
+        if self.headers.getheader('if-none-match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_mjpeg(self, simulator):
+        """Send the frames as a multipart stream until the client leaves.
+
+        """
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header(
+            'Content-Type',
+            'multipart/x-mixed-replace; boundary={}'.format(
+                simulator.boundary))
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+        next_time = time.time()
+        try:
+            while True:
+                if simulator.fps:
+                    next_time += 1.0 / simulator.fps
+                    time.sleep(max(next_time - time.time(), 0))
+                simulator.requests_count += 1
+                number, data = simulator.current_frame()
+                headers = '--{}\r\nContent-Type: image/jpeg\r\n'.format(
+                    simulator.boundary)
+                if simulator.content_length:
+                    headers += 'Content-Length: {}\r\n'.format(len(data))
+                self.wfile.write(headers + '\r\n' + data + '\r\n')
+        except IOError:
+            # The client closed the stream.
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Simulate an IP camera on the local host.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--fps', type=float, default=30)
+    parser.add_argument('--boundary', default='myboundary')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='response time in seconds')
+    parser.add_argument('--truncated', type=float, default=0,
+                        help='fraction of truncated frames')
+    parser.add_argument('--tiny', type=float, default=0,
+                        help='fraction of 1x1 frames')
+    parser.add_argument('--no-content-length', action='store_true',
+                        help='omit the Content-Length of the MJPEG parts')
+    args = parser.parse_args()
+
+    simulator = CameraSimulator(
+        args.host, args.port, args.width, args.height, args.fps,
+        args.boundary, args.latency, args.truncated, args.tiny,
+        not args.no_content_length)
+    print 'Image stream: ' + simulator.snapshot_url
+    print 'MJPEG stream: ' + simulator.mjpeg_url
+    try:
+        simulator.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+"""Provide an analyzer that does nothing but decode the frames.
+
+This analyzer is used to benchmark the analysis loop, so that the measurements
+cover fetching and decoding the frames rather than the analysis itself.
+
+"""
+import time
+
+from CAM2DistributedBackend.analyzer.analyzer import Analyzer
+
+
+class NullAnalyzer(Analyzer):
+
+    def initialize(self):
+        self.frame_times = []
+
+    def on_new_frame(self):
+        self.get_frame()
+        self.frame_times.append(time.time())
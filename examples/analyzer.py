@@ -15,9 +15,17 @@ class MyAnalyzer(Analyzer):
             frame_metadata.camera_metadata.camera_id,
             frame_metadata.datetime.strftime('%Y-%m-%d_%H-%M-%S-%f'))
 
-        frame = self.get_frame()
-        self.save(file_name + '_input.png', frame)
+        # Save the input frame compressed as it is fetched, unless it is not
+        # available compressed (e.g. when the analyzer runs in a separate
+        # process). It is saved as a PNG image, unless the request sets
+        # another image_format (a JPEG frame is saved as it is as a JPEG
+        # image).
+        input_frame = self.get_encoded_frame()
+        if input_frame is None:
+            input_frame = self.get_frame()
+        self.save(file_name + '_input.png', input_frame)
 
+        frame = self.get_frame()
         frame = self.bgsub.apply(frame)
         self.save(file_name + '_mask.png', frame)
 
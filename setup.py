@@ -15,6 +15,9 @@ setup(
 	entry_points='''
 		[console_scripts]
 		CAM2DistributedBackend=CAM2DistributedBackend:cli
+		CAM2Capture=CAM2DistributedBackend.capture:cli
+		CAM2StreamServer=CAM2DistributedBackend.stream_server:cli
+		CAM2Results=CAM2DistributedBackend.results:cli
 	''',
 	scripts=[
 		'bin/CAM2StartManager',
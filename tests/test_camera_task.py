@@ -0,0 +1,101 @@
+"""Test passing the frames of a camera to the analyzers of many classes.
+
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from CAM2DistributedBackend.analyzer.analyzer import Analyzer
+from CAM2DistributedBackend.analyzer.camera_metadata import CameraMetadata
+from CAM2DistributedBackend.analyzer.frame_metadata import FrameMetadata
+from CAM2DistributedBackend.camera.encoded_frame import EncodedFrame
+from CAM2DistributedBackend.util.camera_task import CameraTask
+from CAM2DistributedBackend.util.request import Request
+
+
+class DrawingAnalyzer(Analyzer):
+
+    # An analyzer that records the color of the top left pixel of its frames,
+    # then draws on them in place.
+
+    def initialize(self):
+        self.colors = []
+
+    def on_new_frame(self):
+        frame = self.get_frame()
+        self.colors.append(int(frame[0, 0, 0]))
+        cv2.rectangle(frame, (0, 0), (2, 2), (255, 255, 255), -1)
+
+    def on_new_batch(self, frames, frames_metadata):
+        self.colors.extend(int(color) for color in frames[:, 0, 0, 0])
+        for frame in frames:
+            cv2.rectangle(frame, (0, 0), (2, 2), (255, 255, 255), -1)
+
+
+class OtherDrawingAnalyzer(DrawingAnalyzer):
+
+    pass
+
+
+class CameraTaskTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create_task(self, **attributes):
+        request = {
+            'cameras': [{'type': 'non_ip', 'key': 5,
+                         'snapshot_url': 'http://localhost/snapshot.jpg',
+                         'latitude': 0, 'longitude': 0}],
+            'interval': 1,
+            'duration': 10,
+            'snapshots_to_keep': 1,
+            'is_video': False,
+            'analysis_class': ['DrawingAnalyzer', 'OtherDrawingAnalyzer'],
+            'timestamp': 0,
+            'upload_workers': 0,
+        }
+        request.update(attributes)
+        file_name = os.path.join(self.directory, 'request.json')
+        with open(file_name, 'w') as f:
+            json.dump(request, f)
+        request = Request(file_name)
+        task = CameraTask(request.cameras[0], request, 'memory://', 'user',
+                          1, __file__)
+        task.start_analyzer()
+        return task
+
+    def analyze(self, task, frames):
+        for i, frame in enumerate(frames):
+            task.analyze(frame, FrameMetadata(CameraMetadata(5, 0, 0), i,
+                                              float(i)))
+        task.finish_analyzer()
+        return [analyzer.colors for analyzer in task.analyzers]
+
+    def test_own_frames(self):
+        # Every analyzer gets the frame as it is fetched, whatever the
+        # analyzers before it draw on their frame.
+        frame = np.zeros((8, 8, 3), np.uint8)
+        encoded_frame = EncodedFrame(cv2.imencode('.png', frame)[1].tostring())
+        self.assertEqual(self.analyze(self.create_task(),
+                                      [frame, encoded_frame]),
+                         [[0, 0], [0, 0]])
+        self.assertEqual(int(frame[0, 0, 0]), 255)
+
+    def test_own_batches(self):
+        frames = [np.zeros((8, 8, 3), np.uint8) for _ in range(3)]
+        self.assertEqual(self.analyze(self.create_task(batch_size=3), frames),
+                         [[0, 0, 0], [0, 0, 0]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+"""Test the gathering of frames into batches.
+
+"""
+
+import unittest
+
+import cv2
+import numpy as np
+
+from CAM2DistributedBackend.analyzer.camera_metadata import CameraMetadata
+from CAM2DistributedBackend.analyzer.frame_metadata import FrameMetadata
+from CAM2DistributedBackend.camera.encoded_frame import EncodedFrame
+from CAM2DistributedBackend.util.frame_batch import FrameBatch
+
+
+def make_metadata(sequence_num):
+    return FrameMetadata(CameraMetadata(5, 0.0, 0.0), sequence_num,
+                         float(sequence_num))
+
+
+def encode(frame):
+    return EncodedFrame(cv2.imencode('.png', frame)[1].tostring())
+
+
+class FrameBatchTest(unittest.TestCase):
+
+    def test_full_batch(self):
+        batch = FrameBatch(3)
+        for i in range(3):
+            self.assertFalse(batch.is_due())
+            batch.add(np.full((4, 6, 3), i, np.uint8), make_metadata(i))
+        self.assertTrue(batch.is_due())
+
+        frames, frames_metadata = batch.take()
+        self.assertEqual(frames.shape, (3, 4, 6, 3))
+        self.assertEqual(list(frames[:, 0, 0, 0]), [0, 1, 2])
+        self.assertEqual(list(frames_metadata['sequence_num']), [0, 1, 2])
+        self.assertEqual(len(batch), 0)
+
+    def test_corrupted_frames(self):
+        batch = FrameBatch(3)
+        batch.add(EncodedFrame('corrupted'), make_metadata(0))
+        batch.add(encode(np.zeros((4, 6, 3), np.uint8)), make_metadata(1))
+        frames, frames_metadata = batch.take()
+        self.assertEqual(batch.decode_results, [False, True])
+        self.assertEqual(frames.shape, (1, 4, 6, 3))
+        self.assertEqual(list(frames_metadata['sequence_num']), [1])
+
+        batch.add(EncodedFrame('corrupted'), make_metadata(2))
+        frames, frames_metadata = batch.take()
+        self.assertIsNone(frames)
+        self.assertEqual(len(frames_metadata), 0)
+
+    def test_mixed_shapes(self):
+        # A frame of another shape starts a new batch once the waiting batch
+        # is taken out.
+        batch = FrameBatch(4)
+        shapes = [(4, 6, 3), (4, 6, 3), (8, 12, 3), (8, 12, 3), (6, 4, 3)]
+        batches = []
+        for i, shape in enumerate(shapes):
+            frame = encode(np.zeros(shape, np.uint8))
+            self.assertTrue(batch.fits(EncodedFrame('corrupted')))
+            if not batch.fits(frame):
+                batches.append(batch.take()[0].shape)
+            batch.add(frame, make_metadata(i))
+        batches.append(batch.take()[0].shape)
+        self.assertEqual(batches, [(2, 4, 6, 3), (2, 8, 12, 3), (1, 6, 4, 3)])
+
+
+if __name__ == '__main__':
+    unittest.main()
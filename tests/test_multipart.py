@@ -0,0 +1,132 @@
+"""Test the reader of multipart streams.
+
+Run the tests from the root of the repository with:
+python -m unittest discover -s tests
+
+"""
+
+import StringIO
+import unittest
+
+from CAM2DistributedBackend.camera.error import CorruptedFrameError
+from CAM2DistributedBackend.camera.multipart import MultipartReader, \
+    get_boundary
+
+
+class ChunkedStream(object):
+
+    """Represent a stream returning at most a few bytes on every read.
+
+    """
+
+    def __init__(self, data, chunk_size):
+        self._stream = StringIO.StringIO(data)
+        self._chunk_size = chunk_size
+
+    def read(self, size):
+        return self._stream.read(min(size, self._chunk_size))
+
+
+def make_part(body, boundary='frame', headers=None, line_break='\r\n'):
+    if headers is None:
+        headers = ['Content-Type: image/jpeg',
+                   'Content-Length: {}'.format(len(body))]
+    return line_break.join(['--' + boundary] + headers + ['', body]) + \
+        line_break
+
+
+def read_bodies(reader, count):
+    bodies = []
+    for _ in range(count):
+        offset, size, _ = reader.next_part()
+        bodies.append(bytes(reader.buffer[offset:offset + size]))
+    return bodies
+
+
+class MultipartReaderTest(unittest.TestCase):
+
+    def test_content_length(self):
+        data = make_part('first') + make_part('second\r\n--frame')
+        reader = MultipartReader(StringIO.StringIO(data), 'frame')
+        self.assertEqual(read_bodies(reader, 2),
+                         ['first', 'second\r\n--frame'])
+
+    def test_no_content_length(self):
+        data = make_part('first', headers=['Content-Type: image/jpeg']) + \
+            make_part('second', headers=['Content-Type: image/jpeg']) + \
+            '--frame\r\n'
+        reader = MultipartReader(StringIO.StringIO(data), 'frame')
+        self.assertEqual(read_bodies(reader, 2), ['first', 'second'])
+
+    def test_body_with_dashes(self):
+        # Neither the dashes at the end of a body nor a boundary in the
+        # middle of a line end the body.
+        bodies = ['first--', 'sec--frame\r\nond-', '-']
+        data = ''.join(make_part(body, '--frame',
+                                 headers=['Content-Type: image/jpeg'])
+                       for body in bodies) + '----frame\r\n'
+        reader = MultipartReader(ChunkedStream(data, 3), 'frame')
+        self.assertEqual(read_bodies(reader, 3), bodies)
+
+    def test_lf_line_breaks(self):
+        data = make_part('first', line_break='\n') + \
+            make_part('second', headers=[], line_break='\n') + '--frame\n'
+        reader = MultipartReader(StringIO.StringIO(data), 'frame')
+        self.assertEqual(read_bodies(reader, 2), ['first', 'second'])
+
+    def test_boundary_from_stream(self):
+        data = 'preamble\r\n' + make_part('first', '--frame') + \
+            make_part('second', '--frame')
+        reader = MultipartReader(StringIO.StringIO(data))
+        self.assertEqual(read_bodies(reader, 2), ['first', 'second'])
+        self.assertEqual(reader.boundary, 'frame')
+
+    def test_small_reads(self):
+        bodies = ['x' * 5000, 'y' * 300000, 'z']
+        data = ''.join(make_part(body) for body in bodies)
+        reader = MultipartReader(ChunkedStream(data, 7), 'frame')
+        self.assertEqual(read_bodies(reader, 3), bodies)
+
+    def test_invalid_content_length(self):
+        data = make_part('first') + \
+            make_part('bad', headers=['Content-Length: 12abc']) + \
+            make_part('second')
+        reader = MultipartReader(StringIO.StringIO(data), 'frame')
+        self.assertEqual(read_bodies(reader, 1), ['first'])
+        self.assertRaises(CorruptedFrameError, reader.next_part)
+        # The reader resumes at the part after the malformed one.
+        self.assertEqual(read_bodies(reader, 1), ['second'])
+
+    def test_missing_header_line_break(self):
+        data = '--frame\r\nContent-Length: 5\r\n' + 'x' * 100
+        reader = MultipartReader(StringIO.StringIO(data), 'frame')
+        self.assertRaises(EOFError, reader.next_part)
+
+    def test_truncated_body(self):
+        data = make_part('first')[:-4]
+        reader = MultipartReader(StringIO.StringIO(data), 'frame')
+        self.assertRaises(EOFError, reader.next_part)
+
+
+class GetBoundaryTest(unittest.TestCase):
+
+    def get_boundary(self, content_type):
+        import mimetools
+        return get_boundary(mimetools.Message(StringIO.StringIO(
+            'Content-Type: {}\r\n\r\n'.format(content_type))))
+
+    def test_boundary(self):
+        self.assertEqual(
+            self.get_boundary('multipart/x-mixed-replace; boundary=frame'),
+            'frame')
+
+    def test_quoted_boundary_with_dashes(self):
+        self.assertEqual(self.get_boundary(
+            'multipart/x-mixed-replace; boundary="--frame"'), 'frame')
+
+    def test_no_boundary(self):
+        self.assertIsNone(self.get_boundary('multipart/x-mixed-replace'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+"""Test the recording and the merging of the measurements of a profiler.
+
+"""
+
+import pickle
+import threading
+import unittest
+
+from CAM2DistributedBackend.util.profiler import Profiler
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def test_record(self):
+        profiler = Profiler()
+        profiler.record('fetch', 0.01)
+        profiler.record('fetch', 0.03)
+        self.assertEqual(profiler.call('get_frame', lambda x: x + 1, 1), 2)
+        self.assertEqual(profiler.histograms['fetch'].count, 2)
+        self.assertAlmostEqual(profiler.histograms['fetch'].total, 0.04)
+        self.assertEqual(profiler.histograms['get_frame'].count, 1)
+
+    def test_disabled(self):
+        profiler = Profiler(profile_callbacks=True, enabled=False)
+        profiler.record('fetch', 0.01)
+        self.assertEqual(profiler.call_handler('on_new_frame', lambda: 1), 1)
+        self.assertEqual(profiler.histograms, {})
+        self.assertIsNone(profiler._cprofile)
+
+    def test_record_from_threads(self):
+        profiler = Profiler()
+
+        def record():
+            for _ in range(1000):
+                profiler.record('upload', 0.001)
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(profiler.histograms['upload'].count, 4000)
+
+    def test_merge_pickled(self):
+        profiler = Profiler()
+        profiler.record('fetch', 0.01)
+        other = pickle.loads(pickle.dumps(profiler))
+        other.record('fetch', 0.02)
+        other.missed_intervals = 3
+        profiler.merge(other)
+        self.assertEqual(profiler.histograms['fetch'].count, 3)
+        self.assertEqual(profiler.missed_intervals, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
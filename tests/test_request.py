@@ -0,0 +1,103 @@
+"""Test the checks of the values of the request attributes.
+
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from CAM2DistributedBackend.util.request import Request
+
+
+class RequestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read_request(self, **attributes):
+        request = {
+            'cameras': [],
+            'interval': 1,
+            'duration': 10,
+            'snapshots_to_keep': 1,
+            'is_video': False,
+            'analysis_class': 'MyAnalyzer',
+            'timestamp': 0,
+        }
+        request.update(attributes)
+        file_name = os.path.join(self.directory, 'request.json')
+        with open(file_name, 'w') as f:
+            json.dump(request, f)
+        return Request(file_name)
+
+    def test_defaults(self):
+        request = self.read_request()
+        self.assertEqual(request.duplicate_frames, 'flag')
+        self.assertEqual(request.overrun_policy, 'skip')
+        self.assertEqual(request.upload_overflow, 'block')
+        self.assertEqual(request.cameras_per_task, 1)
+        self.assertEqual(request.batch_size, 1)
+        self.assertEqual(request.pipeline_depth, 0)
+
+    def test_duplicate_frames(self):
+        self.assertEqual(
+            self.read_request(duplicate_frames='skip').duplicate_frames,
+            'skip')
+        for value in ['drop', 1, None]:
+            self.assertRaises(ValueError, self.read_request,
+                              duplicate_frames=value)
+
+    def test_overrun_policy(self):
+        for value in ['skip', 'catch_up', 'adapt']:
+            self.assertEqual(
+                self.read_request(overrun_policy=value).overrun_policy, value)
+        for value in ['drop', 1, None]:
+            self.assertRaises(ValueError, self.read_request,
+                              overrun_policy=value)
+
+    def test_upload_overflow(self):
+        for value in ['block', 'drop', 'inline']:
+            self.assertEqual(
+                self.read_request(upload_overflow=value).upload_overflow,
+                value)
+        for value in ['skip', 1, None]:
+            self.assertRaises(ValueError, self.read_request,
+                              upload_overflow=value)
+
+    def test_counts(self):
+        request = self.read_request(cameras_per_task=4, batch_size=8,
+                                    pipeline_depth=2)
+        self.assertEqual(request.cameras_per_task, 4)
+        self.assertEqual(request.batch_size, 8)
+        self.assertEqual(request.pipeline_depth, 2)
+        for attributes in [{'cameras_per_task': 0},
+                           {'cameras_per_task': -1},
+                           {'cameras_per_task': 1.5},
+                           {'cameras_per_task': None},
+                           {'batch_size': 0}, {'batch_size': '8'},
+                           {'batch_size': True}, {'pipeline_depth': -1},
+                           {'pipeline_depth': 2.0}]:
+            self.assertRaises(ValueError, self.read_request, **attributes)
+
+    def test_image_settings(self):
+        request = self.read_request(image_format='webp', jpeg_quality=0,
+                                    png_compression=9, webp_quality=101,
+                                    image_scale=0.5)
+        self.assertEqual(request.image_format, 'webp')
+        self.assertEqual(request.image_scale, 0.5)
+        for attributes in [{'image_format': 'gif'},
+                           {'jpeg_quality': 101}, {'jpeg_quality': '90'},
+                           {'jpeg_quality': 90.5}, {'png_compression': 10},
+                           {'png_compression': True}, {'webp_quality': 0},
+                           {'image_scale': 0}, {'image_scale': 1.5},
+                           {'image_scale': '0.5'}]:
+            self.assertRaises(ValueError, self.read_request, **attributes)
+
+
+if __name__ == '__main__':
+    unittest.main()
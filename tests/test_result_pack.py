@@ -0,0 +1,134 @@
+"""Test the writing and the reading of the result containers.
+
+"""
+
+import time
+import unittest
+
+from CAM2DistributedBackend.util.result_pack import FormatError, \
+    ResultPackReader, ResultPackWriter, list_packs
+from CAM2DistributedBackend.util.storage_backend import MemoryBackend
+
+
+class FailingBackend(MemoryBackend):
+
+    # A backend whose next writes append half of their data, then fail.
+
+    failures = 0
+
+    def write(self, path, data, overwrite=False, append=False):
+        if self.failures:
+            self.failures -= 1
+            MemoryBackend.write(self, path, data[:len(data) // 2],
+                                overwrite, append)
+            raise IOError('Write failed')
+        MemoryBackend.write(self, path, data, overwrite, append)
+
+
+class ResultPackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FailingBackend('/test_result_pack/' + self.id())
+
+    def tearDown(self):
+        for path in list(MemoryBackend.files):
+            if path.startswith(self.client.root):
+                del MemoryBackend.files[path]
+
+    def read_all(self):
+        results = []
+        for file_name in list_packs(self.client):
+            reader = ResultPackReader(self.client, file_name)
+            results.extend((reader.index[i][0], reader.read_entry(i))
+                           for i in range(len(reader)))
+        return results
+
+    def test_round_trip(self):
+        writer = ResultPackWriter(self.client, 1 << 20)
+        writer.write('a.txt', 'first', 1.0)
+        writer.write(u'b.txt', 'second', 2.0)
+        writer.write('a.txt', 'third', 3.0)
+        writer.close()
+
+        self.assertEqual(list_packs(self.client), ['results-00000.pack'])
+        reader = ResultPackReader(self.client, 'results-00000.pack')
+        self.assertTrue(reader.is_closed)
+        self.assertEqual(len(reader), 3)
+        self.assertEqual(reader.read('a.txt'), 'third')
+        self.assertEqual(reader.read('b.txt'), 'second')
+        self.assertEqual([entry[1] for entry in reader.index],
+                         [1.0, 2.0, 3.0])
+        self.assertIn('created', reader.metadata)
+        self.assertRaises(KeyError, reader.read, 'c.txt')
+
+    def test_rollover(self):
+        writer = ResultPackWriter(self.client, 100)
+        for i in range(5):
+            writer.write('{}.txt'.format(i), 'x' * 60)
+        writer.close()
+        self.assertEqual(writer.containers, 5)
+        self.assertEqual(len(list_packs(self.client)), 5)
+        self.assertEqual(self.read_all(),
+                         [('{}.txt'.format(i), 'x' * 60) for i in range(5)])
+
+    def test_max_age(self):
+        writer = ResultPackWriter(self.client, 1 << 20, max_age=0.05)
+        writer.write('a.txt', 'data')
+        time.sleep(0.3)
+        reader = ResultPackReader(self.client, 'results-00000.pack')
+        self.assertTrue(reader.is_closed)
+        self.assertEqual(reader.read('a.txt'), 'data')
+        writer.close()
+        self.assertEqual(writer.containers, 1)
+
+    def test_unclosed_container(self):
+        writer = ResultPackWriter(self.client, 1 << 20)
+        writer.write('a.txt', 'first')
+        writer.write('b.txt', 'second')
+        writer._flush()
+
+        reader = ResultPackReader(self.client, 'results-00000.pack')
+        self.assertFalse(reader.is_closed)
+        self.assertEqual(reader.read('a.txt'), 'first')
+        self.assertEqual(reader.read('b.txt'), 'second')
+
+        # A record cut short is ignored.
+        path = self.client.root + '/results-00000.pack'
+        MemoryBackend.files[path] = MemoryBackend.files[path][:-3]
+        reader = ResultPackReader(self.client, 'results-00000.pack')
+        self.assertEqual(len(reader), 1)
+        self.assertEqual(reader.read('a.txt'), 'first')
+
+    def test_failed_flush(self):
+        writer = ResultPackWriter(self.client, 1 << 20)
+        writer.write('a.txt', 'first')
+        writer._flush()
+        writer.write('b.txt', 'second')
+        self.client.failures = 1
+        self.assertRaises(IOError, writer.close)
+
+        # The records of the failed chunk are kept in a new container, which
+        # the next close appends.
+        writer.close()
+        self.assertEqual(list_packs(self.client),
+                         ['results-00000.pack', 'results-00001.pack'])
+        self.assertFalse(
+            ResultPackReader(self.client, 'results-00000.pack').is_closed)
+        reader = ResultPackReader(self.client, 'results-00001.pack')
+        self.assertTrue(reader.is_closed)
+        self.assertEqual(reader.index[0][0], 'b.txt')
+        self.assertEqual(reader.read('b.txt'), 'second')
+        self.assertEqual(set(self.read_all()),
+                         set([('a.txt', 'first'), ('b.txt', 'second')]))
+
+    def test_invalid_container(self):
+        self.client.write('bad.pack', 'not a container')
+        self.assertRaises(FormatError, ResultPackReader, self.client,
+                          'bad.pack')
+        self.client.write('short.pack', 'CAM2')
+        self.assertRaises(FormatError, ResultPackReader, self.client,
+                          'short.pack')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+"""Test the choice of the storage backends and the syncing of local files.
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from CAM2DistributedBackend.util import storage_backend
+from CAM2DistributedBackend.util.storage_backend import create_backend
+
+
+class LocalBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.synced = []
+        self._sync = storage_backend._sync
+        storage_backend._sync = lambda paths: self.synced.extend(paths)
+
+    def tearDown(self):
+        storage_backend._sync = self._sync
+        shutil.rmtree(self.directory)
+
+    def create_backend(self, query=''):
+        return create_backend('file://{}{}'.format(self.directory, query),
+                              '/users/user/1')
+
+    def test_write_and_read(self):
+        backend = self.create_backend()
+        backend.write('5/a.txt', 'first')
+        backend.write('5/a.txt', 'second', append=True)
+        self.assertRaises(OSError, backend.write, '5/a.txt', 'third')
+        self.assertEqual(backend.read('5/a.txt'), 'firstsecond')
+        self.assertEqual(backend.read('5/a.txt', 5, 3), 'sec')
+        self.assertEqual(backend.size('5/a.txt'), 11)
+        self.assertEqual(backend.list('5'), ['a.txt'])
+
+    def test_sync_on_close(self):
+        backend = self.create_backend()
+        backend.write('5/a.txt', 'data')
+        self.assertEqual(self.synced, [])
+        backend.close()
+
+        # The new directories are synced with their parents.
+        root = os.path.join(self.directory, 'users', 'user', '1')
+        self.assertEqual(sorted(self.synced), sorted([
+            os.path.join(root, '5', 'a.txt'), os.path.join(root, '5'), root,
+            os.path.dirname(root), os.path.dirname(os.path.dirname(root)),
+            self.directory]))
+
+    def test_sync_every_writes(self):
+        backend = self.create_backend('?fsync=2')
+        backend.write('a.txt', 'data')
+        self.assertEqual(self.synced, [])
+        backend.write('b.txt', 'data')
+        self.assertIn(os.path.join(backend.root, 'b.txt'), self.synced)
+
+    def test_sync_after_interval(self):
+        backend = self.create_backend('?fsync_interval=0')
+        self.assertEqual(backend.fsync_interval, 0)
+        backend.write('a.txt', 'data')
+        self.assertIn(os.path.join(backend.root, 'a.txt'), self.synced)
+
+    def test_sync_many_files(self):
+        backend = self.create_backend()
+        for i in range(storage_backend._MAX_UNSYNCED_FILES):
+            backend.write('{}.txt'.format(i), 'data')
+        self.assertIn(os.path.join(backend.root, '0.txt'), self.synced)
+
+
+class CreateBackendTest(unittest.TestCase):
+
+    def test_hdfs_root(self):
+        backend = create_backend('hdfs://namenode:50070/cam2/', '/users/u/1')
+        self.assertEqual(backend._client.root, '/cam2/users/u/1')
+        self.assertEqual(backend._client.url, 'http://namenode:50070')
+        backend = create_backend('swebhdfs://namenode:50470', '/users/u/1')
+        self.assertEqual(backend._client.root, '/users/u/1')
+        self.assertEqual(backend._client.url, 'https://namenode:50470')
+
+    def test_unsupported(self):
+        self.assertRaises(ValueError, create_backend, 'ftp://host', '/')
+
+
+if __name__ == '__main__':
+    unittest.main()